@@ -1,8 +1,13 @@
 """Main application entry point."""
+import asyncio
 import threading
-import socket
 from master.handlers.udp_handler import UDPHandler
+from master.handlers.udp_server import serve
 from master.utils.ui_handler import UIHandler
+from master.utils import sql
+from master.utils.metrics import get_metrics
+from master.utils.tap_tracker import get_tap_tracker
+from master.utils.event_journal import get_journal
 from master.config.settings import UDP_PORT, BUFFER_SIZE, CMD_ON, CMD_OFF
 from prompt_toolkit import PromptSession
 from prompt_toolkit.patch_stdout import patch_stdout
@@ -25,6 +30,24 @@ def input_listener(udp_handler, session):
         elif cmd[0].lower() == "status":
             status = udp_handler.get_device_status()
             UIHandler.print_status_table(status["lights"], status["locks"])
+        elif cmd[0].lower() == "taps":
+            tracker = get_tap_tracker()
+            recent = tracker.recent(20) if len(cmd) > 1 and cmd[1].lower() == "recent" else None
+            UIHandler.print_tap_stats(tracker.stats(), recent)
+        elif cmd[0].lower() == "events":
+            n = int(cmd[1]) if len(cmd) > 1 and cmd[1].isdigit() else 20
+            device = cmd[2] if len(cmd) > 2 else None
+            UIHandler.print_events(get_journal().tail(n, device=device))
+        elif cmd[0].lower() == "metrics":
+            metrics = get_metrics()
+            if len(cmd) == 2 and cmd[1].lower() in ("on", "off"):
+                if cmd[1].lower() == "on":
+                    metrics.enable()
+                else:
+                    metrics.disable()
+                print(f"Metrics {'enabled' if metrics.enabled else 'disabled'}")
+            else:
+                UIHandler.print_metrics(metrics.to_dict())
         elif len(cmd) == 3 and cmd[0].lower() == "light":
             device_id = cmd[1]
             command = cmd[2].upper()
@@ -57,7 +80,9 @@ def main():
     import logging
     logging.basicConfig(filename='server.log', level=logging.INFO, format='%(asctime)s %(message)s')
     print("[INFO] Starting Sakan Munazam Master Server...")
+    sql.warm_up()  # MySQL connects in the background; the UDP listener does not wait for it
     udp_handler = UDPHandler(UDP_PORT, BUFFER_SIZE)
+    get_metrics().add_collector("journal", get_journal().stats)
     print(f"[INFO] Listening on UDP port {UDP_PORT}...")
     session = PromptSession()
     input_thread = threading.Thread(
@@ -67,29 +92,16 @@ def main():
     )
     input_thread.start()
     try:
-        import time
-        last_status = None
-        while udp_handler.running:
-            try:
-                udp_handler.sock.settimeout(0.2)
-                data, addr = udp_handler.sock.recvfrom(BUFFER_SIZE)
-                message = data.decode().strip()
-                # Log to file instead of printing
-                logging.info(f"[RECV] From {addr}: {message}")
-                udp_handler.handle_message(message, addr)  # Remove log_to_file argument
-            except socket.timeout:
-                pass
-            except OSError:
-                break
-            status = udp_handler.get_device_status()
-            if status != last_status:
-                UIHandler.print_status_table(status["lights"], status["locks"])
-                last_status = status
-            time.sleep(0.2)
+        asyncio.run(serve(
+            udp_handler,
+            on_status=lambda status: UIHandler.print_status_table(status["lights"], status["locks"])
+        ))
     except KeyboardInterrupt:
         print("\n[INFO] Shutting down...")
     finally:
         udp_handler.stop()
+        sql.log_writer.stop()  # flush log rows still queued
+        get_journal().close()
 
 if __name__ == "__main__":
     main()
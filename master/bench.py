@@ -0,0 +1,466 @@
+"""
+Benchmarks for the master's hot paths.
+
+  python -m master.bench                          run everything, store and compare
+  python -m master.bench -k parse -k access       only benchmarks whose name contains one of these
+  python -m master.bench --baseline 1cc368a --fail-on-regression
+
+Each run is appended to data/bench_history.jsonl (one JSON line per run, tagged
+with the git commit) and compared with the latest run from a different commit,
+or with --baseline. A benchmark whose median time per call grew by more than
+--threshold is reported as a regression.
+
+MySQL is replaced by an in-memory SQLite database behind a fake pool, so the
+access-decision path is measured without a server (mysql-connector must still
+be importable, as for the master itself). Files written on the hot path
+(the event journal, the reservation snapshot) go to a temporary directory.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+from datetime import datetime, timedelta
+
+from master.utils import sql
+from master.utils.message import parse_datagram, parse_text
+from master.utils.routing import get_registry
+from master.utils.reservation_snapshot import SNAPSHOT_PATH_ENV
+from master.utils import event_journal
+from master.utils.event_journal import EventJournal, JournalReader, message_event
+from master.handlers.udp_handler import UDPHandler
+from master.logic import LuxTrendLogic
+
+# Under the repository's gitignored data/ directory, next to the reservation snapshot
+DEFAULT_HISTORY = os.path.join(os.path.dirname(__file__), "..", "data", "bench_history.jsonl")
+
+BENCH_UID = "04:6F:87:12:7A:6A:80"
+LOCK_IP, LIGHT_IP = '192.168.137.250', '192.168.137.248'  # lock_207 / light_207 in the default device table
+
+
+# --- MySQL stand-in ---
+
+class _SQLiteCursor:
+    def __init__(self, db, lock, dictionary=False):
+        self._lock = lock
+        self._cursor = db.cursor()
+        self._dictionary = dictionary
+
+    def execute(self, query, params=()):
+        with self._lock:
+            self._cursor.execute(query.replace('%s', '?'), params)
+
+    def executemany(self, query, rows):
+        with self._lock:
+            self._cursor.executemany(query.replace('%s', '?'), rows)
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {d[0]: v for d, v in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        with self._lock:
+            return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        with self._lock:
+            return [self._row(r) for r in self._cursor.fetchall()]
+
+    def close(self):
+        pass
+
+
+class _SQLiteConnection:
+    def __init__(self, pool):
+        self._pool = pool
+
+    def cursor(self, buffered=False, dictionary=False):
+        return _SQLiteCursor(self._pool.db, self._pool.lock, dictionary)
+
+    def commit(self):
+        with self._pool.lock:
+            self._pool.db.commit()
+
+    def close(self):
+        pass
+
+
+class SQLitePool:
+    """Stands in for InstrumentedPool: same get_connection()/stats() surface, SQLite underneath."""
+
+    def __init__(self, reservations=2000, seed=1):
+        self.db = sqlite3.connect(":memory:", check_same_thread=False)
+        self.lock = threading.Lock()
+        self.db.executescript("""
+            CREATE TABLE slave (ip_address TEXT, room_id INTEGER);
+            CREATE TABLE room_reservations (
+                reservation_id INTEGER PRIMARY KEY, room_id INTEGER, user_id TEXT,
+                date TEXT, start_time TEXT, end_time TEXT
+            );
+            CREATE INDEX room_reservations_user ON room_reservations (user_id, room_id, date);
+        """)
+        self.db.executemany("INSERT INTO slave VALUES (?, ?)", [
+            ('192.168.137.250', 207), ('192.168.137.249', 208),
+            ('192.168.137.248', 207), ('192.168.137.247', 208),
+        ])
+        rng = random.Random(seed)
+        now = datetime.now()
+        rows = []
+        for _ in range(reservations):
+            day = now + timedelta(days=rng.randint(-3, 3))
+            start = rng.randint(0, 22 * 3600)
+            rows.append((rng.choice((207, 208)), ':'.join(f"{rng.randrange(256):02X}" for _ in range(7)),
+                         day.strftime('%Y-%m-%d'), _hms(start), _hms(start + 3600)))
+        # The tapped UID holds a reservation covering the whole run
+        rows.append((207, BENCH_UID, now.strftime('%Y-%m-%d'), '00:00:00', '23:59:59'))
+        self.db.executemany(
+            "INSERT INTO room_reservations (room_id, user_id, date, start_time, end_time) VALUES (?, ?, ?, ?, ?)", rows)
+        self.db.commit()
+
+    def get_connection(self, timeout=None):
+        return _SQLiteConnection(self)
+
+    def stats(self):
+        return {}
+
+
+def _hms(seconds):
+    seconds = min(seconds, 86399)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+# --- Benchmarks ---
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    """Register func(env) -> callable; the callable is what gets timed."""
+    BENCHMARKS.append(func)
+    return func
+
+
+class BenchEnv:
+    def __init__(self, workdir):
+        self.workdir = workdir
+        self.handler = UDPHandler(port=0)  # ephemeral port: replies go nowhere, like an unreachable slave
+        self.lock_addr = (LOCK_IP, 4210)
+        self.light_addr = (LIGHT_IP, 4210)
+        self.history_dir = os.path.join(workdir, "history")
+        self.history_start, self.history_end = self._write_history(100000)
+
+    def _write_history(self, events):
+        """A journal of `events` received datagrams (9 light telemetry to 1 tap), over 1 MB segments."""
+        rng = random.Random(2)
+        journal = EventJournal(self.history_dir, max_segment_bytes=1024 * 1024, keep_segments=1000)
+        start = time.time() - events * 0.01
+        for i in range(events):
+            if i % 10 == 0:
+                lock, addr = ("lock_208", ('192.168.137.249', 4210)) if i % 1000 == 0 else ("lock_207", self.lock_addr)
+                uid = ':'.join(f"{rng.randrange(256):02X}" for _ in range(7))
+                msg = parse_text(f"{lock}:{uid}", addr)
+            else:
+                msg = parse_text(f"light_207:ON:{rng.uniform(0, 100):.1f}:512:480", self.light_addr)
+            journal.append(**message_event(msg, ts=start + i * 0.01))
+        journal.close()
+        return start, start + events * 0.01
+
+
+@benchmark
+def parse_datagram_light(env):
+    data = b"light_207:ON:45.3:512:480"
+    return lambda: parse_datagram(data, env.light_addr)
+
+
+@benchmark
+def parse_datagram_lock(env):
+    data = f"lock_207:{BENCH_UID}".encode()
+    return lambda: parse_datagram(data, env.lock_addr)
+
+
+@benchmark
+def handle_message_light(env):
+    return lambda: env.handler.handle_message("light_207:ON:45.3:512:480", env.light_addr)
+
+
+@benchmark
+def handle_message_lock_tap(env):
+    """Tap with UID and access decisions cached (the common repeated-tap case)."""
+    env.handler.handle_message(f"lock_207:{BENCH_UID}", env.lock_addr)
+    return lambda: env.handler.handle_message(f"lock_207:{BENCH_UID}", env.lock_addr)
+
+
+@benchmark
+def handle_message_mixed_1000(env):
+    """Macro: 1000 datagrams, 9 light telemetry to 1 tap."""
+    messages = []
+    for i in range(1000):
+        if i % 10 == 0:
+            messages.append((f"lock_207:{BENCH_UID}", env.lock_addr))
+        else:
+            messages.append((f"light_207:ON:{i % 100}.5:{i % 1024}:{i % 700}", env.light_addr))
+    handle = env.handler.handle_message
+    def run():
+        for message, addr in messages:
+            handle(message, addr)
+    return run
+
+
+@benchmark
+def device_status_cached(env):
+    env.handler.handle_message("light_207:ON:45.3:512:480", env.light_addr)
+    manager = env.handler.device_manager
+    manager.get_device_status()
+    return manager.get_device_status
+
+
+@benchmark
+def device_status_after_update(env):
+    manager = env.handler.device_manager
+    device = manager.register_or_update_device("light_207", "light", env.light_addr)
+    counter = iter(range(10 ** 9))
+    def run():
+        device.update_light_data(float(next(counter) % 100), 512, 480)
+        manager.commit(device)
+        return manager.get_device_status()
+    return run
+
+
+@benchmark
+def journal_append(env):
+    journal = event_journal.get_journal()
+    msg = parse_text("light_207:ON:45.3:512:480", env.light_addr)
+    return lambda: journal.append(**message_event(msg))
+
+
+@benchmark
+def journal_tail_50_100k_events(env):
+    reader = JournalReader(env.history_dir)
+    return lambda: reader.tail(50, type="recv")
+
+
+@benchmark
+def journal_tail_rare_device(env):
+    """Last 5 taps of a lock that sends 1 in 1000 events."""
+    reader = JournalReader(env.history_dir)
+    return lambda: reader.tail(5, device="lock_208")
+
+
+@benchmark
+def journal_seek_by_time_1s(env):
+    reader = JournalReader(env.history_dir)
+    middle = (env.history_start + env.history_end) / 2
+    return lambda: list(reader.read(since=middle, until=middle + 1.0))
+
+
+@benchmark
+def journal_latest_uids(env):
+    journal = event_journal.get_journal()
+    journal.append(**message_event(parse_text(f"lock_207:{BENCH_UID}", env.lock_addr)))
+    return journal.latest_uids
+
+
+@benchmark
+def journal_recover_latest_100k_events(env):
+    """Cold start: latest event per device from the segment summaries."""
+    reader = JournalReader(env.history_dir)
+    return reader.latest
+
+
+@benchmark
+def parse_incoming_log(env):
+    line = "2025-06-05 14:50:30,359 [RECV] From ('192.168.137.247', 4210): light_208:OFF:0.5:0:162"
+    return lambda: sql.parse_incoming_log(line)
+
+
+@benchmark
+def parse_outgoing_log(env):
+    line = "[2025-06-13 09:40:46] Sent PWM:128 to light_208 at 192.168.137.247:4210"
+    return lambda: sql.parse_outgoing_log(line)
+
+
+@benchmark
+def lux_update_from_text(env):
+    logic = LuxTrendLogic()
+    return lambda: logic.update_lux_from_msg("light_207:ON:45.3:512:480", lambda: None)
+
+
+@benchmark
+def lux_update_from_message(env):
+    logic = LuxTrendLogic()
+    msg = parse_text("light_207:ON:45.3:512:480", env.light_addr)
+    return lambda: logic.update_from_message(msg, lambda: None)
+
+
+@benchmark
+def lux_draw_trend(env):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    logic = LuxTrendLogic()
+    for i in range(200):
+        logic.add_sample('light_207', 40 + i % 10, 512, 480)
+        logic.add_sample('light_208', 60 + i % 7, 512, 480)
+    figure = Figure(figsize=(5, 3))
+    canvas = FigureCanvasAgg(figure)
+    ax = figure.add_subplot(111)
+    return lambda: logic.draw_lux_trend(ax, canvas)
+
+
+@benchmark
+def access_cache_hit(env):
+    sql.is_access_allowed(BENCH_UID, LOCK_IP)
+    return lambda: sql.is_access_allowed(BENCH_UID, LOCK_IP)
+
+
+@benchmark
+def access_index(env):
+    """Decision from the in-memory reservation index (access cache cleared each call)."""
+    sql.reservation_index.refresh()
+    def run():
+        sql.access_cache.clear()
+        return sql.is_access_allowed(BENCH_UID, LOCK_IP)
+    return run
+
+
+@benchmark
+def access_db_fallback(env):
+    """Decision from the database query path (index treated as stale, access cache cleared each call)."""
+    index = sql.reservation_index
+    def run():
+        staleness, index.max_staleness = index.max_staleness, -1.0
+        try:
+            sql.access_cache.clear()
+            return sql.is_access_allowed(BENCH_UID, LOCK_IP)
+        finally:
+            index.max_staleness = staleness
+    return run
+
+
+@benchmark
+def reservation_index_full_reload(env):
+    index = sql.reservation_index
+    def run():
+        index.invalidate()
+        index.refresh()
+    return run
+
+
+# --- Runner ---
+
+def measure(func, min_time=0.2, repeat=5):
+    """Seconds per call: (best, median) over repeat runs of an auto-sized loop."""
+    timer = timeit.Timer(func)
+    loops, _ = timer.autorange()
+    loops = max(1, int(loops * min_time / 0.2))
+    times = sorted(t / loops for t in timer.repeat(repeat=repeat, number=loops))
+    return times[0], times[len(times) // 2], loops
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__), check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, cwd=os.path.dirname(__file__)).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except Exception:
+        return "unknown"
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_baseline(history, commit, baseline=None):
+    for run in reversed(history):
+        if baseline is not None:
+            if run["commit"].startswith(baseline):
+                return run
+        elif run["commit"] != commit:
+            return run
+    return None
+
+
+def setup_environment(workdir):
+    """Point the data layer at SQLite, and the snapshot and event journal at workdir."""
+    sql.engine.pool = SQLitePool()
+    os.environ[SNAPSHOT_PATH_ENV] = os.path.join(workdir, "reservation_snapshot.db")  # before anything opens it
+    sql.reservation_index.refresh_interval = 3600.0  # the benchmarks refresh the index themselves
+    sql.ACCESS_DB_BUDGET = 5.0                       # measure the query, not the snapshot fallback
+    event_journal.JOURNAL_DIR = os.path.join(workdir, "journal")
+    get_registry()  # load the device table before timing anything
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the master's hot paths.")
+    parser.add_argument('-k', dest='patterns', action='append', default=[], help="run benchmarks whose name contains this")
+    parser.add_argument('--history', default=DEFAULT_HISTORY)
+    parser.add_argument('--baseline', help="commit to compare with (default: latest run from another commit)")
+    parser.add_argument('--threshold', type=float, default=0.2, help="slowdown counted as a regression (0.2 = 20%%)")
+    parser.add_argument('--min-time', type=float, default=0.2, help="seconds per timing run")
+    parser.add_argument('--no-save', action='store_true')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    selected = [b for b in BENCHMARKS if not args.patterns or any(p in b.__name__ for p in args.patterns)]
+    commit = git_commit()
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        setup_environment(workdir)
+        env = BenchEnv(workdir)
+        for bench in selected:
+            try:
+                best, median, loops = measure(bench(env), min_time=args.min_time)
+            except Exception as e:
+                print(f"[BENCH] {bench.__name__} failed: {e}")
+                continue
+            results[bench.__name__] = {"best_us": best * 1e6, "median_us": median * 1e6, "loops": loops}
+        env.handler.sock.close()
+        event_journal.get_journal().close()
+
+    history = load_history(args.history)
+    base = find_baseline(history, commit, args.baseline)
+    base_results = base["results"] if base else {}
+    print(f"{'benchmark':<34} {'median':>12} {'best':>12}  {'vs ' + base['commit'] if base else 'no baseline':>18}")
+    regressions = []
+    for name, r in results.items():
+        change = ""
+        if name in base_results:
+            ratio = r["median_us"] / base_results[name]["median_us"] - 1.0
+            change = f"{ratio:+.1%}"
+            if ratio > args.threshold:
+                regressions.append(name)
+                change += " REGRESSION"
+        print(f"{name:<34} {r['median_us']:>10.2f}us {r['best_us']:>10.2f}us  {change:>18}")
+
+    if not args.no_save:
+        directory = os.path.dirname(args.history)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps({
+                "commit": commit,
+                "date": datetime.now().isoformat(timespec='seconds'),
+                "python": platform.python_version(),
+                "machine": platform.node(),
+                "results": results,
+            }) + "\n")
+    if regressions:
+        print(f"[BENCH] {len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,7 @@ from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
 class HMIWidgets:
-    def __init__(self, master, devices, send_command_cb, broadcast_cb, check_user_access_cb, show_user_ids_cb, set_pwm_cb=None, set_max_lux_cb=None):
+    def __init__(self, master, devices, send_command_cb, broadcast_cb, check_user_access_cb, show_user_ids_cb, set_pwm_cb=None, set_max_lux_cb=None, show_tap_latency_cb=None):
         self.master = master
         self.devices = devices
         self.send_command_cb = send_command_cb
@@ -13,6 +13,7 @@ class HMIWidgets:
         self.show_user_ids_cb = show_user_ids_cb
         self.set_pwm_cb = set_pwm_cb
         self.set_max_lux_cb = set_max_lux_cb
+        self.show_tap_latency_cb = show_tap_latency_cb
         self.widgets = {}
 
     def build_layout(self):
@@ -156,6 +157,8 @@ class HMIWidgets:
         tk.Button(db_frame, text='Check Access', command=lambda: self.check_user_access_cb(user_id_entry.get(), ip_entry.get())).pack(side='left', padx=4)
         self.widgets['user_id_entry'] = user_id_entry
         self.widgets['ip_entry'] = ip_entry
+        if self.show_tap_latency_cb:
+            tk.Button(db_frame, text='Door Latency', command=self.show_tap_latency_cb).pack(side='left', padx=4)
 
         # Add closest 3 reservations section
         reservation_frame = tk.LabelFrame(self.master, text="Next 3 Reservations", font=("Arial", 10, "bold"), padx=8, pady=8)
@@ -174,6 +177,12 @@ class HMIWidgets:
         from utils import sql
         from utils.get_nim_helper import get_nim_for_reservations
         listbox.delete(0, 'end')
+        if not sql.engine.is_ready():
+            # Do not block the GUI on the connect; poll until the background warm-up is done
+            sql.warm_up()
+            listbox.insert('end', 'Connecting to database...')
+            self.master.after(1000, lambda: self._update_reservation_listbox(listbox))
+            return self.widgets
         reservations = sql.get_next_3_reservations()
         # Fetch NIMs for these reservations
         reservations = get_nim_for_reservations(reservations)
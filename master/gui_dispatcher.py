@@ -0,0 +1,195 @@
+import collections
+import threading
+import time
+from utils.metrics import get_metrics
+
+metrics = get_metrics()
+
+
+class LogView:
+    """
+    Buffered, size-capped view over a read-only ScrolledText.
+
+    append() only buffers the line (safe from any thread); flush() writes
+    everything buffered with a single insert on the Tk thread and trims the
+    widget to the last max_lines lines.
+    """
+
+    def __init__(self, widget, max_lines=500):
+        self.widget = widget
+        self.max_lines = max_lines
+        self._pending = collections.deque(maxlen=max_lines)  # older lines would be trimmed anyway
+        self.lines = 0
+
+    def append(self, line):
+        self._pending.append(line)
+
+    def clear(self):
+        self._pending.clear()
+        self.widget.config(state='normal')
+        self.widget.delete('1.0', 'end')
+        self.widget.config(state='disabled')
+        self.lines = 0
+
+    def flush(self):
+        if not self._pending:
+            return
+        lines = []
+        while self._pending:
+            lines.append(self._pending.popleft())
+        self.widget.config(state='normal')
+        self.widget.insert('end', '\n'.join(lines) + '\n')
+        self.lines += len(lines)
+        if self.lines > self.max_lines:
+            self.widget.delete('1.0', f'{self.lines - self.max_lines + 1}.0')
+            self.lines = self.max_lines
+        self.widget.see('end')
+        self.widget.config(state='disabled')
+
+
+class GuiDispatcher:
+    """
+    Frame-budgeted work queue for the Tk main loop.
+
+    post() may be called from any thread. Each tick runs pumps (functions that
+    pull from external queues, given half the budget), then posted callbacks in
+    order until budget_ms of work has been done, then the end-of-tick hooks
+    (e.g. LogView.flush).
+
+    Work posted with a key is coalesced: a newer post replaces the queued
+    callback in place, so only the latest one runs and the queue never holds
+    more than one entry per key (e.g. the telemetry of one device). Other work
+    changes state (lock taps, UNLOCKED echoes) and is never dropped, except
+    posts marked droppable (display only), which are refused while
+    max_pending entries are queued. Log lines are shed by LogView instead.
+    Leftover work is picked up on the next tick, which is scheduled right
+    away instead of after interval_ms.
+    """
+
+    def __init__(self, root, budget_ms=15, interval_ms=50, report_interval=5.0, lag_warning_ms=250, max_pending=5000):
+        self.root = root
+        self.budget = budget_ms / 1000.0
+        self.interval_ms = interval_ms
+        self.report_interval = report_interval
+        self.lag_warning = lag_warning_ms / 1000.0
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._queue = collections.deque()   # [posted_at, key, func, args, kwargs]
+        self._keyed = {}                    # key -> its queued entry
+        self._pumps = []
+        self._end_hooks = []
+        self._running = False
+        self._next_report = 0.0
+        # Metrics
+        self.ticks = 0
+        self.processed = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.failed = 0
+        self.over_budget = 0
+        self.lag_avg = 0.0
+        self.lag_max = 0.0
+        self.last_tick_ms = 0.0
+
+    def post(self, func, *args, key=None, droppable=False, **kwargs):
+        """
+        Queue func(*args, **kwargs) for the Tk thread; a newer post with the same
+        key replaces it. Returns False if a droppable post was refused.
+        """
+        with self._lock:
+            if key is not None:
+                entry = self._keyed.get(key)
+                if entry is not None:
+                    entry[2:] = func, args, kwargs  # keeps its place (and posted_at, so lag stays honest)
+                    self.coalesced += 1
+                    return True
+            if droppable and len(self._queue) >= self.max_pending:
+                self.dropped += 1
+                metrics.inc("gui_dropped_total")
+                return False
+            entry = [time.monotonic(), key, func, args, kwargs]
+            if key is not None:
+                self._keyed[key] = entry
+            self._queue.append(entry)
+        return True
+
+    def add_pump(self, pump):
+        """
+        pump(deadline) runs at the start of every tick; it should stop pulling
+        work at deadline and return True if work is still waiting.
+        """
+        self._pumps.append(pump)
+
+    def add_end_hook(self, hook):
+        self._end_hooks.append(hook)
+
+    def depth(self):
+        return len(self._queue)
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            self.root.after(self.interval_ms, self._tick)
+
+    def stop(self):
+        self._running = False
+
+    def _tick(self):
+        if not self._running:
+            return
+        start = time.monotonic()
+        deadline = start + self.budget
+        backlog = False
+        for pump in self._pumps:
+            backlog = self._call(pump, start + self.budget / 2) or backlog
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._queue:
+                    break
+                posted_at, key, func, args, kwargs = self._queue.popleft()
+                if key is not None:
+                    del self._keyed[key]
+            lag = time.monotonic() - posted_at
+            metrics.observe("gui_dispatch_lag_seconds", lag)
+            self.lag_avg += (lag - self.lag_avg) / 16
+            self.lag_max = max(self.lag_max, lag)
+            self._call(func, *args, **kwargs)
+            self.processed += 1
+        for hook in self._end_hooks:
+            self._call(hook)
+        now = time.monotonic()
+        self.ticks += 1
+        self.last_tick_ms = 1000 * (now - start)
+        metrics.observe("gui_tick_seconds", now - start)
+        if now - start > self.budget:
+            self.over_budget += 1
+        self._report(now)
+        # Backlog left: yield to Tk for redraws/input, then continue at once
+        self.root.after(1 if backlog or self._queue else self.interval_ms, self._tick)
+
+    def _call(self, func, *args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            self.failed += 1
+            print(f"[GUI] Dispatch of {getattr(func, '__name__', func)!r} failed: {e}")
+
+    def _report(self, now):
+        if now < self._next_report or self.lag_avg < self.lag_warning:
+            return
+        self._next_report = now + self.report_interval
+        print(f"[GUI] Backlog {len(self._queue)} items, lag avg {1000 * self.lag_avg:.0f} ms / max {1000 * self.lag_max:.0f} ms")
+
+    def stats(self):
+        return {
+            "depth": len(self._queue),
+            "ticks": self.ticks,
+            "processed": self.processed,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "over_budget": self.over_budget,
+            "lag_avg_ms": 1000 * self.lag_avg,
+            "lag_max_ms": 1000 * self.lag_max,
+            "last_tick_ms": self.last_tick_ms,
+        }
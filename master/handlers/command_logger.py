@@ -1,13 +1,11 @@
-import logging
+"""Outgoing commands, recorded in the server's event journal."""
+from ..utils.event_journal import get_journal
 
-command_logger = logging.getLogger("command_logger")
-command_handler = logging.FileHandler("server_commands.log")
-command_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
-command_logger.addHandler(command_handler)
-command_logger.setLevel(logging.INFO)
 
-def log_command(device_id, command, addr=None):
+def log_command(device_id, command, addr=None, tap_id=None):
+    fields = {"command": command}
     if addr:
-        command_logger.info(f"[SEND] To {device_id} at {addr}: {command}")
-    else:
-        command_logger.info(f"[SEND] To {device_id}: {command}")
+        fields["ip"], fields["port"] = addr[0], addr[1]
+    if tap_id:
+        fields["tap_id"] = tap_id
+    get_journal().append("send", device_id, **fields)
@@ -1,10 +1,27 @@
 """Device manager for handling device registry and operations."""
+import threading
 from ..models.device import Device
 from ..config.settings import DEVICE_TYPE_LIGHT, DEVICE_TYPE_LOCK
+from ..utils.event_journal import get_journal
 
 class DeviceManager:
+    """
+    Device registry with a generation counter.
+
+    `generation` is bumped only when a device is added or one of its values
+    changes (see Device.version). Subscribers are called with the new
+    generation on each such change, and get_device_status() rebuilds its
+    snapshot only when the generation moved.
+    """
+
     def __init__(self):
         self.devices = {}
+        self.generation = 0
+        self._seen_versions = {}  # device_id -> Device.version last published
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._status = None
+        self._status_generation = -1
 
     def register_or_update_device(self, device_id, device_type, addr):
         """Register a new device or update existing one."""
@@ -18,32 +35,64 @@ class DeviceManager:
         """Get a device by ID."""
         return self.devices.get(device_id)
 
+    def commit(self, device):
+        """Publish a device's changes, if any, after a message was handled. Returns True if it changed."""
+        with self._lock:
+            if self._seen_versions.get(device.device_id) == device.version:
+                return False
+            self._seen_versions[device.device_id] = device.version
+            self.generation += 1
+            generation = self.generation
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(generation)
+            except Exception as e:
+                print(f"[DEVICE] Subscriber error: {e}")
+        return True
+
+    def subscribe(self, callback):
+        """Call callback(generation) on every change. Returns an unsubscribe function."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
     def get_device_status(self):
         """Get status of all devices, including latest UID for locks from log."""
-        from master.utils.ui_handler import get_latest_lock_uids_from_log
+        if self._status_generation == self.generation:
+            return self._status
+        generation = self.generation
         lights = []
         locks = []
-        # Get latest UIDs from log
-        latest_uids = get_latest_lock_uids_from_log("c:/Users/Legion/Desktop/sakan-munazam/server.log")
-        for device_id, device in self.devices.items():
+        # Latest UIDs seen this session are on the device; the event journal covers earlier runs
+        latest_uids = get_journal().latest_uids()
+        for device_id, device in list(self.devices.items()):
+            d = device.to_dict()  # cached on the device until its version changes
             if device.device_type == DEVICE_TYPE_LIGHT:
                 lights.append((
                     device_id,
                     device.state,
-                    device.to_dict()["current_lux"],
-                    device.to_dict()["pwm_value"],
-                    device.to_dict()["raw_ldr"],  # Add raw LDR value
-                    device.to_dict()["last_update"]
+                    d["current_lux"],
+                    d["pwm_value"],
+                    d["raw_ldr"],  # Add raw LDR value
+                    d["last_update"]
                 ))
             else:
                 # Add latest_uid to lock status tuple
                 locks.append({
                     "Device ID": device_id,
                     "State": device.state,
-                    "Updated": device.to_dict()["last_update"],
-                    "latest_uid": latest_uids.get(device_id, "?")
+                    "Updated": d["last_update"],
+                    "latest_uid": device.latest_uid or latest_uids.get(device_id, "?")
                 })
-        return {
+        self._status = {
             "lights": sorted(lights),
             "locks": sorted(locks, key=lambda x: x["Device ID"])
         }
+        self._status_generation = generation
+        return self._status
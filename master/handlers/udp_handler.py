@@ -3,15 +3,13 @@ import socket
 from ..config.settings import UDP_PORT, BUFFER_SIZE, DEVICE_TYPE_LIGHT, CMD_UNLOCK, CMD_LOCK
 from ..handlers.device_manager import DeviceManager
 from ..utils.sql import is_access_allowed, is_user_id_valid
+from ..utils.routing import get_registry
+from ..utils.message import parse_text, KIND_LIGHT, KIND_LOCK
+from ..utils.metrics import get_metrics
+from ..utils.tap_tracker import get_tap_tracker
 from .command_logger import log_command
 
-# Daftar IP slave yang diizinkan
-ALLOWED_SLAVE_IPS = [
-    "192.168.137.248",  # light_207
-    "192.168.137.247",  # light_208
-    "192.168.137.250",  # lock_207
-    "192.168.137.249",  # lock_208
-]
+metrics = get_metrics()
 
 class UDPHandler:
     def __init__(self, port=UDP_PORT, buffer_size=BUFFER_SIZE):
@@ -20,76 +18,76 @@ class UDPHandler:
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.bind(("", self.port))
         self.device_manager = DeviceManager()
+        self.routing = get_registry()
+        self.taps = get_tap_tracker()
         self.running = True
+        self.on_stop = None  # set by the asyncio server, which then owns the socket
 
-    def handle_light_message(self, device, parts):
+    def handle_light_message(self, device, msg):
         """Handle messages from light devices."""
-        state = parts[1]
-        device.update_state(state)
-        if len(parts) >= 5:
-            try:
-                lux = float(parts[2])
-                pwm = int(parts[3])
-                raw_ldr = int(parts[4])
-                device.update_light_data(lux, pwm, raw_ldr)
-            except ValueError:
-                pass
-        elif len(parts) >= 4:
-            try:
-                lux = float(parts[2])
-                pwm = int(parts[3])
-                device.update_light_data(lux, pwm)
-            except ValueError:
-                pass
+        device.update_state(msg.state)
+        if msg.lux is not None and msg.pwm is not None:
+            device.update_light_data(msg.lux, msg.pwm, msg.ldr)
 
-    def handle_lock_message(self, device, uid, addr):
+    def handle_lock_message(self, device, uid, addr, received_at=None):
         """Handle messages from lock devices."""
         uid = uid.strip()
         uid_without_colons = uid.replace(":", "")
         if len(uid_without_colons) == 14:  # 7 bytes of hex (14 characters)
+            tap = self.taps.begin(device.device_id, uid, received_at)
+            device.set_latest_uid(uid)
             ip_address = addr[0]
             # Use UID with colons for DB check
-            if not is_user_id_valid(uid):
+            with metrics.span("access_check", path="server"):
+                valid = is_user_id_valid(uid)
+                self.taps.mark(tap, "validated")
+                allowed = valid and is_access_allowed(uid, ip_address)
+                self.taps.decided(tap, allowed)
+            if allowed:
+                response = CMD_UNLOCK
+                device.update_state("UNLOCKED")
+            else:
                 response = CMD_LOCK
                 device.update_state("LOCKED")
-            else:
-                if is_access_allowed(uid, ip_address):
-                    response = CMD_UNLOCK
-                    device.update_state("UNLOCKED")
-                else:
-                    response = CMD_LOCK
-                    device.update_state("LOCKED")
-            self.sock.sendto(response.encode(), addr)
-            log_command(device.device_id, response, addr)
+            with metrics.span("send", kind="lock"):
+                self.sock.sendto(response.encode(), addr)
+            self.taps.sent(tap)
+            metrics.inc("commands_sent_total", command=response)
+            log_command(device.device_id, response, addr, tap_id=tap.tap_id)
         else:
             pass
 
     def handle_message(self, message, addr):
-        """Handle incoming UDP messages."""
-        # Filter: hanya terima dari IP slave yang diizinkan
-        if addr[0] not in ALLOWED_SLAVE_IPS:
+        """Handle an incoming UDP message given as text."""
+        msg = parse_text(message, addr)
+        if msg is not None:
+            self.handle_parsed(msg)
+
+    def handle_parsed(self, msg):
+        """Handle a SlaveMessage parsed once from the datagram."""
+        # Filter: hanya terima dari IP slave yang diizinkan (devices in config.json)
+        if not self.routing.is_allowed_ip(msg.ip):
             # Bisa log jika ingin: print(f"[WARNING] Paket UDP dari IP tidak dikenal: {addr[0]}")
             return  # Abaikan paket
-        parts = message.split(":")
-        
-        if len(parts) >= 2:
-            device_id = parts[0]
-            device_type = DEVICE_TYPE_LIGHT if "light" in device_id else "lock"
-            device = self.device_manager.register_or_update_device(device_id, device_type, addr)
-            
-            if device_type == DEVICE_TYPE_LIGHT:
-                self.handle_light_message(device, parts)
-            else:
-                # For lock devices, join all remaining parts as the UID
-                uid = ":".join(parts[1:])
-                self.handle_lock_message(device, uid, addr)
+        if msg.kind not in (KIND_LIGHT, KIND_LOCK):
+            return
+        device = self.device_manager.register_or_update_device(msg.device_id, msg.kind, msg.addr)
+        if msg.kind == KIND_LIGHT:
+            self.handle_light_message(device, msg)
+        elif msg.uid is not None:
+            self.handle_lock_message(device, msg.uid, msg.addr, msg.received_at)
+        elif msg.state is not None:
+            self.taps.confirm(msg.device_id, msg.state, msg.received_at)  # lock_X:UNLOCKED echo closes the tap
+        self.device_manager.commit(device)
 
     def control_light(self, device_id, command):
         """Send control command to a light device."""
         device = self.device_manager.get_device(device_id)
         if device and device.device_type == DEVICE_TYPE_LIGHT:
             packet = f"{device_id}:{command}"
-            self.sock.sendto(packet.encode(), device.addr)
+            with metrics.span("send", kind="light"):
+                self.sock.sendto(packet.encode(), device.addr)
+            metrics.inc("commands_sent_total", command=command.split(":", 1)[0])
             log_command(device_id, command, device.addr)
             print(f"[LIGHT] Sent {packet} to {device_id}")
             return True
@@ -102,4 +100,7 @@ class UDPHandler:
     def stop(self):
         """Stop the UDP server."""
         self.running = False
-        self.sock.close()
+        if self.on_stop:
+            self.on_stop()
+        else:
+            self.sock.close()
@@ -0,0 +1,122 @@
+"""Asyncio UDP ingest server built around UDPHandler.handle_message."""
+import asyncio
+import logging
+from ..utils.message import parse_datagram, KIND_LIGHT, KIND_LOCK
+from ..utils.event_journal import get_journal, message_event
+from ..utils.metrics import get_metrics
+
+metrics = get_metrics()
+
+# Messages waiting per slave; beyond this stale telemetry is replaced and lock messages are dropped
+DEVICE_QUEUE_SIZE = 256
+
+
+class UDPServerProtocol(asyncio.DatagramProtocol):
+    """
+    Drain every datagram as soon as it arrives and hand it to a per-slave worker.
+
+    Only configured slave addresses get a worker (so the number of queues and
+    tasks is bounded by the device table), and each queue holds at most
+    DEVICE_QUEUE_SIZE messages.
+    """
+
+    def __init__(self, udp_handler, on_message=None):
+        self.udp_handler = udp_handler
+        self.on_message = on_message  # optional function(SlaveMessage), called after handling
+        self.journal = get_journal()
+        self.transport = None
+        self._queues = {}   # slave ip -> asyncio.Queue
+        self._workers = {}  # slave ip -> asyncio.Task
+        self.dropped = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        metrics.inc("udp_received_total", component="server")
+        with metrics.span("parse", component="server"):
+            msg = parse_datagram(data, addr)
+        if msg is None:
+            metrics.inc("udp_unparsed_total", component="server")
+            self.journal.append("recv", None, ip=addr[0], port=addr[1], raw=data.decode(errors='replace').strip())
+            return
+        self.journal.append(**message_event(msg))
+        if msg.kind not in (KIND_LIGHT, KIND_LOCK):
+            return
+        if not self.udp_handler.routing.is_allowed_ip(msg.ip):
+            self._drop("unknown_ip")
+            return
+        queue = self._queues.get(msg.ip)
+        if queue is None:
+            queue = self._queues[msg.ip] = asyncio.Queue(maxsize=DEVICE_QUEUE_SIZE)
+            self._workers[msg.ip] = asyncio.ensure_future(self._device_worker(queue))
+        if queue.full():
+            if msg.kind != KIND_LIGHT:
+                self._drop("queue_full")
+                return
+            queue.get_nowait()  # telemetry is a state sample: the newest one replaces the oldest
+            self._drop("coalesced")
+        queue.put_nowait(msg)
+
+    def _drop(self, reason):
+        self.dropped += 1
+        metrics.inc("udp_dropped_total", reason=reason)
+
+    def error_received(self, exc):
+        logging.warning(f"[UDP] Receive error: {exc}")
+
+    async def _device_worker(self, queue):
+        """Handle one device's messages in order; lock handling may block on the DB so it runs off-loop."""
+        loop = asyncio.get_running_loop()
+        while True:
+            msg = await queue.get()
+            try:
+                with metrics.span("handle", kind=msg.kind):
+                    await loop.run_in_executor(None, self.udp_handler.handle_parsed, msg)
+                if self.on_message:
+                    self.on_message(msg)
+            except Exception as e:
+                logging.error(f"[UDP] Error handling {msg.raw!r} from {msg.addr}: {e}")
+
+    def close(self):
+        for task in self._workers.values():
+            task.cancel()
+        if self.transport:
+            self.transport.close()
+
+
+async def _status_task(udp_handler, on_status, interval):
+    """Redraw status when the device manager reports a change, at most once per interval."""
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    # commit() runs on executor threads; every change since the last redraw sets the same event
+    unsubscribe = udp_handler.device_manager.subscribe(lambda generation: loop.call_soon_threadsafe(changed.set))
+    try:
+        on_status(udp_handler.get_device_status())
+        while udp_handler.running:
+            await changed.wait()
+            changed.clear()
+            on_status(udp_handler.get_device_status())
+            await asyncio.sleep(interval)
+    finally:
+        unsubscribe()
+
+
+async def serve(udp_handler, on_status, status_interval=0.5):
+    """Run the UDP ingest server on udp_handler's socket until udp_handler.stop() is called."""
+    loop = asyncio.get_running_loop()
+    stopped = asyncio.Event()
+    udp_handler.sock.setblocking(False)
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: UDPServerProtocol(udp_handler),
+        sock=udp_handler.sock
+    )
+    # stop() may be called from the input thread; the transport owns the socket now
+    udp_handler.on_stop = lambda: loop.call_soon_threadsafe(stopped.set)
+    status = asyncio.ensure_future(_status_task(udp_handler, on_status, status_interval))
+    try:
+        await stopped.wait()
+    finally:
+        status.cancel()
+        protocol.close()
+        udp_handler.on_stop = None
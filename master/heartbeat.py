@@ -0,0 +1,115 @@
+"""Heartbeat watcher for the slaves (UDP port 4220), shared by both HMIs."""
+import heapq
+import socket
+import threading
+import time
+
+
+class HeartbeatListener(threading.Thread):
+    """
+    Watches device heartbeats using a deadline heap instead of sweeping every device each loop.
+
+    alarm_callback(device_name, alarm_on) is only called on edges (alive -> lost, lost -> alive),
+    plus once per device at start. Heartbeats are one-way, so per-device timing is reported as the
+    inter-arrival interval and its jitter (RFC 3550 style smoothing) rather than a true RTT.
+    """
+    def __init__(self, device_names, alarm_callback, port=4220, timeout=1.0):
+        super().__init__(daemon=True)
+        self.device_names = list(device_names)
+        self.alarm_callback = alarm_callback  # function(device_name, alarm_on: bool)
+        self.port = port
+        self.timeout = timeout
+        now = time.monotonic()
+        self.last_heartbeat = {dev: now for dev in self.device_names}
+        self.alive = {dev: True for dev in self.device_names}
+        self.stats = {dev: {'count': 0, 'interval': None, 'jitter': 0.0} for dev in self.device_names}
+        self._deadlines = [(now + timeout, dev) for dev in self.device_names]
+        heapq.heapify(self._deadlines)
+        self.running = True
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("", self.port))
+
+    def run(self):
+        for dev in self.device_names:
+            self.alarm_callback(dev, False)
+        while self.running:
+            self._expire_deadlines()
+            # Sleep in recvfrom until the next deadline at most
+            wait = self._deadlines[0][0] - time.monotonic() if self._deadlines else 1.0
+            try:
+                self.sock.settimeout(min(max(wait, 0.01), 1.0))
+                data, addr = self.sock.recvfrom(128)
+                msg = data.decode(errors='replace').strip()
+                # Expecting: device_id:HEARTBEAT
+                if msg.endswith(":HEARTBEAT"):
+                    self._on_heartbeat(msg.split(":")[0])
+            except socket.timeout:
+                continue
+            except Exception:
+                continue
+
+    def _on_heartbeat(self, dev):
+        if dev not in self.last_heartbeat:
+            return
+        now = time.monotonic()
+        st = self.stats[dev]
+        if st['count']:
+            interval = now - self.last_heartbeat[dev]
+            if st['interval'] is None:
+                st['interval'] = interval
+            else:
+                st['jitter'] += (abs(interval - st['interval']) - st['jitter']) / 16
+                st['interval'] += (interval - st['interval']) / 16
+        st['count'] += 1
+        self.last_heartbeat[dev] = now
+        heapq.heappush(self._deadlines, (now + self.timeout, dev))
+        if not self.alive[dev]:
+            self.alive[dev] = True
+            self.alarm_callback(dev, False)
+
+    def _expire_deadlines(self):
+        now = time.monotonic()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, dev = heapq.heappop(self._deadlines)
+            # Stale entry if a newer heartbeat pushed a later deadline
+            if now - self.last_heartbeat[dev] >= self.timeout and self.alive[dev]:
+                self.alive[dev] = False
+                self.alarm_callback(dev, True)
+
+    def get_stats(self):
+        """Per-device heartbeat state: alive flag, seconds since last beat, mean interval and jitter."""
+        now = time.monotonic()
+        return {
+            dev: {
+                'alive': self.alive[dev],
+                'age': now - self.last_heartbeat[dev],
+                'count': st['count'],
+                'interval': st['interval'],
+                'jitter': st['jitter'],
+            }
+            for dev, st in self.stats.items()
+        }
+
+    def flat_stats(self):
+        """get_stats() flattened to {<device>_<field>: number}, for metrics.add_collector."""
+        flat = {}
+        for dev, st in self.get_stats().items():
+            flat[f"{dev}_alive"] = st['alive']
+            flat[f"{dev}_age_seconds"] = st['age']
+            flat[f"{dev}_count"] = st['count']
+            if st['interval'] is not None:
+                flat[f"{dev}_interval_seconds"] = st['interval']
+                flat[f"{dev}_jitter_seconds"] = st['jitter']
+        return flat
+
+    def summary_lines(self):
+        """One line per device, for text displays."""
+        lines = []
+        for dev, st in self.get_stats().items():
+            timing = "-" if st['interval'] is None else f"every {st['interval'] * 1000:.0f} ms, jitter {st['jitter'] * 1000:.1f} ms"
+            lines.append(f"{dev}: {'alive' if st['alive'] else 'LOST'}, last beat {st['age']:.1f} s ago, {st['count']} beats, {timing}")
+        return lines
+
+    def stop(self):
+        self.running = False
+        self.sock.close()
@@ -1,62 +1,133 @@
-from filterpy.kalman import KalmanFilter
+import time
 import numpy as np
 
+# Ring buffer columns
+COL_T, COL_SEQ, COL_LUX, COL_PWM, COL_LDR = range(5)
+
+DEVICE_COLORS = {'light_207': 'red', 'light_208': 'blue'}
+
+
+class ScalarKalman:
+    """Closed-form 1-D Kalman filter (random-walk model, F = H = 1)."""
+    __slots__ = ('x', 'p', 'q', 'r')
+
+    def __init__(self, x=0.0, p=10.0, q=0.01, r=1.0):
+        self.x = x  # state estimate
+        self.p = p  # estimate covariance
+        self.q = q  # process noise
+        self.r = r  # measurement noise
+
+    def update(self, z):
+        p = self.p + self.q
+        k = p / (p + self.r)
+        self.x += k * (z - self.x)
+        self.p = (1.0 - k) * p
+        return self.x
+
+
+class TelemetryRing:
+    """
+    Preallocated per-device ring buffer of (timestamp, sample no., lux, pwm, raw LDR).
+
+    Each row is written twice, at i and i + capacity, so the most recent
+    `capacity` rows are always one contiguous slice: append is O(1) and
+    view() returns a zero-copy NumPy view in chronological order.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buf = np.full((2 * capacity, 5), np.nan)
+        self._head = 0   # next write position in [0, capacity)
+        self.count = 0
+
+    def append(self, t, seq, lux, pwm, ldr):
+        row = (t, seq, lux, pwm, ldr)
+        self._buf[self._head] = row
+        self._buf[self._head + self.capacity] = row
+        self._head = (self._head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def view(self):
+        """Rows oldest to newest, without copying."""
+        end = self._head + self.capacity if self.count == self.capacity else self._head
+        return self._buf[end - self.count:end]
+
+
 class LuxTrendLogic:
-    def __init__(self, max_lux_points=75, max_lux_limit=115):
-        self.lux_data = []
-        self.max_lux_points = max_lux_points
+    def __init__(self, max_lux_points=75, max_lux_limit=115, history_size=36000):
+        self.max_lux_points = max_lux_points  # samples shown on the trend chart
         self.max_lux_limit = max_lux_limit
-        # Kalman filter for each device
-        self.kalman_filters = {
-            'light_207': self._create_kalman_filter(),
-            'light_208': self._create_kalman_filter()
-        }
-
-    def _create_kalman_filter(self):
-        kf = KalmanFilter(dim_x=1, dim_z=1)
-        kf.x = np.array([[0.]])  # initial state
-        kf.F = np.array([[1.]])   # state transition matrix
-        kf.H = np.array([[1.]])   # measurement function
-        kf.P *= 10.               # covariance matrix
-        kf.R = 1.                 # measurement noise
-        kf.Q = 0.01               # process noise
-        return kf
+        self.history_size = history_size      # samples kept per device (~50 h at 5 s/sample)
+        self.buffers = {}                     # device -> TelemetryRing
+        self.kalman_filters = {}              # device -> ScalarKalman
+        self._seq = 0                         # global sample counter (x axis)
+
+    def _device_state(self, dev):
+        if dev not in self.buffers:
+            self.buffers[dev] = TelemetryRing(self.history_size)
+            self.kalman_filters[dev] = ScalarKalman()
+        return self.buffers[dev], self.kalman_filters[dev]
+
+    def add_sample(self, dev, lux, pwm=np.nan, ldr=np.nan, t=None):
+        """Filter a lux reading and append it to the device's ring buffer. Returns the filtered lux."""
+        ring, kf = self._device_state(dev)
+        lux = kf.update(lux)
+        ring.append(time.time() if t is None else t, self._seq, lux, pwm, ldr)
+        self._seq += 1
+        return lux
 
     def update_lux_from_msg(self, msg, draw_callback):
         try:
-            color = 'blue'  # default
-            dev = None
-            if 'light_207' in msg:
-                color = 'red'
-                dev = 'light_207'
-            elif 'light_208' in msg:
-                color = 'blue'
-                dev = 'light_208'
-            if 'light_' in msg:
-                parts = msg.split(':')
-                for part in parts:
-                    part = part.strip()
-                    if '.' in part:
-                        try:
-                            lux = float(part)
-                            if dev in self.kalman_filters:
-                                kf = self.kalman_filters[dev]
-                                kf.predict()
-                                kf.update(lux)
-                                lux = float(kf.x[0])
-                            self.lux_data.append((lux, color, dev))
-                            if len(self.lux_data) > self.max_lux_points:
-                                self.lux_data = self.lux_data[-self.max_lux_points:]
-                            draw_callback()
-                            break
-                        except ValueError:
-                            continue
+            if 'light_' not in msg:
+                return
+            # Format: device:STATE:LUX:PWM:LDR
+            parts = [p.strip() for p in msg.split(':')]
+            dev = next((p for p in parts if p.startswith('light_')), None)
+            if dev is None:
+                return
+            for i, part in enumerate(parts):
+                if '.' not in part:
+                    continue
+                try:
+                    lux = float(part)
+                except ValueError:
+                    continue
+                pwm = self._to_float(parts, i + 1)
+                ldr = self._to_float(parts, i + 2)
+                self.add_sample(dev, lux, pwm, ldr)
+                draw_callback()
+                break
         except Exception:
             pass
 
+    def update_from_message(self, msg, draw_callback):
+        """Add a sample from a parsed SlaveMessage (see utils.message)."""
+        if msg.kind != 'light' or msg.lux is None:
+            return
+        self.add_sample(
+            msg.device_id, msg.lux,
+            np.nan if msg.pwm is None else msg.pwm,
+            np.nan if msg.ldr is None else msg.ldr
+        )
+        draw_callback()
+
+    @staticmethod
+    def _to_float(parts, i):
+        try:
+            return float(parts[i])
+        except (IndexError, ValueError):
+            return np.nan
+
+    def recent(self, dev):
+        """Zero-copy view of the device's samples within the last max_lux_points samples overall."""
+        rows = self.buffers[dev].view()
+        first = np.searchsorted(rows[:, COL_SEQ], self._seq - self.max_lux_points)
+        return rows[first:]
+
     def draw_lux_trend(self, ax, canvas):
         ax.clear()
-        if not self.lux_data:
+        if self._seq == 0:
             ax.set_ylim(0, self.max_lux_limit)
             ax.set_yticks([i for i in range(0, self.max_lux_limit + 1, 5)])
             ax.set_ylabel('Lux')
@@ -64,14 +135,11 @@ class LuxTrendLogic:
             ax.grid(True, linestyle='--', alpha=0.5)
             canvas.draw()
             return
-        data_207 = [(i, lux) for i, (lux, color, dev) in enumerate([(v[0], v[1], v[2] if len(v) > 2 else None) for v in self.lux_data]) if dev == 'light_207']
-        data_208 = [(i, lux) for i, (lux, color, dev) in enumerate([(v[0], v[1], v[2] if len(v) > 2 else None) for v in self.lux_data]) if dev == 'light_208']
-        if data_207:
-            x_207, y_207 = zip(*data_207)
-            ax.plot(x_207, y_207, color='red', label='light_207')
-        if data_208:
-            x_208, y_208 = zip(*data_208)
-            ax.plot(x_208, y_208, color='blue', label='light_208')
+        x0 = max(0, self._seq - self.max_lux_points)
+        for dev in sorted(self.buffers):
+            rows = self.recent(dev)
+            if len(rows):
+                ax.plot(rows[:, COL_SEQ] - x0, rows[:, COL_LUX], color=DEVICE_COLORS.get(dev), label=dev)
         ax.set_ylim(0, self.max_lux_limit)
         ax.set_yticks([i for i in range(0, self.max_lux_limit + 1, 5)])
         ax.set_ylabel('Lux')
@@ -88,3 +156,91 @@ class LuxTrendLogic:
     def get_max_lux_limit(self):
         """Get the current maximum lux limit"""
         return self.max_lux_limit
+
+
+class LuxTrendRenderer:
+    """
+    Frame-budgeted lux trend renderer.
+
+    request() only marks the chart dirty; at most max_fps frames per second are
+    drawn via the Tk `after` scheduler. Axes, ticks, grid and legend are drawn
+    once into a cached background, and each frame restores that background,
+    updates persistent Line2D artists with set_data and blits the axes area.
+    """
+
+    def __init__(self, logic, ax, canvas, schedule, max_fps=4):
+        self.logic = logic
+        self.ax = ax
+        self.canvas = canvas
+        self.schedule = schedule          # Tk widget .after(ms, func)
+        self.frame_interval = 1.0 / max_fps
+        self.lines = {}                   # device -> Line2D (animated, excluded from full draws)
+        self._background = None
+        self._layout_dirty = True
+        self._pending = False
+        self._last_frame = 0.0
+        self.frames = 0
+        canvas.mpl_connect('draw_event', self._on_draw)
+
+    def request(self):
+        """Ask for a redraw; repeated requests within one frame coalesce."""
+        if self._pending:
+            return
+        self._pending = True
+        delay = max(0.0, self._last_frame + self.frame_interval - time.monotonic())
+        self.schedule(int(delay * 1000), self._render)
+
+    def invalidate(self):
+        """Force a full redraw (axes limits, legend) on the next frame."""
+        self._layout_dirty = True
+        self.request()
+
+    def _render(self):
+        self._pending = False
+        self._last_frame = time.monotonic()
+        self.frames += 1
+        for dev in self.logic.buffers:
+            if dev not in self.lines:
+                line, = self.ax.plot([], [], color=DEVICE_COLORS.get(dev), label=dev, animated=True)
+                self.lines[dev] = line
+                self._layout_dirty = True
+        self._update_lines()
+        if self._layout_dirty or self._background is None:
+            self._draw_layout()  # triggers _on_draw, which captures the background and blits
+        else:
+            self._blit()
+
+    def _update_lines(self):
+        x0 = max(0, self.logic._seq - self.logic.max_lux_points)
+        for dev, line in self.lines.items():
+            rows = self.logic.recent(dev)
+            line.set_data(rows[:, COL_SEQ] - x0, rows[:, COL_LUX])
+
+    def _draw_layout(self):
+        ax = self.ax
+        limit = self.logic.max_lux_limit
+        ax.set_xlim(0, self.logic.max_lux_points)
+        ax.set_ylim(0, limit)
+        ax.set_yticks([i for i in range(0, limit + 1, 5)])
+        ax.set_ylabel('Lux')
+        ax.set_xlabel('Sample')
+        ax.grid(True, linestyle='--', alpha=0.5)
+        if self.lines:
+            ax.legend(handles=list(self.lines.values()), loc='upper right', fontsize=8)
+        ax.figure.tight_layout()
+        self._layout_dirty = False
+        self.canvas.draw()
+
+    def _on_draw(self, event):
+        # Any full draw (ours or a window resize) invalidates the cached background
+        self._background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self._draw_lines()
+
+    def _blit(self):
+        self.canvas.restore_region(self._background)
+        self._draw_lines()
+        self.canvas.blit(self.ax.bbox)
+
+    def _draw_lines(self):
+        for line in self.lines.values():
+            self.ax.draw_artist(line)
@@ -12,95 +12,84 @@ from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import sys
 import queue
+from utils import routing
 
 # --- Load config from file ---
-def load_config(config_path='../config.json'):
-    default_config = {
-        "devices": {
-            'lock_207': {'ip': '192.168.137.250', 'port': 4210, 'type': 'lock'},
-            'lock_208': {'ip': '192.168.137.249', 'port': 4210, 'type': 'lock'},
-            'light_207': {'ip': '192.168.137.248', 'port': 4210, 'type': 'light'},
-            'light_208': {'ip': '192.168.137.247', 'port': 4210, 'type': 'light'},
-        },
-        "opcua_endpoint": "opc.tcp://DESKTOP-97F20FJ:49320"
-    }
-    try:
-        if not os.path.isabs(config_path):
-            config_path = os.path.join(os.path.dirname(__file__), config_path)
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-        # Merge defaults for missing keys
-        for k, v in default_config.items():
-            if k not in config:
-                config[k] = v
-        return config
-    except Exception as e:
-        print(f"[CONFIG] Failed to load config file: {e}. Using defaults.")
-        return default_config
+def load_config():
+    """config.json (or the file MASTER_CONFIG names), with the OPC UA endpoint defaulted."""
+    config = routing.load_config()
+    config.setdefault("opcua_endpoint", "opc.tcp://DESKTOP-97F20FJ:49320")
+    return config
 
 # --- Load configuration at module level ---
 CONFIG = load_config()
 
 sys.path.append(os.path.join(os.path.dirname(__file__), 'utils'))
 from utils import sql
+from utils.routing import get_registry
+from utils.message import SlaveMessage, parse_text, parse_logged_line, KIND_LIGHT, KIND_LOCK
+from utils.metrics import get_metrics
+from utils.tap_tracker import get_tap_tracker
+from utils.event_journal import get_journal, get_reader, message_event
 from network import MasterNetworkHandler
 from gui import HMIWidgets
-from logic import LuxTrendLogic
+from logic import LuxTrendLogic, LuxTrendRenderer
+from gui_dispatcher import GuiDispatcher, LogView
+from heartbeat import HeartbeatListener
 from alarm_placeholder import create_alarm_placeholder  # Import the alarm placeholder module
 from reservation_manager import ReservationManager
 
 # Device info (now from config)
 DEVICES = CONFIG["devices"]
 OPCUA_ENDPOINT = CONFIG["opcua_endpoint"]
-
-class HeartbeatListener(threading.Thread):
-    def __init__(self, device_names, alarm_callback, port=4220, timeout=1.0):
-        super().__init__(daemon=True)
-        self.device_names = device_names
-        self.alarm_callback = alarm_callback  # function(device_name, alarm_on: bool)
-        self.port = port
-        self.timeout = timeout
-        self.last_heartbeat = {dev: time.time() for dev in device_names}
-        self.running = True
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.bind(("", self.port))
-        self.sock.settimeout(0.2)
-
-    def run(self):
-        while self.running:
-            now = time.time()
-            # Check for lost heartbeat
-            for dev, last in self.last_heartbeat.items():
-                if now - last > self.timeout:
-                    self.alarm_callback(dev, True)
-                else:
-                    self.alarm_callback(dev, False)
-            # Listen for heartbeats
-            try:
-                data, addr = self.sock.recvfrom(128)
-                msg = data.decode(errors='replace').strip()
-                # Expecting: device_id:HEARTBEAT
-                if msg.endswith(":HEARTBEAT"):
-                    dev = msg.split(":")[0]
-                    if dev in self.last_heartbeat:
-                        self.last_heartbeat[dev] = time.time()
-            except socket.timeout:
-                continue
-            except Exception:
-                continue
-
-    def stop(self):
-        self.running = False
-        self.sock.close()
+# Coalescing window for OPC writes: changes within this window go out in one WriteRequest
+OPC_COALESCE_WINDOW = CONFIG.get("opc_coalesce_ms", 50) / 1000.0
+# Seconds between reconnect attempts while the OPC UA server is unreachable
+OPC_RECONNECT_INTERVAL = 5.0
+# Tk work per tick before yielding to redraws/input, and lines kept in each log widget
+GUI_FRAME_BUDGET_MS = CONFIG.get("gui_frame_budget_ms", 15)
+LOG_MAX_LINES = CONFIG.get("log_max_lines", 500)
+# Incoming messages pulled from the network queue per tick (the rest wait for the next tick)
+MAX_INCOMING_PER_TICK = 500
+# Local metrics endpoint (http://127.0.0.1:<port>/metrics); metrics stay disabled when unset
+METRICS_PORT = CONFIG.get("metrics_port")
+
+metrics = get_metrics()
+
+# HMI state key -> KEPServer tag
+OPC_TAG_MAP = {
+    'led_lock_207': "ns=2;s=ROOM 207.Device1.led_lock_207",
+    'led_lock_208': "ns=2;s=ROOM 207.Device1.led_lock_208",
+    'led_light_207': "ns=2;s=ROOM 207.Device1.led_light_207",
+    'led_light_208': "ns=2;s=ROOM 207.Device1.led_light_208",
+    'alarm_lock_207': "ns=2;s=ROOM 207.Device1.alarm_lock_207",
+    'alarm_lock_208': "ns=2;s=ROOM 207.Device1.alarm_lock_208",
+    'alarm_light_207': "ns=2;s=ROOM 207.Device1.alarm_light_207",
+    'alarm_light_208': "ns=2;s=ROOM 207.Device1.alarm_light_208",
+    'maintenance_207': "ns=2;s=ROOM 207.Device1.maintenance_207",
+    'maintenance_208': "ns=2;s=ROOM 207.Device1.maintenance_208",
+    # Add OPC tags for lux values
+    'lux_light_207': "ns=2;s=ROOM 207.Device1.lux_light_207",
+    'lux_light_208': "ns=2;s=ROOM 207.Device1.lux_light_208",
+    'pwm_light_207': "ns=2;s=ROOM 207.Device1.pwm_light_207",
+    'pwm_light_208': "ns=2;s=ROOM 207.Device1.pwm_light_208",
+}
 
 class MasterHMI(tk.Tk):
     def __init__(self):
         super().__init__()
         self.title('Master HMI')
         self.geometry('800x600')
+        sql.warm_up()  # connect to MySQL in the background; UDP and heartbeat start without waiting
         self.lux_logic = LuxTrendLogic(max_lux_points=75)
         self._stop_event = threading.Event()
-        self.gui_queue = queue.Queue()  # Thread-safe queue for GUI updates
+        # Frame-budgeted dispatcher for all GUI updates (replaces the unbounded queue polling)
+        self.dispatcher = GuiDispatcher(self, budget_ms=GUI_FRAME_BUDGET_MS)
+        self.journal = get_journal("hmi")  # received datagrams, as typed events
+        metrics.add_collector("journal", self.journal.stats)
+        metrics.add_collector("gui", self.gui_stats)
+        if METRICS_PORT:
+            metrics.serve(int(METRICS_PORT))
         # Networking handler
         self.network = MasterNetworkHandler(
             devices=DEVICES,
@@ -118,15 +107,19 @@ class MasterHMI(tk.Tk):
             check_user_access_cb=self.check_user_access,
             show_user_ids_cb=self.show_user_ids,
             set_pwm_cb=self.set_pwm,
-            set_max_lux_cb=self.set_max_lux_limit
+            set_max_lux_cb=self.set_max_lux_limit,
+            show_tap_latency_cb=self.show_tap_latency
         ).build_layout()
         # Assign widget references
         self.log_area = self.widgets['log_area']
         self.incoming_log_area = self.widgets['incoming_log_area']
+        self.log_view = LogView(self.log_area, max_lines=LOG_MAX_LINES)
+        self.incoming_view = LogView(self.incoming_log_area, max_lines=LOG_MAX_LINES)
         self.lux_fig = self.widgets['lux_fig']
         self.lux_ax = self.widgets['lux_ax']
         self.lux_canvas = self.widgets['lux_canvas']
         self.lux_canvas_widget = self.widgets['lux_canvas_widget']
+        self.lux_renderer = LuxTrendRenderer(self.lux_logic, self.lux_ax, self.lux_canvas, self.after, max_fps=4)
         self.user_id_entry = self.widgets['user_id_entry']
         self.ip_entry = self.widgets['ip_entry']
 
@@ -199,18 +192,19 @@ class MasterHMI(tk.Tk):
             if lux_widget_key in self.widgets:
                 self.widgets[lux_widget_key].config(textvariable=self.lux_vars[dev])
 
-        self.after(100, self.process_incoming_queue)
-        self.after(100, self.process_gui_queue)  # Start polling the GUI queue
+        self.dispatcher.add_pump(self._pump_incoming)
+        self.dispatcher.add_end_hook(self.log_view.flush)
+        self.dispatcher.add_end_hook(self.incoming_view.flush)
+        self.dispatcher.start()
 
         # Start heartbeat listener
         self.heartbeat_listener = HeartbeatListener(DEVICES.keys(), self.heartbeat_alarm_callback)
         self.heartbeat_listener.start()
+        metrics.add_collector("heartbeat", self.heartbeat_listener.flat_stats)
 
-        # Map locks to their corresponding lights (update as needed)
-        self.lock_to_light = {
-            'lock_207': 'light_207',
-            'lock_208': 'light_208',
-        }
+        # Map locks to their corresponding lights (lock_X -> light_X, from config.json)
+        self.routing = get_registry()
+        self.lock_to_light = self.routing.lock_to_light()
         self.devices = DEVICES  # <-- Fix: make devices available as self.devices
         self.reservation_manager = ReservationManager(self.lock_to_light, DEVICES)
         # Track which lights are ON due to reservation
@@ -230,6 +224,10 @@ class MasterHMI(tk.Tk):
         self.opc_connected = False
         self._opc_state_lock = threading.Lock()
         self._opc_state_snapshot = {}
+        self._opc_dirty = threading.Event()  # set whenever the snapshot changes
+        self._opcua_thread_stop = threading.Event()
+        self._opc_nodes = {}     # key -> (node, variant type), resolved once per connection
+        self._opc_written = {}   # key -> last value written successfully
         self._opc_thread = threading.Thread(target=self._opc_relay_thread, daemon=True)
         self._opc_thread.start()
         self._init_opcua_client()
@@ -241,10 +239,13 @@ class MasterHMI(tk.Tk):
         config_btn.pack(pady=5, side='bottom')
 
     def _init_opcua_client(self):
+        """Connect (or reconnect) to the OPC UA server; a new connection starts with a full resync."""
         try:
             # Use OPCUA_ENDPOINT from config
             self.opc_client = Client(OPCUA_ENDPOINT)
             self.opc_client.connect()
+            self._opc_nodes = {}
+            self._opc_written = {}
             self.opc_connected = True
             print(f"[HMI] Connected to OPC UA server at {OPCUA_ENDPOINT}.")
         except Exception as e:
@@ -274,66 +275,101 @@ class MasterHMI(tk.Tk):
                 # dev: light_207, light_208
                 state[f'pwm_{dev}'] = int(self.pwm_vars[dev]) if str(self.pwm_vars[dev]).isdigit() else 0
         with self._opc_state_lock:
-            self._opc_state_snapshot = state.copy()
+            if state == self._opc_state_snapshot:
+                return
+            self._opc_state_snapshot = state
+        self._opc_dirty.set()
 
     def _opc_relay_thread(self):
-        while True:
+        """Write changed tags only, batching everything changed within the coalescing window."""
+        while not self._opcua_thread_stop.is_set():
+            if not self._opc_dirty.wait(timeout=1.0):
+                continue
+            time.sleep(OPC_COALESCE_WINDOW)  # let bursts of GUI updates coalesce
+            self._opc_dirty.clear()
+            if not self.opc_connected and not self._opc_reconnect():
+                self._opc_dirty.set()  # resync once the server is back
+                self._opcua_thread_stop.wait(OPC_RECONNECT_INTERVAL)
+                continue
             with self._opc_state_lock:
-                state = self._opc_state_snapshot.copy()
-            for key, value in state.items():
-                self._opc_write(key, value)
-            time.sleep(0.01)  # 10ms, adjust as needed
-
-    def _opc_write(self, key, value):
-        TAG_MAP = {
-            'led_lock_207': "ns=2;s=ROOM 207.Device1.led_lock_207",
-            'led_lock_208': "ns=2;s=ROOM 207.Device1.led_lock_208",
-            'led_light_207': "ns=2;s=ROOM 207.Device1.led_light_207",
-            'led_light_208': "ns=2;s=ROOM 207.Device1.led_light_208",
-            'alarm_lock_207': "ns=2;s=ROOM 207.Device1.alarm_lock_207",
-            'alarm_lock_208': "ns=2;s=ROOM 207.Device1.alarm_lock_208",
-            'alarm_light_207': "ns=2;s=ROOM 207.Device1.alarm_light_207",
-            'alarm_light_208': "ns=2;s=ROOM 207.Device1.alarm_light_208",
-            'maintenance_207': "ns=2;s=ROOM 207.Device1.maintenance_207",
-            'maintenance_208': "ns=2;s=ROOM 207.Device1.maintenance_208",
-            # Add OPC tags for lux values
-            'lux_light_207': "ns=2;s=ROOM 207.Device1.lux_light_207",
-            'lux_light_208': "ns=2;s=ROOM 207.Device1.lux_light_208",
-            'pwm_light_207': "ns=2;s=ROOM 207.Device1.pwm_light_207",
-            'pwm_light_208': "ns=2;s=ROOM 207.Device1.pwm_light_208",
-        }
-        if not self.opc_connected or key not in TAG_MAP:
-            return
+                state = self._opc_state_snapshot
+            changes = {k: v for k, v in state.items() if self._opc_written.get(k) != v}
+            if changes and not self._opc_write_many(changes):
+                self._opc_dirty.set()  # retry on the next tick
+                self._opcua_thread_stop.wait(1.0)
+
+    def _opc_reconnect(self):
+        """Drop the old client and connect again; _init_opcua_client clears _opc_written, so every tag is rewritten."""
+        if self.opc_client is not None:
+            try:
+                self.opc_client.disconnect()
+            except Exception:
+                pass
+        self._init_opcua_client()
+        return self.opc_connected
+
+    def _opc_resolve(self, key):
+        """Return the cached (node, variant type) for a state key, resolving it on first use."""
+        cached = self._opc_nodes.get(key)
+        if cached is None:
+            node = self.opc_client.get_node(OPC_TAG_MAP[key])
+            cached = self._opc_nodes[key] = (node, node.get_data_type_as_variant_type())
+        return cached
+
+    @staticmethod
+    def _opc_variant(key, value, varianttype):
+        # For lux, always send as float
+        if key.startswith('lux_'):
+            return ua.Variant(float(value), ua.VariantType.Float)
+        if varianttype == ua.VariantType.Boolean:
+            v = value
+        elif varianttype == ua.VariantType.Byte:
+            v = int(value) & 0xFF
+        else:
+            v = int(value)
+        return ua.Variant(v, varianttype)
+
+    def _opc_write_many(self, changes):
+        """Write all changed keys in a single WriteRequest. Returns False if any of them should be retried."""
+        if not self.opc_connected:
+            return False
         try:
-            node = self.opc_client.get_node(TAG_MAP[key])
-            varianttype = node.get_data_type_as_variant_type()
-            # For lux, always send as float
-            if key.startswith('lux_'):
-                v = float(value)
-                node.set_value(ua.DataValue(ua.Variant(v, ua.VariantType.Float)))
-                return
-            if varianttype == ua.VariantType.Boolean:
-                v = value
-            elif varianttype == ua.VariantType.Byte:
-                v = int(value) & 0xFF
-            elif varianttype == ua.VariantType.Int16:
-                v = int(value)
-            elif varianttype == ua.VariantType.UInt16:
-                v = int(value)
-            elif varianttype == ua.VariantType.Int32:
-                v = int(value)
-            elif varianttype == ua.VariantType.UInt32:
-                v = int(value)
-            else:
-                v = int(value)
-            node.set_value(ua.DataValue(ua.Variant(v, varianttype)))
+            params = ua.WriteParameters()
+            keys = []
+            for key, value in changes.items():
+                if key not in OPC_TAG_MAP:
+                    continue
+                node, varianttype = self._opc_resolve(key)
+                wv = ua.WriteValue()
+                wv.NodeId = node.nodeid
+                wv.AttributeId = ua.AttributeIds.Value
+                wv.Value = ua.DataValue(self._opc_variant(key, value, varianttype))
+                params.NodesToWrite.append(wv)
+                keys.append(key)
+            if not keys:
+                return True
+            with metrics.span("opc_write"):
+                results = self.opc_client.uaclient.write(params)
+            all_good = True
+            for key, status in zip(keys, results):
+                if status.is_good():
+                    self._opc_written[key] = changes[key]
+                    metrics.inc("opc_tags_written_total")
+                else:
+                    all_good = False  # not in _opc_written, so the retry rewrites it
+                    metrics.inc("opc_tag_failures_total")
+                    print(f"[HMI] Failed to write {key} to OPC: {status}")
+            return all_good
         except Exception as e:
+            metrics.inc("opc_write_failures_total")
             # Handle socket error and mark OPC as disconnected
             if hasattr(e, 'winerror') and e.winerror == 10038:
                 print(f"[HMI] OPC UA client socket error (disconnected): {e}")
                 self.opc_connected = False
             else:
-                print(f"[HMI] Failed to write {key} to OPC: {e}")
+                print(f"[HMI] Failed to write OPC batch: {e}")
+            self._opc_nodes = {}
+            return False
 
     def send_command(self, device_name, command):
         try:
@@ -345,121 +381,97 @@ class MasterHMI(tk.Tk):
         from datetime import datetime
         from utils import sql
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        self.log_area.config(state='normal')
-        self.log_area.insert('end', f"[{timestamp}] {msg}\n")
-        self.log_area.see('end')
-        self.log_area.config(state='disabled')
+        self.log_view.append(f"[{timestamp}] {msg}")  # also called from network threads; flushed on the Tk thread
         try:
             sql.insert_outgoing_log(f"[{timestamp}] {msg}")
         except Exception as e:
             print(f"[HMI] Failed to record outgoing log: {e}")
 
-    def log_incoming(self, msg_with_source): # Renamed to avoid confusion with internal msg variable
-        from utils import sql
-        self.incoming_log_area.config(state='normal')
-        self.incoming_log_area.insert('end', msg_with_source + '\n')
-        self.incoming_log_area.see('end')
-        self.incoming_log_area.config(state='disabled')
-        try:
-            sql.insert_incoming_log(msg_with_source)
-        except Exception as e:
-            print(f"[HMI] Failed to record incoming log: {e}")
+    def log_incoming(self, msg, record=True, replay=False):
+        """
+        Show and record an incoming message: a SlaveMessage from the network, or a plain log line.
 
-        original_msg_content = ""
-        source_ip = None
+        replay marks history being redisplayed (tail_server_log): it updates the
+        display only, with no access check and no commands sent.
+        """
+        from utils import sql
+        event = None
+        if isinstance(msg, SlaveMessage):
+            msg_with_source = f"From {msg.addr}: {msg.raw}"
+            if record:
+                event = self.journal.append(**message_event(msg))
+        else:
+            msg_with_source = msg
+            msg = parse_logged_line(msg_with_source)
+        self.incoming_view.append(msg_with_source)
+        if record:
+            try:
+                if event is not None:
+                    sql.insert_incoming_event(event)
+                else:
+                    sql.insert_incoming_log(msg_with_source)
+            except Exception as e:
+                print(f"[HMI] Failed to record incoming log: {e}")
+        if msg is None:
+            return
+        # Every sample goes into the trend; the widget updates are coalesced per device
+        self.lux_logic.update_from_message(msg, self.lux_renderer.request)
+        key = ('telemetry', msg.device_id) if msg.kind == KIND_LIGHT else None
+        self.dispatcher.post(self._apply_incoming, msg, replay, key=key)
 
+    def _apply_incoming(self, msg, replay=False):
         try:
-            # Parse "From ('IP', PORT): CONTENT"
-            if msg_with_source.startswith("From (") and "): " in msg_with_source:
-                parts = msg_with_source.split("): ", 1)
-                source_info = parts[0] # "From ('IP', PORT)"
-                original_msg_content = parts[1]
-
-                source_ip_str = source_info.split("('")[1].split("',")[0]
-                source_ip = source_ip_str # Store the IP of the sender
-            else:
-                original_msg_content = msg_with_source
-                # source_ip remains None if not in "From..." format
-
-            # --- One-Time Access Check ---
-            if source_ip and original_msg_content:
-                content_parts = original_msg_content.split(':', 1) # Split only on the first colon, e.g., "lock_208" and "04:47:43:12:7A:6A:80"
-                
-                if len(content_parts) == 2:
-                    device_name_from_msg = content_parts[0]
-                    potential_uid = content_parts[1]
-                    
-                    actual_device_name_for_ip = None
-                    for dev_key, dev_info in self.devices.items():
-                        if dev_info['ip'] == source_ip and dev_info['type'] == 'lock':
-                            actual_device_name_for_ip = dev_key
-                            break
-                    
-                    if actual_device_name_for_ip and device_name_from_msg == actual_device_name_for_ip:
-                        # Heuristic: UID has multiple colons (e.g., MAC address format) and is not a simple status.
-                        is_likely_uid = potential_uid.count(':') >= 5 and not any(status_keyword in potential_uid for status_keyword in ['ON', 'OFF', 'LOCKED', 'UNLOCKED', 'PWM'])
-
-                        if is_likely_uid:
-                            print(f"[HMI_DEBUG] Incoming UID for one-time access check: device='{actual_device_name_for_ip}', uid='{potential_uid}', source_ip='{source_ip}'")
-                            # Call reservation_manager's check_user_access directly.
-                            # The boolean return is not used here to show a messagebox for this automatic flow.
-                            self.reservation_manager.check_user_access(
-                                user_id=potential_uid,
-                                ip_address=source_ip, # IP of the lock device that sent the UID
-                                send_command=self.send_command
-                            )
-                            # Do not pass this specific UID message to _update_led_status if it was handled as one-time access.
-                            # Let further status changes (like UNLOCKED after command) be handled normally.
-                            # However, to prevent _update_led_status from misinterpreting it, we can return early or pass a modified message.
-                            # For now, let _update_led_status run; it should ignore this format.
-
+            # --- One-Time Access Check (live taps only) ---
+            if not replay and msg.ip and msg.kind == KIND_LOCK and msg.uid is not None:
+                actual_device_name_for_ip = self.routing.device_for_ip(msg.ip, 'lock')
+
+                if actual_device_name_for_ip and msg.device_id == actual_device_name_for_ip:
+                    # Heuristic: UID has multiple colons (e.g., MAC address format) and is not a simple status.
+                    is_likely_uid = msg.uid.count(':') >= 5 and not any(status_keyword in msg.uid for status_keyword in ['ON', 'OFF', 'LOCKED', 'UNLOCKED', 'PWM'])
+
+                    if is_likely_uid:
+                        print(f"[HMI_DEBUG] Incoming UID for one-time access check: device='{actual_device_name_for_ip}', uid='{msg.uid}', source_ip='{msg.ip}'")
+                        # Call reservation_manager's check_user_access directly.
+                        # The boolean return is not used here to show a messagebox for this automatic flow.
+                        self.reservation_manager.check_user_access(
+                            user_id=msg.uid,
+                            ip_address=msg.ip, # IP of the lock device that sent the UID
+                            send_command=self.send_command
+                        )
         except Exception as e:
-            print(f"[HMI_DEBUG] Error in log_incoming parsing for one-time access: {e}, Original message: {msg_with_source}")
+            print(f"[HMI_DEBUG] Error in one-time access check: {e}, Original message: {msg.raw!r} from {msg.addr}")
 
-        # --- Parse PWM value from light incoming log ---
-        try:
-            # Format: device:STATE:LUX:PWM:LDR
-            parts = original_msg_content.split(":")
-            if len(parts) >= 4:
-                dev = parts[0]
-                if dev in self.lux_vars:  # Only for light devices
-                    pwm_val = parts[3].strip()
-                    if not hasattr(self, 'pwm_vars'):
-                        self.pwm_vars = {}
-                    self.pwm_vars[dev] = pwm_val
-        except Exception as e:
-            print(f"[HMI_DEBUG] Error parsing PWM from incoming log: {e}")
+        # --- PWM value from light telemetry ---
+        if msg.kind == KIND_LIGHT and msg.device_id in self.lux_vars and msg.pwm is not None:
+            if not hasattr(self, 'pwm_vars'):
+                self.pwm_vars = {}
+            self.pwm_vars[msg.device_id] = str(msg.pwm)
 
-        # Determine message content for downstream handlers (_update_led_status, _update_lux_from_msg)
-        msg_for_downstream_handlers = original_msg_content if original_msg_content else msg_with_source
-        
-        self._update_led_status(msg_for_downstream_handlers)
-        self._update_lux_from_msg(msg_for_downstream_handlers)
+        self._update_led_status(msg, replay)
+        self._update_lux_from_msg(msg)
 
     def periodic_reservation_check(self):
         self.reservation_manager.check_reservation_expiry(self.send_command)
-        self.after(1000, self.periodic_reservation_check)
+        # Sleep until the next reservation end instead of polling every second
+        delay = self.reservation_manager.seconds_until_next_check()
+        self.after(int(delay * 1000), self.periodic_reservation_check)
 
-    def _update_led_status(self, msg):
-        # Expecting format: From (...): device_id:STATE:...
+    def _update_led_status(self, msg, replay=False):
+        # msg: SlaveMessage, e.g. light_207:ON:... or lock_207:UNLOCKED; a replayed UNLOCKED does not switch the light on
         try:
-            # Extract the actual message part after the last colon
-            if ":" in msg:
-                parts = msg.split(": ", 1)
-                if len(parts) == 2:
-                    msg = parts[1]
-            for dev in DEVICES:
+            dev = msg.device_id
+            if dev in self.led_indicators:
                 indicator = self.led_indicators[dev]
-                if msg.startswith(dev + ':ON') or msg.startswith(dev + ':UNLOCKED'):
+                if msg.state in ('ON', 'UNLOCKED'):
                     self.led_vars[dev].set('ON' if 'light' in dev else 'UNLOCKED')
                     indicator.config(bg='green')
-                    if dev in self.lock_to_light and msg.startswith(dev + ':UNLOCKED'):
+                    if dev in self.lock_to_light and msg.state == 'UNLOCKED' and not replay:
                         light_dev = self.lock_to_light[dev]
                         reserved, _ = self.reservation_manager.is_room_reserved_for_device(dev)
                         if reserved:
                             self.send_command(light_dev, 'ON')
                             self.reservation_manager.reserved_lights_on[light_dev] = True
-                elif msg.startswith(dev + ':OFF') or msg.startswith(dev + ':LOCKED'):
+                elif msg.state in ('OFF', 'LOCKED'):
                     self.led_vars[dev].set('OFF' if 'light' in dev else 'LOCKED')
                     indicator.config(bg='gray')
             self._update_opc_state_snapshot()
@@ -467,61 +479,60 @@ class MasterHMI(tk.Tk):
             print(f"LED status update error: {e}")
 
     def _update_lux_from_msg(self, msg):
-        # Update lux trend and also update LDR and Lux value boxes for each light
-        self.lux_logic.update_lux_from_msg(msg, lambda: self.lux_logic.draw_lux_trend(self.lux_ax, self.lux_canvas))
-        # Parse and update LDR and Lux values
-        for dev in self.ldr_vars:
-            if dev in msg:
-                # Expecting format: device:STATE:LUX:PWM:LDR
-                parts = msg.split(':')
-                if len(parts) >= 5:
-                    ldr_val = parts[4].strip()
-                    self.ldr_vars[dev].set(ldr_val)
-                if len(parts) >= 3:
-                    lux_val = parts[2].strip()
-                    if dev in self.lux_vars:
-                        self.lux_vars[dev].set(lux_val)
+        # Update LDR and Lux value boxes for each light (the trend sample is added in log_incoming)
+        dev = msg.device_id
+        if dev in self.ldr_vars and msg.ldr is not None:
+            self.ldr_vars[dev].set(str(msg.ldr))
+        if dev in self.lux_vars and msg.lux is not None:
+            self.lux_vars[dev].set(str(msg.lux))
 
     def _draw_lux_trend(self):
-        self.lux_logic.draw_lux_trend(self.lux_ax, self.lux_canvas)
-
-    def process_incoming_queue(self):
-        self.network.process_incoming_queue()
-        self.after(100, self.process_incoming_queue)
+        self.lux_renderer.invalidate()
+
+    def _pump_incoming(self, deadline):
+        """Pull messages from the network queue for this tick (bounded by count and the frame budget)."""
+        for _ in range(MAX_INCOMING_PER_TICK):
+            if time.monotonic() >= deadline:
+                break
+            msg = self.network.get_incoming()
+            if msg is None:
+                return False
+            self.log_incoming(msg)
+        return not self.network.incoming_queue.empty()
+
+    def gui_stats(self):
+        """Dispatcher metrics plus the network queue depth and drops."""
+        return {
+            **self.dispatcher.stats(),
+            "incoming_depth": self.network.incoming_queue.qsize(),
+            "incoming_dropped": self.network.incoming_dropped,
+        }
 
-    def process_gui_queue(self):
-        try:
-            while True:
-                func, args, kwargs = self.gui_queue.get_nowait()
-                func(*args, **kwargs)
-        except queue.Empty:
-            pass
-        self.after(50, self.process_gui_queue)  # Poll frequently
-
-    def tail_server_log(self, log_path="../server.log", n=20):
-        """Read the last n lines from the server.log file and display them in the incoming log area."""
-        if not os.path.isabs(log_path):
-            log_path = os.path.abspath(log_path)
-        if not os.path.exists(log_path):
-            self.log_incoming("server.log not found.")
+    def tail_server_log(self, n=20):
+        """Show the last n datagrams received by the master server (from its event journal) in the incoming log area."""
+        events = get_reader("server").tail(n, type="recv")
+        if not events:
+            self.log_incoming("No server events recorded yet.", record=False)
             return
-        with open(log_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()[-n:]
-        for line in lines:
-            if "[RECV]" in line:
-                self.log_incoming(line.strip())
+        for event in events:
+            addr = (event.get("ip"), event.get("port"))
+            msg = parse_text(event["raw"], addr) if event.get("device") else None
+            # Display only: these were recorded when received, and old taps must not unlock doors again
+            self.log_incoming(msg or f"From {addr}: {event.get('raw')}", record=False, replay=True)
 
     def show_server_log(self):
-        self.incoming_log_area.config(state='normal')
-        self.incoming_log_area.delete('1.0', 'end')
-        self.incoming_log_area.config(state='disabled')
-        self.tail_server_log(log_path="server.log", n=50)
+        self.incoming_view.clear()
+        self.tail_server_log(n=50)
 
     def shutdown(self):
         """Properly shutdown the HMI, close threads/resources, and exit the application."""
         try:
             # Signal threads to stop
             self._stop_event.set()
+            self.dispatcher.stop()
+            sql.log_writer.stop()  # flush log rows still queued
+            metrics.stop()
+            self.journal.close()
             if hasattr(self, 'heartbeat_listener') and self.heartbeat_listener:
                 self.heartbeat_listener.stop()
             # Stop OPC UA thread if running
@@ -561,6 +572,23 @@ class MasterHMI(tk.Tk):
         msg = 'User IDs in DB:\n' + '\n'.join(user_ids)
         messagebox.showinfo('User IDs', msg)
 
+    def show_tap_latency(self):
+        """Per-lock unlock latency (reply and door confirmation p50/p95/p99), the last few taps and heartbeat timing."""
+        tracker = get_tap_tracker()
+        lines = tracker.summary_lines() or ["No taps recorded yet."]
+        recent = tracker.recent(10)
+        if recent:
+            lines.append("")
+            lines.append("Recent taps:")
+            for tap in reversed(recent):
+                sent = "-" if tap["sent_ms"] is None else f"{tap['sent_ms']:.0f} ms"
+                door = "-" if tap["confirmed_ms"] is None else f"{tap['confirmed_ms']:.0f} ms"
+                lines.append(f"{tap['time'][11:]} {tap['tap_id']} {tap['uid']}: {tap['outcome'] or 'pending'}, sent {sent}, door {door}")
+        lines.append("")
+        lines.append("Heartbeats:")
+        lines.extend(self.heartbeat_listener.summary_lines())
+        messagebox.showinfo('Door Latency', '\n'.join(lines))
+
     def check_user_access(self, user_id, ip_address):
         allowed = self.reservation_manager.check_user_access(user_id, ip_address, send_command=self.send_command)
         if allowed:
@@ -588,7 +616,7 @@ class MasterHMI(tk.Tk):
                 max_lux_entry.delete(0, 'end')
                 max_lux_entry.insert(0, str(limit))
             # Redraw the chart with new limits
-            self.lux_logic.draw_lux_trend(self.lux_ax, self.lux_canvas)
+            self.lux_renderer.invalidate()
             self.log(f"Max lux limit set to {limit}")
         except ValueError:
             messagebox.showerror('Error', 'Invalid max lux limit value')
@@ -639,8 +667,8 @@ class MasterHMI(tk.Tk):
                         canvas.stop_blinking()
                     canvas.itemconfig('all', fill='gray')
                 self._update_opc_state_snapshot()  # Update state after alarm change
-        # Instead of calling self.after directly, put the update in the queue
-        self.gui_queue.put((update_alarm_canvas, (), {}))
+        # Called from the heartbeat thread: run on the Tk thread, latest state per device wins
+        self.dispatcher.post(update_alarm_canvas, key=('alarm', device_name))
 
     def reset_maintenance(self, room):
         self.set_maintenance(room, on=False)
@@ -713,8 +741,8 @@ class MasterHMI(tk.Tk):
                     messagebox.showerror("Config Error", f"Missing fields for {dev}")
                     return
                 new_config["devices"][dev] = {"ip": ip, "port": port, "type": typ}
-            # Save to config.json
-            config_path = os.path.join(os.path.dirname(__file__), "../config.json")
+            # Save to the config file the HMI was started with
+            config_path = routing.resolve_config_path()
             try:
                 with open(config_path, "w", encoding="utf-8") as f:
                     json.dump(new_config, f, indent=2)
@@ -740,5 +768,5 @@ if __name__ == '__main__':
             pass
     # Start the key listener in a background thread
     threading.Thread(target=listen_for_q, daemon=True).start()
-    app.after(1000, app.show_server_log)  # Show last 50 incoming log lines from server.log after 1s
+    app.after(1000, app.show_server_log)  # Show the last 50 datagrams received by the server after 1s
     app.mainloop()
@@ -13,59 +13,25 @@ import sys
 
 sys.path.append(os.path.join(os.path.dirname(__file__), 'utils'))
 from utils import sql
+from utils.message import SlaveMessage, parse_text, parse_logged_line, KIND_LIGHT, KIND_LOCK
+from utils.event_journal import get_reader
+from utils.routing import load_config
 from network import MasterNetworkHandler
 from gui import HMIWidgets
-from logic import LuxTrendLogic
+from logic import LuxTrendLogic, LuxTrendRenderer
+from gui_dispatcher import GuiDispatcher, LogView
+from heartbeat import HeartbeatListener
 from alarm_placeholder import create_alarm_placeholder  # Import the alarm placeholder module
 from reservation_manager import ReservationManager
 
-# Device info (update as needed)
-DEVICES = {
-    'lock_207': {'ip': '192.168.137.250', 'port': 4210, 'type': 'lock'},
-    'lock_208': {'ip': '192.168.137.249', 'port': 4210, 'type': 'lock'},
-    'light_207': {'ip': '192.168.137.248', 'port': 4210, 'type': 'light'},
-    'light_208': {'ip': '192.168.137.247', 'port': 4210, 'type': 'light'},
-}
-
-class HeartbeatListener(threading.Thread):
-    def __init__(self, device_names, alarm_callback, port=4220, timeout=1.0):
-        super().__init__(daemon=True)
-        self.device_names = device_names
-        self.alarm_callback = alarm_callback  # function(device_name, alarm_on: bool)
-        self.port = port
-        self.timeout = timeout
-        self.last_heartbeat = {dev: time.time() for dev in device_names}
-        self.running = True
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.bind(("", self.port))
-        self.sock.settimeout(0.2)
-
-    def run(self):
-        while self.running:
-            now = time.time()
-            # Check for lost heartbeat
-            for dev, last in self.last_heartbeat.items():
-                if now - last > self.timeout:
-                    self.alarm_callback(dev, True)
-                else:
-                    self.alarm_callback(dev, False)
-            # Listen for heartbeats
-            try:
-                data, addr = self.sock.recvfrom(128)
-                msg = data.decode(errors='replace').strip()
-                # Expecting: device_id:HEARTBEAT
-                if msg.endswith(":HEARTBEAT"):
-                    dev = msg.split(":")[0]
-                    if dev in self.last_heartbeat:
-                        self.last_heartbeat[dev] = time.time()
-            except socket.timeout:
-                continue
-            except Exception:
-                continue
-
-    def stop(self):
-        self.running = False
-        self.sock.close()
+# Device info (config.json, or the file MASTER_CONFIG names)
+CONFIG = load_config()
+DEVICES = CONFIG["devices"]
+# Tk work per tick before yielding to redraws/input, and lines kept in each log widget
+GUI_FRAME_BUDGET_MS = CONFIG.get("gui_frame_budget_ms", 15)
+LOG_MAX_LINES = CONFIG.get("log_max_lines", 500)
+# Incoming messages pulled from the network queue per tick (the rest wait for the next tick)
+MAX_INCOMING_PER_TICK = 500
 
 class MasterHMI(tk.Tk):
     def __init__(self):
@@ -74,6 +40,8 @@ class MasterHMI(tk.Tk):
         self.geometry('800x600')
         self.lux_logic = LuxTrendLogic(max_lux_points=75)
         self._stop_event = threading.Event()
+        # Frame-budgeted dispatcher for all GUI updates
+        self.dispatcher = GuiDispatcher(self, budget_ms=GUI_FRAME_BUDGET_MS)
         # Networking handler
         self.network = MasterNetworkHandler(
             devices=DEVICES,
@@ -96,10 +64,13 @@ class MasterHMI(tk.Tk):
         # Assign widget references
         self.log_area = self.widgets['log_area']
         self.incoming_log_area = self.widgets['incoming_log_area']
+        self.log_view = LogView(self.log_area, max_lines=LOG_MAX_LINES)
+        self.incoming_view = LogView(self.incoming_log_area, max_lines=LOG_MAX_LINES)
         self.lux_fig = self.widgets['lux_fig']
         self.lux_ax = self.widgets['lux_ax']
         self.lux_canvas = self.widgets['lux_canvas']
         self.lux_canvas_widget = self.widgets['lux_canvas_widget']
+        self.lux_renderer = LuxTrendRenderer(self.lux_logic, self.lux_ax, self.lux_canvas, self.after, max_fps=4)
         self.user_id_entry = self.widgets['user_id_entry']
         self.ip_entry = self.widgets['ip_entry']
 
@@ -172,7 +143,10 @@ class MasterHMI(tk.Tk):
             if lux_widget_key in self.widgets:
                 self.widgets[lux_widget_key].config(textvariable=self.lux_vars[dev])
 
-        self.after(100, self.process_incoming_queue)
+        self.dispatcher.add_pump(self._pump_incoming)
+        self.dispatcher.add_end_hook(self.log_view.flush)
+        self.dispatcher.add_end_hook(self.incoming_view.flush)
+        self.dispatcher.start()
 
         # Start heartbeat listener
         self.heartbeat_listener = HeartbeatListener(DEVICES.keys(), self.heartbeat_alarm_callback)
@@ -207,159 +181,139 @@ class MasterHMI(tk.Tk):
         from datetime import datetime
         from utils import sql
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        self.log_area.config(state='normal')
-        self.log_area.insert('end', f"[{timestamp}] {msg}\n")
-        self.log_area.see('end')
-        self.log_area.config(state='disabled')
+        self.log_view.append(f"[{timestamp}] {msg}")  # also called from network threads; flushed on the Tk thread
         try:
             sql.insert_outgoing_log(f"[{timestamp}] {msg}")
         except Exception as e:
             print(f"[HMI] Failed to record outgoing log: {e}")
 
-    def log_incoming(self, msg_with_source): # Renamed to avoid confusion with internal msg variable
-        from utils import sql
-        self.incoming_log_area.config(state='normal')
-        self.incoming_log_area.insert('end', msg_with_source + '\n')
-        self.incoming_log_area.see('end')
-        self.incoming_log_area.config(state='disabled')
-        try:
-            sql.insert_incoming_log(msg_with_source)
-        except Exception as e:
-            print(f"[HMI] Failed to record incoming log: {e}")
+    def log_incoming(self, msg, record=True, replay=False):
+        """
+        Show and record an incoming message: a SlaveMessage from the network, or a plain log line.
 
-        original_msg_content = ""
-        source_ip = None
+        replay marks history being redisplayed (tail_server_log): it updates the
+        display only, with no access check and no commands sent.
+        """
+        from utils import sql
+        if isinstance(msg, SlaveMessage):
+            msg_with_source = f"From {msg.addr}: {msg.raw}"
+        else:
+            msg_with_source = msg
+            msg = parse_logged_line(msg_with_source)
+        self.incoming_view.append(msg_with_source)
+        if record:
+            try:
+                sql.insert_incoming_log(msg_with_source)
+            except Exception as e:
+                print(f"[HMI] Failed to record incoming log: {e}")
+        if msg is None:
+            return
+        # Every sample goes into the trend; the widget updates are coalesced per device
+        self.lux_logic.update_from_message(msg, self.lux_renderer.request)
+        key = ('telemetry', msg.device_id) if msg.kind == KIND_LIGHT else None
+        self.dispatcher.post(self._apply_incoming, msg, replay, key=key)
 
+    def _apply_incoming(self, msg, replay=False):
         try:
-            # Parse "From ('IP', PORT): CONTENT"
-            if msg_with_source.startswith("From (") and "): " in msg_with_source:
-                parts = msg_with_source.split("): ", 1)
-                source_info = parts[0] # "From ('IP', PORT)"
-                original_msg_content = parts[1]
-
-                source_ip_str = source_info.split("('")[1].split("',")[0]
-                source_ip = source_ip_str # Store the IP of the sender
-            else:
-                original_msg_content = msg_with_source
-                # source_ip remains None if not in "From..." format
-
-            # --- One-Time Access Check ---
-            if source_ip and original_msg_content:
-                content_parts = original_msg_content.split(':', 1) # Split only on the first colon, e.g., "lock_208" and "04:47:43:12:7A:6A:80"
-                
-                if len(content_parts) == 2:
-                    device_name_from_msg = content_parts[0]
-                    potential_uid = content_parts[1]
-                    
-                    actual_device_name_for_ip = None
-                    for dev_key, dev_info in self.devices.items():
-                        if dev_info['ip'] == source_ip and dev_info['type'] == 'lock':
-                            actual_device_name_for_ip = dev_key
-                            break
-                    
-                    if actual_device_name_for_ip and device_name_from_msg == actual_device_name_for_ip:
-                        # Heuristic: UID has multiple colons (e.g., MAC address format) and is not a simple status.
-                        is_likely_uid = potential_uid.count(':') >= 5 and not any(status_keyword in potential_uid for status_keyword in ['ON', 'OFF', 'LOCKED', 'UNLOCKED', 'PWM'])
-
-                        if is_likely_uid:
-                            print(f"[HMI_DEBUG] Incoming UID for one-time access check: device='{actual_device_name_for_ip}', uid='{potential_uid}', source_ip='{source_ip}'")
-                            # Call reservation_manager's check_user_access directly.
-                            # The boolean return is not used here to show a messagebox for this automatic flow.
-                            self.reservation_manager.check_user_access(
-                                user_id=potential_uid,
-                                ip_address=source_ip, # IP of the lock device that sent the UID
-                                send_command=self.send_command
-                            )
-                            # Do not pass this specific UID message to _update_led_status if it was handled as one-time access.
-                            # Let further status changes (like UNLOCKED after command) be handled normally.
-                            # However, to prevent _update_led_status from misinterpreting it, we can return early or pass a modified message.
-                            # For now, let _update_led_status run; it should ignore this format.
-
+            # --- One-Time Access Check (live taps only) ---
+            if not replay and msg.ip and msg.kind == KIND_LOCK and msg.uid is not None:
+                actual_device_name_for_ip = None
+                for dev_key, dev_info in self.devices.items():
+                    if dev_info['ip'] == msg.ip and dev_info['type'] == 'lock':
+                        actual_device_name_for_ip = dev_key
+                        break
+
+                if actual_device_name_for_ip and msg.device_id == actual_device_name_for_ip:
+                    # Heuristic: UID has multiple colons (e.g., MAC address format) and is not a simple status.
+                    is_likely_uid = msg.uid.count(':') >= 5 and not any(status_keyword in msg.uid for status_keyword in ['ON', 'OFF', 'LOCKED', 'UNLOCKED', 'PWM'])
+
+                    if is_likely_uid:
+                        print(f"[HMI_DEBUG] Incoming UID for one-time access check: device='{actual_device_name_for_ip}', uid='{msg.uid}', source_ip='{msg.ip}'")
+                        # Call reservation_manager's check_user_access directly.
+                        # The boolean return is not used here to show a messagebox for this automatic flow.
+                        self.reservation_manager.check_user_access(
+                            user_id=msg.uid,
+                            ip_address=msg.ip, # IP of the lock device that sent the UID
+                            send_command=self.send_command
+                        )
         except Exception as e:
-            print(f"[HMI_DEBUG] Error in log_incoming parsing for one-time access: {e}, Original message: {msg_with_source}")
+            print(f"[HMI_DEBUG] Error in one-time access check: {e}, Original message: {msg.raw!r} from {msg.addr}")
 
-        # Determine message content for downstream handlers (_update_led_status, _update_lux_from_msg)
-        msg_for_downstream_handlers = original_msg_content if original_msg_content else msg_with_source
-        
-        self._update_led_status(msg_for_downstream_handlers)
-        self._update_lux_from_msg(msg_for_downstream_handlers)
+        self._update_led_status(msg, replay)
+        self._update_lux_from_msg(msg)
 
     def periodic_reservation_check(self):
         self.reservation_manager.check_reservation_expiry(self.send_command)
-        self.after(1000, self.periodic_reservation_check)
+        # Sleep until the next reservation end instead of polling every second
+        delay = self.reservation_manager.seconds_until_next_check()
+        self.after(int(delay * 1000), self.periodic_reservation_check)
 
-    def _update_led_status(self, msg):
-        # Expecting format: From (...): device_id:STATE:...
+    def _update_led_status(self, msg, replay=False):
+        # msg: SlaveMessage, e.g. light_207:ON:... or lock_207:UNLOCKED; a replayed UNLOCKED does not switch the light on
         try:
-            # Extract the actual message part after the last colon
-            if ":" in msg:
-                parts = msg.split(": ", 1)
-                if len(parts) == 2:
-                    msg = parts[1]
-            for dev in DEVICES:
+            dev = msg.device_id
+            if dev in self.led_indicators:
                 indicator = self.led_indicators[dev]
-                if msg.startswith(dev + ':ON') or msg.startswith(dev + ':UNLOCKED'):
+                if msg.state in ('ON', 'UNLOCKED'):
                     self.led_vars[dev].set('ON' if 'light' in dev else 'UNLOCKED')
                     indicator.config(bg='green')
-                    if dev in self.lock_to_light and msg.startswith(dev + ':UNLOCKED'):
+                    if dev in self.lock_to_light and msg.state == 'UNLOCKED' and not replay:
                         light_dev = self.lock_to_light[dev]
                         reserved, _ = self.reservation_manager.is_room_reserved_for_device(dev)
                         if reserved:
                             self.send_command(light_dev, 'ON')
                             self.reservation_manager.reserved_lights_on[light_dev] = True
-                elif msg.startswith(dev + ':OFF') or msg.startswith(dev + ':LOCKED'):
+                elif msg.state in ('OFF', 'LOCKED'):
                     self.led_vars[dev].set('OFF' if 'light' in dev else 'LOCKED')
                     indicator.config(bg='gray')
         except Exception as e:
             print(f"LED status update error: {e}")
 
     def _update_lux_from_msg(self, msg):
-        # Update lux trend and also update LDR and Lux value boxes for each light
-        self.lux_logic.update_lux_from_msg(msg, lambda: self.lux_logic.draw_lux_trend(self.lux_ax, self.lux_canvas))
-        # Parse and update LDR and Lux values
-        for dev in self.ldr_vars:
-            if dev in msg:
-                # Expecting format: device:STATE:LUX:PWM:LDR
-                parts = msg.split(':')
-                if len(parts) >= 5:
-                    ldr_val = parts[4].strip()
-                    self.ldr_vars[dev].set(ldr_val)
-                if len(parts) >= 3:
-                    lux_val = parts[2].strip()
-                    if dev in self.lux_vars:
-                        self.lux_vars[dev].set(lux_val)
+        # Update LDR and Lux value boxes for each light (the trend sample is added in log_incoming)
+        dev = msg.device_id
+        if dev in self.ldr_vars and msg.ldr is not None:
+            self.ldr_vars[dev].set(str(msg.ldr))
+        if dev in self.lux_vars and msg.lux is not None:
+            self.lux_vars[dev].set(str(msg.lux))
 
     def _draw_lux_trend(self):
-        self.lux_logic.draw_lux_trend(self.lux_ax, self.lux_canvas)
-
-    def process_incoming_queue(self):
-        self.network.process_incoming_queue()
-        self.after(100, self.process_incoming_queue)
-
-    def tail_server_log(self, log_path="../server.log", n=20):
-        """Read the last n lines from the server.log file and display them in the incoming log area."""
-        if not os.path.isabs(log_path):
-            log_path = os.path.abspath(log_path)
-        if not os.path.exists(log_path):
-            self.log_incoming("server.log not found.")
+        self.lux_renderer.invalidate()
+
+    def _pump_incoming(self, deadline):
+        """Pull messages from the network queue for this tick (bounded by count and the frame budget)."""
+        for _ in range(MAX_INCOMING_PER_TICK):
+            if time.monotonic() >= deadline:
+                break
+            msg = self.network.get_incoming()
+            if msg is None:
+                return False
+            self.log_incoming(msg)
+        return not self.network.incoming_queue.empty()
+
+    def tail_server_log(self, n=20):
+        """Show the last n datagrams received by the master server (from its event journal) in the incoming log area."""
+        events = get_reader("server").tail(n, type="recv")
+        if not events:
+            self.log_incoming("No server events recorded yet.", record=False)
             return
-        with open(log_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()[-n:]
-        for line in lines:
-            if "[RECV]" in line:
-                self.log_incoming(line.strip())
+        for event in events:
+            addr = (event.get("ip"), event.get("port"))
+            msg = parse_text(event["raw"], addr) if event.get("device") else None
+            # Display only: these were recorded when received, and old taps must not unlock doors again
+            self.log_incoming(msg or f"From {addr}: {event.get('raw')}", record=False, replay=True)
 
     def show_server_log(self):
-        self.incoming_log_area.config(state='normal')
-        self.incoming_log_area.delete('1.0', 'end')
-        self.incoming_log_area.config(state='disabled')
-        self.tail_server_log(log_path="server.log", n=50)
+        self.incoming_view.clear()
+        self.tail_server_log(n=50)
 
     def shutdown(self):
         """Properly shutdown the HMI, close threads/resources, and exit the application."""
         try:
             # Signal threads to stop
             self._stop_event.set()
+            self.dispatcher.stop()
+            sql.log_writer.stop()  # flush log rows still queued
             if hasattr(self, 'heartbeat_listener') and self.heartbeat_listener:
                 self.heartbeat_listener.stop()
         except Exception as e:
@@ -415,7 +369,7 @@ class MasterHMI(tk.Tk):
                 max_lux_entry.delete(0, 'end')
                 max_lux_entry.insert(0, str(limit))
             # Redraw the chart with new limits
-            self.lux_logic.draw_lux_trend(self.lux_ax, self.lux_canvas)
+            self.lux_renderer.invalidate()
             self.log(f"Max lux limit set to {limit}")
         except ValueError:
             messagebox.showerror('Error', 'Invalid max lux limit value')
@@ -449,9 +403,9 @@ class MasterHMI(tk.Tk):
 
     def heartbeat_alarm_callback(self, device_name, alarm_on):
         """Callback function for heartbeat alarms."""
-        if device_name in self.alarm_canvases:
-            canvas = self.alarm_canvases[device_name]
-            def update_alarm_canvas():
+        def update_alarm_canvas():
+            if device_name in self.alarm_canvases:
+                canvas = self.alarm_canvases[device_name]
                 if alarm_on:
                     # Heartbeat lost
                     if not getattr(canvas, '_acknowledged', False):
@@ -464,7 +418,8 @@ class MasterHMI(tk.Tk):
                     if getattr(canvas, '_blinking', False):
                         canvas.stop_blinking()
                     canvas.itemconfig('all', fill='gray')
-            self.after(0, update_alarm_canvas)
+        # Called from the heartbeat thread: run on the Tk thread, latest state per device wins
+        self.dispatcher.post(update_alarm_canvas, key=('alarm', device_name))
 
     def reset_maintenance(self, room):
         self.set_maintenance(room, on=False)
@@ -498,5 +453,5 @@ if __name__ == '__main__':
             pass
     # Start the key listener in a background thread
     threading.Thread(target=listen_for_q, daemon=True).start()
-    app.after(1000, app.show_server_log)  # Show last 50 incoming log lines from server.log after 1s
+    app.after(1000, app.show_server_log)  # Show the last 50 datagrams received by the server after 1s
     app.mainloop()
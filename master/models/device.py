@@ -1,35 +1,76 @@
 """Device model class."""
-from datetime import datetime
+import time
 
 class Device:
+    """
+    Compact device record.
+
+    Values are stored raw (epoch/monotonic floats, numbers) and `version` is bumped
+    only when the state or a reading actually changes, so formatted snapshots
+    (to_dict) are built once per change instead of on every status poll.
+    """
+    __slots__ = (
+        "device_id", "device_type", "addr", "state",
+        "last_update",        # epoch seconds of the last state/value change
+        "last_update_mono",   # time.monotonic() of the same change, for interval math
+        "last_seen_mono",     # time.monotonic() of the last message, changed or not
+        "current_lux", "pwm_value", "raw_ldr", "latest_uid",
+        "version", "_dict", "_dict_version",
+    )
+
     def __init__(self, device_id, device_type, addr):
         self.device_id = device_id
         self.device_type = device_type
         self.addr = addr
         self.state = "UNKNOWN"
-        self.last_update = datetime.now()
+        self.last_update = time.time()
+        self.last_update_mono = self.last_seen_mono = time.monotonic()
         # Additional attributes for lights
         self.current_lux = 0.0
         self.pwm_value = 0
         self.raw_ldr = 0  # New: raw LDR value
+        # Additional attributes for locks
+        self.latest_uid = None
+        self.version = 0
+        self._dict = None
+        self._dict_version = -1
+
+    def _touch(self, changed):
+        self.last_seen_mono = time.monotonic()
+        if changed:
+            self.last_update = time.time()
+            self.last_update_mono = self.last_seen_mono
+            self.version += 1
 
     def update_state(self, state):
-        """Update device state and timestamp."""
+        """Update device state; the timestamp and version only move if it changed."""
+        changed = state != self.state
         self.state = state
-        self.last_update = datetime.now()
+        self._touch(changed)
 
     def update_light_data(self, lux, pwm, raw_ldr=None):
         """Update light-specific data."""
+        if raw_ldr is None:
+            raw_ldr = self.raw_ldr
+        changed = (lux, pwm, raw_ldr) != (self.current_lux, self.pwm_value, self.raw_ldr)
         self.current_lux = lux
         self.pwm_value = pwm
-        if raw_ldr is not None:
-            self.raw_ldr = raw_ldr
+        self.raw_ldr = raw_ldr
+        self._touch(changed)
+
+    def set_latest_uid(self, uid):
+        """Record the last UID read by a lock."""
+        if uid != self.latest_uid:
+            self.latest_uid = uid
+            self.version += 1
 
     def to_dict(self):
-        """Convert device to dictionary for status display."""
+        """Convert device to dictionary for status display (formatted once per version)."""
+        if self._dict_version == self.version:
+            return self._dict
         data = {
             "state": self.state,
-            "last_update": self.last_update.strftime("%H:%M:%S")
+            "last_update": time.strftime("%H:%M:%S", time.localtime(self.last_update))
         }
         if self.device_type == "light":
             data.update({
@@ -37,4 +78,6 @@ class Device:
                 "pwm_value": str(self.pwm_value),
                 "raw_ldr": str(self.raw_ldr)  # New: raw LDR value
             })
+        self._dict = data
+        self._dict_version = self.version
         return data
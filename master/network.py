@@ -1,45 +1,94 @@
+import heapq
 import socket
 import threading
 import queue
 import time
 from utils import sql
-from threading import Timer
+from utils.routing import get_registry
+from utils.scheduler import get_scheduler
+from utils.message import SlaveMessage, parse_datagram, KIND_LOCK
+from utils.metrics import get_metrics
+from utils.tap_tracker import get_tap_tracker
+
+metrics = get_metrics()
+
+# Light telemetry and text lines waiting for the GUI; past this new ones are dropped.
+# Lock messages (UIDs, LOCKED/UNLOCKED) change state and are always queued.
+INCOMING_QUEUE_SIZE = 5000
 
 class MasterNetworkHandler:
-    def __init__(self, devices, udp_listen_port, log_callback, incoming_callback, stop_event=None):
+    def __init__(self, devices, udp_listen_port, log_callback, incoming_callback, stop_event=None, incoming_maxsize=INCOMING_QUEUE_SIZE):
         self.devices = devices
+        self.routing = get_registry()
+        self.scheduler = get_scheduler()
+        self.taps = get_tap_tracker()
         self.udp_listen_port = udp_listen_port
         self.log_callback = log_callback  # function to log outgoing
         self.incoming_callback = incoming_callback  # function to log incoming
-        self.incoming_queue = queue.Queue()
+        self.incoming_queue = queue.Queue()  # read with get_incoming()
+        self.incoming_maxsize = incoming_maxsize
+        self.incoming_dropped = 0
+        self._sheddable_queued = 0  # queued items _is_sheddable() allows to drop
+        self._incoming_lock = threading.Lock()
         self._stop_event = stop_event or threading.Event()
+        # One persistent sender socket shared by send_command and the mesh fan-out
+        self.send_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.mesh_pacing = 0.01  # minimum gap between datagrams to the same target
+        self._send_queue = queue.Queue()
+        self.send_thread = threading.Thread(target=self._fanout_loop, daemon=True)
+        self.send_thread.start()
         self.udp_thread = threading.Thread(target=self.listen_udp, daemon=True)
         self.udp_thread.start()
 
     def send_command(self, device_name, command):
         info = self.devices[device_name]
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-                s.sendto(command.encode(), (info['ip'], info['port']))
+            with metrics.span("send", kind="command"):
+                self.send_sock.sendto(command.encode(), (info['ip'], info['port']))
+            metrics.inc("commands_sent_total", command=command.split(":", 1)[0])
             self.log_callback(f"Sent {command} to {device_name} at {info['ip']}:{info['port']}")
         except Exception as e:
             self.log_callback(f"Error sending to {device_name}: {e}")
             raise
 
-    def broadcast_mesh_command(self, target_device, command):
+    def broadcast_mesh_command(self, target_device, command, tap=None):
         info = self.devices[target_device]
         target_ip = info['ip']
+        target_addr = (info['ip'], info['port'])
         mesh_message = f"{target_ip}:{command}:3"  # TTL=3 (or adjust as needed)
-        try:
-            for name, info in self.devices.items():
-                if info['type'] in ('light', 'lock'):
-                    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-                        s.sendto(mesh_message.encode(), (info['ip'], info['port']))
-                        time.sleep(0.01)
-            self.log_callback(f"Unicast mesh command to all: {mesh_message}")
-        except Exception as e:
-            self.log_callback(f"Error unicasting mesh command: {e}")
-            raise
+        payload = mesh_message.encode()
+        targets = [(info['ip'], info['port']) for info in self.devices.values() if info['type'] in ('light', 'lock')]
+        # Hand the whole burst to the fan-out thread; the caller (often listen_udp) returns immediately.
+        # A tap is marked sent when the datagram addressed to the target itself goes out.
+        self._send_queue.put((payload, targets, tap, target_addr))
+        metrics.inc("commands_sent_total", command=f"MESH_{command}")
+        self.log_callback(f"Unicast mesh command to all: {mesh_message}")
+
+    def _fanout_loop(self):
+        """Send queued mesh bursts in one pass, pacing only repeat datagrams to the same target."""
+        last_sent = {}  # (ip, port) -> time of last datagram
+        pending = []    # heap of (due_time, seq, payload, target, tap)
+        seq = 0
+        while not self._stop_event.is_set():
+            timeout = max(0.0, pending[0][0] - time.monotonic()) if pending else 0.5
+            try:
+                payload, targets, tap, target_addr = self._send_queue.get(timeout=timeout)
+                for target in targets:
+                    due = last_sent.get(target, 0.0) + self.mesh_pacing
+                    heapq.heappush(pending, (due, seq, payload, target, tap if target == target_addr else None))
+                    seq += 1
+                    last_sent[target] = max(due, time.monotonic())
+            except queue.Empty:
+                pass
+            now = time.monotonic()
+            while pending and pending[0][0] <= now:
+                _, _, payload, target, tap = heapq.heappop(pending)
+                try:
+                    self.send_sock.sendto(payload, target)
+                    metrics.inc("mesh_datagrams_sent_total")
+                    self.taps.sent(tap)
+                except Exception as e:
+                    self.log_callback(f"Error unicasting mesh command to {target[0]}: {e}")
 
     def listen_udp(self):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -48,35 +97,76 @@ class MasterNetworkHandler:
         while not self._stop_event.is_set():
             try:
                 data, addr = sock.recvfrom(1024)
-                msg = f"From {addr}: {data.decode(errors='replace')}"
-                self.incoming_queue.put(msg)
+                metrics.inc("udp_received_total", component="hmi")
+                with metrics.span("parse", component="hmi"):
+                    msg = parse_datagram(data, addr)
+                if msg is None:
+                    self._put_incoming(f"From {addr}: {data.decode(errors='replace')}")
+                    continue
+                # Downstream consumers (log_incoming, LED/lux updates) all get the parsed message
+                self._put_incoming(msg)
                 # --- Automatic UID/IP matching and unlock broadcast ---
                 try:
-                    parts = data.decode(errors='replace').strip().split(":")
-                    if len(parts) >= 2:
-                        device_id = parts[0]
-                        uid = ":".join(parts[1:])
-                        if device_id.startswith("lock_"):
-                            ip_address = addr[0]
-                            if sql.is_access_allowed(uid, ip_address):
-                                for name, info in self.devices.items():
-                                    if info['ip'] == ip_address and info['type'] == 'lock':
-                                        # Send mesh UNLOCK broadcast for this lock
-                                        self.broadcast_mesh_command(name, 'UNLOCK')
-                                        self.log_callback(f"[AUTO] UID {uid} allowed for {ip_address}, sent UNLOCK broadcast.")
-                                        # Schedule LOCK broadcast after 2 seconds
-                                        Timer(2.0, lambda: self.broadcast_mesh_command(name, 'LOCK')).start()
-                                        break
+                    if msg.kind == KIND_LOCK and msg.uid is not None:
+                        uid = msg.uid
+                        ip_address = msg.ip
+                        tap = self.taps.begin(msg.device_id, uid, msg.received_at)
+                        with metrics.span("access_check", path="hmi"):
+                            allowed = sql.is_access_allowed(uid, ip_address)
+                        self.taps.decided(tap, allowed)
+                        name = self.routing.device_for_ip(ip_address, 'lock') if allowed else None
+                        if name in self.devices:
+                            # Send mesh UNLOCK broadcast for this lock
+                            self.broadcast_mesh_command(name, 'UNLOCK', tap=tap)
+                            self.log_callback(f"[AUTO] UID {uid} allowed for {ip_address}, sent UNLOCK broadcast (tap {tap.tap_id}).")
+                            # Schedule LOCK broadcast after 2 seconds (replaces any pending relock for this lock)
+                            self.scheduler.schedule(('relock', name), 2.0, self.broadcast_mesh_command, name, 'LOCK')
+                        else:
+                            self.taps.finish(tap)  # denied (or unknown lock): no UNLOCK goes out
+                    elif msg.kind == KIND_LOCK and msg.state is not None:
+                        self.taps.confirm(msg.device_id, msg.state, msg.received_at)
                 except Exception as e:
                     self.log_callback(f"[AUTO] Error in auto-unlock: {e}")
                 # --- End automatic matching ---
             except socket.timeout:
                 continue
             except Exception as e:
-                self.incoming_queue.put(f"UDP Listen error: {e}")
+                self._put_incoming(f"UDP Listen error: {e}")
         sock.close()
+        # The fan-out thread may still be sending a queued burst on send_sock; close it only once that has stopped
+        self.send_thread.join()
+        self.send_sock.close()
+
+    @staticmethod
+    def _is_sheddable(item):
+        """Light telemetry repeats the full state in every sample and text lines are display only; lock messages are edges."""
+        return not (isinstance(item, SlaveMessage) and item.kind == KIND_LOCK)
+
+    def _put_incoming(self, item):
+        """Queue an item for the GUI; while it is behind by incoming_maxsize sheddable items, new ones are dropped."""
+        if self._is_sheddable(item):
+            with self._incoming_lock:
+                if self._sheddable_queued >= self.incoming_maxsize:
+                    self.incoming_dropped += 1
+                    metrics.inc("incoming_dropped_total")
+                    return
+                self._sheddable_queued += 1
+        self.incoming_queue.put(item)
+
+    def get_incoming(self):
+        """Next received item for the GUI, or None if nothing is waiting."""
+        try:
+            item = self.incoming_queue.get_nowait()
+        except queue.Empty:
+            return None
+        if self._is_sheddable(item):
+            with self._incoming_lock:
+                self._sheddable_queued -= 1
+        return item
 
     def process_incoming_queue(self):
-        while not self.incoming_queue.empty():
-            msg = self.incoming_queue.get()
+        while True:
+            msg = self.get_incoming()
+            if msg is None:
+                return
             self.incoming_callback(msg)
@@ -1,81 +1,137 @@
 # ReservationManager: Handles reservation-based light and access logic
+import heapq
 from utils import sql
-from datetime import datetime
+from utils.routing import get_registry
+from utils.scheduler import get_scheduler
+from datetime import datetime, timedelta
 
 class ReservationManager:
-    def __init__(self, lock_to_light, devices):
+    ONE_TIME_GRACE = 3        # seconds after a reservation ends during which its user gets one-time access
+    SCHEDULE_RECHECK = 5.0    # longest sleep between checks for changes in the reservation index
+
+    def __init__(self, lock_to_light, devices, index=None):
         self.lock_to_light = lock_to_light
         self.devices = devices
+        self.routing = get_registry()
+        self.index = index or sql.reservation_index  # single source of truth for reservations
         self.reserved_lights_on = {}
         self.one_time_access = {}
         self.one_time_access_used = {}
+        # Today's reservations per room and a min-heap of upcoming end times, rebuilt from the index
+        self._rooms = {}          # lock device -> room_id
+        self._schedule = {}       # room_id -> [(start_dt, end_dt, user_id), ...]
+        self._events = []
+        self._schedule_date = None
+        self._schedule_version = None
+
+    def _room_for_ip(self, ip_address):
+        """room_id from the reservation index's slave map, or from the shared routing table."""
+        room_id = self.index.get_room_id(ip_address)
+        if room_id is not None:
+            return room_id
+        return self.routing.room_for_ip(ip_address)
+
+    def _refresh_schedule(self, now):
+        """Rebuild today's schedule for every lock's room and the event heap from the reservation index."""
+        version = self.index.version  # read first: a change while copying triggers another rebuild
+        rooms = {}
+        for lock_dev in self.lock_to_light:
+            room_id = self._room_for_ip(self.devices[lock_dev]['ip'])
+            if room_id is not None:
+                rooms[lock_dev] = room_id
+        today = now.date()
+        today_str = today.strftime('%Y-%m-%d')
+        midnight = datetime.combine(today, datetime.min.time())
+        schedule = {}
+        for room_id in rooms.values():
+            schedule[room_id] = [
+                (midnight + timedelta(seconds=start), midnight + timedelta(seconds=end), user_id)
+                for start, end, user_id in self.index.room_schedule(room_id, today_str)
+            ]
+        # Wake just after every end_time (grant one-time access) and once the grace period is over (light OFF)
+        events = []
+        for entries in schedule.values():
+            for _, end_dt, _ in entries:
+                for due in (end_dt + timedelta(seconds=1), end_dt + timedelta(seconds=self.ONE_TIME_GRACE)):
+                    if due >= now:
+                        events.append(due)
+        heapq.heapify(events)
+        self._rooms = rooms
+        self._schedule = schedule
+        self._events = events
+        self._schedule_date = today
+        self._schedule_version = version
+
+    def _ensure_schedule(self, now):
+        """Rebuild the schedule when the index changed or the day changed. Returns True if rebuilt."""
+        if self._schedule_date == now.date() and self._schedule_version == self.index.version:
+            return False
+        try:
+            self._refresh_schedule(now)
+            return True
+        except Exception as e:
+            print(f"Reservation schedule refresh error: {e}")
+            return False
+
+    def _active_reservation(self, room_id, now):
+        for start_dt, end_dt, user_id in self._schedule.get(room_id, ()):
+            if start_dt <= now <= end_dt:
+                return start_dt, end_dt, user_id
+        return None
+
+    def _last_ended_reservation(self, room_id, now):
+        ended = [r for r in self._schedule.get(room_id, ()) if r[1] < now]
+        return max(ended, key=lambda r: r[1]) if ended else None
 
     def is_room_reserved_for_device(self, lock_device):
         try:
-            ip_address = self.devices[lock_device]['ip']
-            connection = sql.get_connection()
-            cursor = connection.cursor(buffered=True)
-            cursor.execute("SELECT room_id FROM slave WHERE ip_address = %s", (ip_address,))
-            row = cursor.fetchone()
-            if not row:
-                return False, None
-            room_id = row[0]
-            now = sql.datetime.now()
-            today = now.strftime('%Y-%m-%d')
-            current_time = now.strftime('%H:%M:%S')
-            query = (
-                "SELECT end_time FROM room_reservations "
-                "WHERE room_id = %s "
-                "AND date = %s AND start_time <= %s AND end_time >= %s"
-            )
-            cursor.execute(query, (room_id, today, current_time, current_time))
-            result = cursor.fetchone()
-            cursor.close()
-            connection.close()
-            if result:
-                return True, result[0]  # end_time as string
-            else:
-                return False, None
+            now = datetime.now()
+            self._ensure_schedule(now)
+            room_id = self._rooms.get(lock_device)
+            active = self._active_reservation(room_id, now) if room_id is not None else None
+            if active:
+                return True, active[1].strftime('%H:%M:%S')  # end_time as string
+            return False, None
         except Exception as e:
             print(f"Reservation check error: {e}")
             return False, None
 
+    def seconds_until_next_check(self):
+        """Seconds until the next reservation end (or grace-period end), at most SCHEDULE_RECHECK."""
+        wait = self.SCHEDULE_RECHECK
+        if self._events:
+            wait = min(wait, (self._events[0] - datetime.now()).total_seconds())
+        return max(0.05, wait)
+
     def check_reservation_expiry(self, send_command):
+        """Handle reservation ends. Only does work when an end_time (+grace) is due or the schedule was reloaded."""
         try:
+            now = datetime.now()
+            reloaded = self._ensure_schedule(now)
+            due = False
+            while self._events and self._events[0] <= now:
+                heapq.heappop(self._events)
+                due = True
+            if not (due or reloaded):
+                return
             for lock_dev, light_dev in self.lock_to_light.items():
                 if self.reserved_lights_on.get(light_dev):
-                    reserved, end_time = self.is_room_reserved_for_device(lock_dev)
-                    if not reserved:
-                        ip_address = self.devices[lock_dev]['ip']
-                        connection = sql.get_connection()
-                        cursor = connection.cursor(buffered=True)
-                        cursor.execute("SELECT room_id FROM slave WHERE ip_address = %s", (ip_address,))
-                        row = cursor.fetchone()
-                        if row:
-                            room_id = row[0]
-                            now = sql.datetime.now()
-                            today = now.strftime('%Y-%m-%d')
-                            cursor.execute(
-                                "SELECT user_id, end_time FROM room_reservations WHERE room_id = %s AND date = %s AND end_time < %s ORDER BY end_time DESC LIMIT 1",
-                                (room_id, today, now.strftime('%H:%M:%S'))
-                            )
-                            last_res = cursor.fetchone()
-                            cursor.close()
-                            connection.close()
-                            if last_res:
-                                end_dt = datetime.strptime(f"{today} {last_res[1]}", "%Y-%m-%d %H:%M:%S")
-                                seconds_since_end = (now - end_dt).total_seconds()
-                                if seconds_since_end < 3:  # Grant one-time access if reservation ended recently
-                                    if lock_dev not in self.one_time_access:
-                                        self.one_time_access[lock_dev] = last_res[0]
-                                        self.one_time_access_used = getattr(self, 'one_time_access_used', {})
-                                        self.one_time_access_used[lock_dev] = False
-                                        print(f"[DEBUG] One-time access GRANTED for lock_dev: {lock_dev} to user_id: {last_res[0]}") # DEBUG
-                                    continue
-                        if self.reserved_lights_on.get(light_dev):
-                            send_command(light_dev, 'OFF')
-                            self.reserved_lights_on[light_dev] = False
-                            print(f"[DEBUG] Light {light_dev} turned OFF due to reservation expiry for {lock_dev}.") # DEBUG
+                    room_id = self._rooms.get(lock_dev)
+                    if room_id is not None and self._active_reservation(room_id, now):
+                        continue
+                    if room_id is not None:
+                        last_res = self._last_ended_reservation(room_id, now)
+                        if last_res:
+                            seconds_since_end = (now - last_res[1]).total_seconds()
+                            if seconds_since_end < self.ONE_TIME_GRACE:  # Grant one-time access if reservation ended recently
+                                if lock_dev not in self.one_time_access:
+                                    self.one_time_access[lock_dev] = last_res[2]
+                                    self.one_time_access_used[lock_dev] = False
+                                    print(f"[DEBUG] One-time access GRANTED for lock_dev: {lock_dev} to user_id: {last_res[2]}") # DEBUG
+                                continue
+                    send_command(light_dev, 'OFF')
+                    self.reserved_lights_on[light_dev] = False
+                    print(f"[DEBUG] Light {light_dev} turned OFF due to reservation expiry for {lock_dev}.") # DEBUG
         except Exception as e:
             print(f"Reservation expiry check error: {e}")
 
@@ -91,12 +147,7 @@ class ReservationManager:
             # Condition 1: UID match
             uid_match = (user_id == last_uid)
             # Condition 2: IP match (device sending UID is the lock device in question)
-            # Ensure self.devices[lock_dev]['ip'] exists and is correct
-            device_ip_match = False
-            if lock_dev in self.devices and 'ip' in self.devices[lock_dev]:
-                device_ip_match = (self.devices[lock_dev]['ip'] == ip_address)
-            else:
-                print(f"[DEBUG] Warning: Device IP not found for lock_dev: {lock_dev} in self.devices")
+            device_ip_match = (self.routing.device_for_ip(ip_address, 'lock') == lock_dev)
 
             print(f"[DEBUG] UID match for {lock_dev}: {uid_match} (Expected: {last_uid}, Got: {user_id})")
             print(f"[DEBUG] Device IP match for {lock_dev}: {device_ip_match} (Expected: {self.devices.get(lock_dev, {}).get('ip')}, Got: {ip_address})")
@@ -113,12 +164,11 @@ class ReservationManager:
                     if send_command:
                         send_command(lock_dev, 'UNLOCK')
                         print(f"[DEBUG] UNLOCK command attempted for {lock_dev} via send_command.")
-                        # Schedule LOCK after 3 seconds
-                        import threading
-                        def delayed_lock():
+                        # Schedule LOCK after 3 seconds (replaces any pending relock for this lock)
+                        def delayed_lock(lock_dev=lock_dev):
                             send_command(lock_dev, 'LOCK')
                             print(f"[DEBUG] LOCK command sent to {lock_dev} after 3s delay following one-time UNLOCK.")
-                        threading.Timer(3, delayed_lock).start()
+                        get_scheduler().schedule(('relock', lock_dev), 3, delayed_lock)
                     else:
                         print(f"[DEBUG] send_command is None. Cannot send UNLOCK to {lock_dev}.")
 
@@ -0,0 +1,408 @@
+"""
+Slave-fleet simulator and load generator for the master.
+
+Emulates N light and lock slaves over localhost UDP with the firmware's wire
+formats:
+  light_X:STATE:lux:pwm:ldr   telemetry to the master (port 4210)
+  lock_X:<UID>                RFID tap to the master
+  lock_X:UNLOCKED / LOCKED    lock status echo after a command
+  dev:HEARTBEAT               heartbeat to the master's port 4220
+  ip:cmd:ttl                  mesh command, relayed with ttl-1 until it reaches ip
+
+Each slave binds its own loopback address (127.1.x.y) so the master sees one
+source IP per device, as on the real network. Write the matching device table
+and point the master at it before starting the run:
+
+  python master/simulator.py --lights 20 --locks 20 --write-config sim_config.json
+  MASTER_CONFIG=sim_config.json python -m master        (or master_hmi.py)
+  python master/simulator.py --lights 20 --locks 20 --duration 60 --tap-rate 5 --uid-file uids.txt
+
+Traffic is generated from a seeded schedule, so two runs with the same
+arguments send the same datagrams in the same order. The report gives tap ->
+command latency percentiles and counts of lost, unanswered and relayed packets.
+Works against both UDPHandler (direct UNLOCK/LOCK replies) and
+MasterNetworkHandler (mesh UNLOCK). Binding 127.1.x.y needs Linux or Windows.
+"""
+import argparse
+import heapq
+import itertools
+import json
+import random
+import selectors
+import socket
+import time
+
+# TTL MasterNetworkHandler puts on mesh commands; copies with a lower TTL are relays
+MESH_TTL = 3
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, int(round(p / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+class SimSlave:
+    """One simulated ESP8266: a bound UDP socket plus the firmware's command handling."""
+
+    def __init__(self, sim, name, device_type, ip, port):
+        self.sim = sim
+        self.name = name
+        self.device_type = device_type
+        self.ip = ip
+        self.port = port
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((ip, port))
+        self.sock.setblocking(False)
+        self.state = 'ON' if device_type == 'light' and sim.lights_on else ('OFF' if device_type == 'light' else 'LOCKED')
+        self.lux = 100.0
+        self.pwm = 512
+        self.ldr = 500
+
+    def send(self, payload, addr, kind):
+        self.sim.count(f"{kind}_sent")
+        if self.sim.rng_loss.random() < self.sim.loss:
+            self.sim.count(f"{kind}_lost")
+            return False
+        self.sock.sendto(payload.encode(), addr)
+        return True
+
+    # --- Outgoing traffic ---
+
+    def send_telemetry(self):
+        if self.state != 'ON':
+            return
+        rng = self.sim.rng_traffic
+        self.lux = max(0.0, self.lux + rng.uniform(-2.0, 2.0))
+        self.ldr = max(0, min(1023, self.ldr + rng.randint(-5, 5)))
+        self.send(f"{self.name}:ON:{self.lux:.1f}:{self.pwm}:{self.ldr}", self.sim.master_addr, 'telemetry')
+
+    def send_heartbeat(self):
+        self.send(f"{self.name}:HEARTBEAT", self.sim.heartbeat_addr, 'heartbeat')
+
+    def tap(self, uid):
+        # Taps dropped by the simulator are not waited for, so they cannot shift the matching of later answers
+        if self.send(f"{self.name}:{uid}", self.sim.master_addr, 'tap'):
+            self.sim.tap_sent(self, uid)
+
+    # --- Incoming commands ---
+
+    def on_datagram(self, data):
+        message = data.decode(errors='replace').strip()
+        if self.sim.rng_loss.random() < self.sim.loss:
+            self.sim.count("command_lost")
+            if self.device_type == 'lock' and self._answers_tap(message):
+                self.sim.tap_answer_lost(self)
+            return
+        self.sim.count("command_received")
+        if self._is_mesh(message):
+            self.handle_mesh(message)
+        else:
+            self.handle_command(message, mesh=False)
+
+    def _answers_tap(self, message):
+        """True for a direct UNLOCK/LOCK reply, or the master's own copy of a mesh UNLOCK for this lock."""
+        if not self._is_mesh(message):
+            return message in ('UNLOCK', 'LOCK')
+        return message == f"{self.ip}:UNLOCK:{MESH_TTL}"
+
+    def _is_mesh(self, message):
+        if self.device_type == 'lock':
+            return ':' in message  # lock firmware: any colon means a mesh command
+        # light firmware: exactly two colons
+        return message.count(':') == 2 and message.index(':') > 0
+
+    def handle_mesh(self, message):
+        parts = message.split(':')
+        if len(parts) < 3:
+            return
+        target_ip, cmd = parts[0], parts[1]
+        try:
+            ttl = int(parts[2])
+        except ValueError:
+            ttl = 0
+        if target_ip == self.ip:
+            self.handle_command(cmd, mesh=True, relayed=ttl < MESH_TTL)
+        elif ttl > 0:
+            target = self.sim.by_ip.get(target_ip)
+            if target is not None:
+                self.sim.count("mesh_relayed")
+                self.send(f"{target_ip}:{cmd}:{ttl - 1}", (target.ip, target.port), 'relay')
+        else:
+            self.sim.count("mesh_ttl_expired")
+
+    def handle_command(self, cmd, mesh, relayed=False):
+        if self.device_type == 'lock':
+            if cmd in ('UNLOCK', 'LOCK'):
+                # Direct replies answer a tap (UDPHandler). Over the mesh only UNLOCK does (LOCK is
+                # MasterNetworkHandler's automatic relock), and the burst reaches the lock directly and
+                # again through every relay: only the master's own copy is counted.
+                if not mesh:
+                    self.sim.tap_answered(self, cmd)
+                elif cmd == 'UNLOCK':
+                    if relayed:
+                        self.sim.count("mesh_relayed_copies")
+                    else:
+                        self.sim.tap_answered(self, cmd)
+                self.state = 'UNLOCKED' if cmd == 'UNLOCK' else 'LOCKED'
+                self.send(f"{self.name}:{self.state}", self.sim.master_addr, 'status')
+        else:
+            if cmd == 'ON':
+                self.state = 'ON'
+            elif cmd == 'OFF':
+                self.state = 'OFF'
+                self.send(f"{self.name}:OFF:0:0:0", self.sim.master_addr, 'status')
+            elif cmd.startswith('PWM:'):
+                try:
+                    self.pwm = max(0, min(1023, int(cmd[4:])))
+                except ValueError:
+                    pass
+
+
+class FleetSimulator:
+    """Schedules the fleet's traffic on one thread and matches lock commands to pending taps."""
+
+    def __init__(self, lights=2, locks=2, master_host='127.0.0.1', master_port=4210, heartbeat_port=4220,
+                 slave_port=4310, ip_prefix='127.1.', telemetry_interval=0.5, heartbeat_interval=0.5,
+                 jitter=0.1, loss=0.0, tap_rate=1.0, tap_pattern='poisson', burst_size=5, uids=None,
+                 response_timeout=2.0, lights_on=True, seed=1, first_room=201):
+        self.master_addr = (master_host, master_port)
+        self.heartbeat_addr = (master_host, heartbeat_port)
+        self.telemetry_interval = telemetry_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.jitter = jitter
+        self.loss = loss
+        self.tap_rate = tap_rate
+        self.tap_pattern = tap_pattern
+        self.burst_size = burst_size
+        self.response_timeout = response_timeout
+        self.lights_on = lights_on
+        # Separate streams so loss decisions never shift the traffic schedule
+        self.rng_traffic = random.Random(seed)
+        self.rng_loss = random.Random(seed + 1)
+        self.uids = uids or [self._random_uid() for _ in range(16)]
+        self.counters = {}
+        self.latencies = {}   # lock name -> [seconds]
+        self.pending = {}     # lock name -> [(tap time, uid)] oldest first
+        self.outcomes = {'UNLOCK': 0, 'LOCK': 0, 'timeout': 0}
+        self.slaves = []
+        self.by_ip = {}
+        self.selector = selectors.DefaultSelector()
+        host = itertools.count(1)
+        for i in range(max(lights, locks)):
+            room = first_room + i
+            for device_type, count in (('light', lights), ('lock', locks)):
+                if i < count:
+                    slave = SimSlave(self, f"{device_type}_{room}", device_type, self._loopback_ip(ip_prefix, next(host)), slave_port)
+                    self.slaves.append(slave)
+                    self.by_ip[slave.ip] = slave
+                    self.selector.register(slave.sock, selectors.EVENT_READ, slave)
+        self.locks = [s for s in self.slaves if s.device_type == 'lock']
+
+    @staticmethod
+    def _loopback_ip(prefix, n):
+        """n-th slave address: 127.1.0.1 .. 127.1.0.250, 127.1.1.1, ..."""
+        return f"{prefix}{(n - 1) // 250}.{(n - 1) % 250 + 1}"
+
+    def _random_uid(self):
+        return ':'.join(f"{self.rng_traffic.randrange(256):02X}" for _ in range(7))
+
+    def device_table(self):
+        """Device table for the master's config.json."""
+        return {s.name: {'ip': s.ip, 'port': s.port, 'type': s.device_type} for s in self.slaves}
+
+    def count(self, key, n=1):
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    # --- Tap bookkeeping ---
+
+    def tap_sent(self, lock, uid):
+        self.pending.setdefault(lock.name, []).append((time.monotonic(), uid))
+
+    def tap_answered(self, lock, cmd):
+        waiting = self.pending.get(lock.name)
+        if not waiting:
+            self.count("unmatched_commands")
+            return
+        tapped_at, _ = waiting.pop(0)
+        self.latencies.setdefault(lock.name, []).append(time.monotonic() - tapped_at)
+        self.outcomes[cmd] += 1
+
+    def tap_answer_lost(self, lock):
+        waiting = self.pending.get(lock.name)
+        if waiting:
+            waiting.pop(0)
+            self.count("answer_lost")
+
+    def _expire_taps(self, now):
+        for waiting in self.pending.values():
+            while waiting and now - waiting[0][0] > self.response_timeout:
+                waiting.pop(0)
+                self.outcomes['timeout'] += 1
+
+    # --- Schedule ---
+
+    def _jittered(self, interval):
+        return interval * (1.0 + self.rng_traffic.uniform(-self.jitter, self.jitter))
+
+    def _next_tap_delay(self):
+        if self.tap_pattern == 'periodic':
+            return 1.0 / self.tap_rate
+        if self.tap_pattern == 'burst':
+            return self.rng_traffic.expovariate(self.tap_rate / self.burst_size)
+        return self.rng_traffic.expovariate(self.tap_rate)
+
+    def run(self, duration):
+        start = time.monotonic()
+        end = start + duration
+        seq = itertools.count()
+        events = []  # (due, seq, kind, slave)
+        for slave in self.slaves:
+            # Spread the first datagrams over one interval instead of sending them all at t=0
+            heapq.heappush(events, (start + self.rng_traffic.uniform(0, self.heartbeat_interval), next(seq), 'heartbeat', slave))
+            if slave.device_type == 'light':
+                heapq.heappush(events, (start + self.rng_traffic.uniform(0, self.telemetry_interval), next(seq), 'telemetry', slave))
+        if self.locks and self.tap_rate > 0:
+            heapq.heappush(events, (start + self._next_tap_delay(), next(seq), 'tap', None))
+        while True:
+            now = time.monotonic()
+            if now >= end and not any(self.pending.values()):
+                break
+            if now >= end + self.response_timeout:
+                break
+            next_due = events[0][0] if events and now < end else now + 0.05
+            timeout = max(0.0, min(next_due, now + 0.05) - now)
+            for key, _ in self.selector.select(timeout):
+                slave = key.data
+                while True:
+                    try:
+                        data, _ = slave.sock.recvfrom(1024)
+                    except (BlockingIOError, ConnectionResetError):
+                        break
+                    slave.on_datagram(data)
+            now = time.monotonic()
+            while events and events[0][0] <= now and now < end:
+                due, _, kind, slave = heapq.heappop(events)
+                if kind == 'telemetry':
+                    slave.send_telemetry()
+                    heapq.heappush(events, (due + self._jittered(self.telemetry_interval), next(seq), kind, slave))
+                elif kind == 'heartbeat':
+                    slave.send_heartbeat()
+                    heapq.heappush(events, (due + self._jittered(self.heartbeat_interval), next(seq), kind, slave))
+                else:
+                    taps = self.burst_size if self.tap_pattern == 'burst' else 1
+                    for _ in range(taps):
+                        lock = self.rng_traffic.choice(self.locks)
+                        lock.tap(self.rng_traffic.choice(self.uids))
+                    heapq.heappush(events, (due + self._next_tap_delay(), next(seq), kind, None))
+            self._expire_taps(now)
+        self._expire_taps(float('inf'))
+        return self.report(time.monotonic() - start)
+
+    def close(self):
+        for slave in self.slaves:
+            self.selector.unregister(slave.sock)
+            slave.sock.close()
+        self.selector.close()
+
+    def report(self, elapsed):
+        all_latencies = sorted(l for ls in self.latencies.values() for l in ls)
+        per_lock = {}
+        for name, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            per_lock[name] = {
+                "taps_answered": len(values),
+                "p50_ms": 1000 * percentile(values, 50),
+                "p95_ms": 1000 * percentile(values, 95),
+                "p99_ms": 1000 * percentile(values, 99),
+            }
+        summary = {
+            "elapsed_s": elapsed,
+            "devices": len(self.slaves),
+            "counters": dict(sorted(self.counters.items())),
+            "outcomes": self.outcomes,
+            # Delivered taps that got no command back (dropped or refused silently by the master,
+            # or whose answer was lost on the way back)
+            "master_unanswered": self.outcomes['timeout'],
+            "unlock_latency_ms": {
+                "count": len(all_latencies),
+                "p50": 1000 * percentile(all_latencies, 50) if all_latencies else None,
+                "p95": 1000 * percentile(all_latencies, 95) if all_latencies else None,
+                "p99": 1000 * percentile(all_latencies, 99) if all_latencies else None,
+                "max": 1000 * all_latencies[-1] if all_latencies else None,
+            },
+            "per_lock": per_lock,
+        }
+        return summary
+
+
+def print_report(summary):
+    print(f"[SIM] {summary['devices']} devices, {summary['elapsed_s']:.1f}s")
+    for key, value in summary['counters'].items():
+        print(f"[SIM]   {key:<20} {value}")
+    o = summary['outcomes']
+    print(f"[SIM] Taps: {o['UNLOCK']} unlocked, {o['LOCK']} refused, {o['timeout']} delivered but unanswered, "
+          f"{summary['counters'].get('tap_lost', 0)} dropped by the simulator")
+    lat = summary['unlock_latency_ms']
+    if lat['count']:
+        print(f"[SIM] Tap -> command latency: p50 {lat['p50']:.1f} ms, p95 {lat['p95']:.1f} ms, "
+              f"p99 {lat['p99']:.1f} ms, max {lat['max']:.1f} ms (n={lat['count']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate light/lock slaves against the master over localhost UDP.")
+    parser.add_argument('--lights', type=int, default=2)
+    parser.add_argument('--locks', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds of traffic")
+    parser.add_argument('--master-host', default='127.0.0.1')
+    parser.add_argument('--master-port', type=int, default=4210)
+    parser.add_argument('--heartbeat-port', type=int, default=4220)
+    parser.add_argument('--slave-port', type=int, default=4310, help="port every simulated slave listens on")
+    parser.add_argument('--ip-prefix', default='127.1.')
+    parser.add_argument('--telemetry-interval', type=float, default=0.5)
+    parser.add_argument('--heartbeat-interval', type=float, default=0.5)
+    parser.add_argument('--jitter', type=float, default=0.1, help="+/- fraction of each interval")
+    parser.add_argument('--loss', type=float, default=0.0, help="probability of dropping any datagram")
+    parser.add_argument('--tap-rate', type=float, default=1.0, help="RFID taps per second across the fleet")
+    parser.add_argument('--tap-pattern', choices=('poisson', 'periodic', 'burst'), default='poisson')
+    parser.add_argument('--burst-size', type=int, default=5)
+    parser.add_argument('--uid', action='append', default=[], help="UID to tap with (repeatable)")
+    parser.add_argument('--uid-file', help="file with one UID per line")
+    parser.add_argument('--response-timeout', type=float, default=2.0)
+    parser.add_argument('--lights-off', action='store_true', help="start lights OFF (no telemetry until ON)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--write-config', help="write a config.json for this fleet and exit")
+    parser.add_argument('--json', help="also write the report to this file")
+    args = parser.parse_args()
+
+    uids = list(args.uid)
+    if args.uid_file:
+        with open(args.uid_file, 'r', encoding='utf-8') as f:
+            uids += [line.strip() for line in f if line.strip()]
+    sim = FleetSimulator(
+        lights=args.lights, locks=args.locks, master_host=args.master_host, master_port=args.master_port,
+        heartbeat_port=args.heartbeat_port, slave_port=args.slave_port, ip_prefix=args.ip_prefix,
+        telemetry_interval=args.telemetry_interval, heartbeat_interval=args.heartbeat_interval,
+        jitter=args.jitter, loss=args.loss, tap_rate=args.tap_rate, tap_pattern=args.tap_pattern,
+        burst_size=args.burst_size, uids=uids or None, response_timeout=args.response_timeout,
+        lights_on=not args.lights_off, seed=args.seed,
+    )
+    try:
+        if args.write_config:
+            with open(args.write_config, 'w', encoding='utf-8') as f:
+                json.dump({"devices": sim.device_table()}, f, indent=2)
+            print(f"[SIM] Wrote {len(sim.slaves)} devices to {args.write_config}")
+            return
+        print(f"[SIM] Running {len(sim.slaves)} slaves for {args.duration:.0f}s against {args.master_host}:{args.master_port}")
+        summary = sim.run(args.duration)
+    finally:
+        sim.close()
+    print_report(summary)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""MySQL connection pool: instrumented wrapper and a lazily connecting engine around it."""
+import threading
+import time
+import mysql.connector
+from mysql.connector import pooling
+from mysql.connector.errors import PoolError
+from .metrics import get_metrics
+
+metrics = get_metrics()
+
+
+class PooledConnection:
+    """Proxy for a pooled connection that gives the pool slot back exactly once on close()."""
+
+    def __init__(self, pool, cnx, acquired_at):
+        self._pool = pool
+        self._cnx = cnx
+        self._acquired_at = acquired_at
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._cnx, name)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._pool._release(self._cnx, self._acquired_at)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class InstrumentedPool:
+    """
+    MySQLConnectionPool with blocking acquire, stale-connection pre-ping and metrics.
+
+    mysql-connector's pool raises PoolError at once when exhausted; here callers
+    wait up to acquire_timeout seconds for a slot instead. A connection idle for
+    more than ping_interval seconds is pinged (with reconnect) before it is
+    handed out.
+    """
+
+    def __init__(self, pool_name="mypool", pool_size=5, acquire_timeout=2.0, ping_interval=30.0, **db_config):
+        self.pool_size = pool_size
+        self.acquire_timeout = acquire_timeout
+        self.ping_interval = ping_interval
+        self._pool = mysql.connector.pooling.MySQLConnectionPool(pool_name=pool_name, pool_size=pool_size, **db_config)
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+        self._last_used = {}  # id(raw connection) -> time.monotonic() when returned
+        # Metrics
+        self.acquired = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.reconnects = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.hold_total = 0.0
+
+    def get_connection(self, timeout=None):
+        """Acquire a connection, waiting up to timeout (default acquire_timeout) seconds for a free slot."""
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.acquire_timeout if timeout is None else timeout):
+            with self._lock:
+                self.timeouts += 1
+            metrics.inc("db_pool_timeouts_total")
+            raise PoolError(f"No connection available within {self.acquire_timeout if timeout is None else timeout}s (pool size {self.pool_size})")
+        try:
+            cnx = self._pool.get_connection()
+            raw = getattr(cnx, '_cnx', cnx)
+            idle_since = self._last_used.get(id(raw))
+            if idle_since is None or time.monotonic() - idle_since > self.ping_interval:
+                if not raw.is_connected():
+                    with self._lock:
+                        self.reconnects += 1
+                cnx.ping(reconnect=True, attempts=2, delay=0)
+        except Exception:
+            self._slots.release()
+            with self._lock:
+                self.errors += 1
+            raise
+        acquired_at = time.monotonic()
+        waited = acquired_at - start
+        with self._lock:
+            self.acquired += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        metrics.observe("db_pool_wait_seconds", waited)
+        return PooledConnection(self, cnx, acquired_at)
+
+    def _release(self, cnx, acquired_at):
+        now = time.monotonic()
+        try:
+            self._last_used[id(getattr(cnx, '_cnx', cnx))] = now
+            cnx.close()  # returns it to the mysql-connector pool
+        except Exception:
+            with self._lock:
+                self.errors += 1
+        finally:
+            with self._lock:
+                self.in_use -= 1
+                self.hold_total += now - acquired_at
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pool_size": self.pool_size,
+                "in_use": self.in_use,
+                "max_in_use": self.max_in_use,
+                "acquired": self.acquired,
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+                "reconnects": self.reconnects,
+                "wait_avg_ms": 1000 * self.wait_total / self.acquired if self.acquired else 0.0,
+                "wait_max_ms": 1000 * self.wait_max,
+                "hold_avg_ms": 1000 * self.hold_total / self.acquired if self.acquired else 0.0,
+            }
+
+
+class DatabaseEngine:
+    """
+    Lazily created InstrumentedPool.
+
+    Nothing connects at construction time. warm_up() opens the pool on a
+    background thread (retrying every retry_interval seconds while MySQL is
+    down) and runs the on_ready callbacks once it is up. get_connection()
+    before that point waits up to the acquire timeout for the first warm-up
+    attempt, or connects synchronously if no warm-up was started; once the
+    database is known to be down it fails fast with PoolError instead of
+    blocking the caller on a connect timeout.
+    """
+
+    def __init__(self, db_config, pool_config=None, pool_name="mypool", retry_interval=5.0):
+        self.db_config = db_config
+        self.pool_config = dict(pool_config or {})
+        self.pool_name = pool_name
+        self.retry_interval = retry_interval
+        self.pool = None
+        self.last_error = None
+        self._retry_at = 0.0
+        self._connect_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._on_ready = []
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def is_ready(self):
+        return self.pool is not None
+
+    def wait_ready(self, timeout=None):
+        """Block until the pool is open; returns False on timeout."""
+        return self._ready.wait(timeout)
+
+    def add_ready_callback(self, callback):
+        """Run callback() once the pool is open (immediately if it already is)."""
+        with self._connect_lock:
+            if self.pool is None:
+                self._on_ready.append(callback)
+                return
+        self._run_callback(callback)
+
+    def _run_callback(self, callback):
+        try:
+            callback()
+        except Exception as e:
+            print(f"[DB] Ready callback failed: {e}")
+
+    def _connect(self):
+        """Open the pool if it is not open yet and no retry backoff is pending."""
+        with self._connect_lock:
+            if self.pool is not None:
+                return True
+            if time.monotonic() < self._retry_at:
+                return False
+            start = time.monotonic()
+            try:
+                pool = InstrumentedPool(pool_name=self.pool_name, **self.pool_config, **self.db_config)
+            except Exception as e:
+                self.last_error = e
+                self._retry_at = time.monotonic() + self.retry_interval
+                print(f"[DB] Connect failed: {e}. Retrying in {self.retry_interval:.0f}s.")
+                return False
+            self.pool = pool
+            callbacks, self._on_ready = self._on_ready, []
+            print(f"[DB] Connection pool ready ({pool.pool_size} connections, {1000 * (time.monotonic() - start):.0f} ms)")
+        for callback in callbacks:
+            self._run_callback(callback)
+        self._ready.set()
+        return True
+
+    def warm_up(self):
+        """Open the pool on a background thread (idempotent)."""
+        if self.pool is not None or (self._thread and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._warm_up_loop, daemon=True)
+        self._thread.start()
+
+    def _warm_up_loop(self):
+        while not self._stop_event.is_set() and not self._connect():
+            self._stop_event.wait(max(0.0, self._retry_at - time.monotonic()))
+
+    def stop(self):
+        self._stop_event.set()
+
+    def get_connection(self, timeout=None):
+        pool = self.pool
+        if pool is None:
+            if self._thread and self._thread.is_alive():
+                if self.last_error is None:  # first connect attempt still running
+                    self._ready.wait(self.pool_config.get("acquire_timeout", 2.0) if timeout is None else timeout)
+            else:
+                self._connect()
+            pool = self.pool
+            if pool is None:
+                raise PoolError(f"Database not available: {self.last_error or 'still connecting'}")
+        return pool.get_connection(timeout)
+
+    def stats(self):
+        if self.pool is None:
+            return {"ready": False, "last_error": str(self.last_error) if self.last_error else None}
+        return {"ready": True, **self.pool.stats()}
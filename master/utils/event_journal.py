@@ -0,0 +1,485 @@
+"""Rotating JSONL event journal with a sparse time index, for received datagrams and sent commands."""
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+
+# MASTER_JOURNAL_DIR moves the journals (one sub-directory per process: server, hmi)
+JOURNAL_DIR = os.environ.get("MASTER_JOURNAL_DIR") or os.path.join(os.path.dirname(__file__), "..", "..", "journal")
+
+SEGMENT_GLOB = "events-*.jsonl"
+
+
+def _index_path(segment):
+    return segment[:-len(".jsonl")] + ".idx"
+
+
+def _summary_path(segment):
+    return segment[:-len(".jsonl")] + ".summary.json"
+
+
+def _latest_keys(event):
+    """Keys under which an event is remembered as the latest: (type, device), and ('uid', device) for UID reads."""
+    device = event.get("device")
+    keys = [(event.get("type"), device)]
+    if event.get("uid"):
+        keys.append(("uid", device))
+    return keys
+
+
+def _needles(type, device):
+    """Byte patterns every matching line contains (the writer emits compact JSON), checked before decoding."""
+    fields = {}
+    if type is not None:
+        fields["type"] = type
+    if device is not None:
+        fields["device"] = device
+    return [json.dumps({k: v}, separators=(",", ":"))[1:-1].encode() for k, v in fields.items()]
+
+
+def _line_ts(line):
+    """The ts field of a record line (always written first), without decoding the rest."""
+    if line.startswith(b'{"ts":'):
+        try:
+            return float(line[6:line.index(b",")])
+        except ValueError:
+            pass
+    return None
+
+
+def _summary(first_ts, last_ts, count, devices, latest):
+    """Summary written next to a closed segment; latest is {(type, device): event}."""
+    return {
+        "first_ts": first_ts,
+        "last_ts": last_ts,
+        "count": count,
+        "devices": sorted(d for d in devices if d is not None),
+        "latest": [[kind, device, event] for (kind, device), event in latest.items()],
+    }
+
+
+def _pid_alive(pid):
+    """Whether a process with this pid is running (a reused pid reads as alive, which is the safe answer here)."""
+    if os.name == "nt":
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        kernel32.CloseHandle(handle)
+        return code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _segment_pid(segment):
+    """Writer pid from an events-<start>-<pid>-<seq>.jsonl name, or None."""
+    try:
+        return int(os.path.basename(segment)[:-len(".jsonl")].split("-")[-2])
+    except (IndexError, ValueError):
+        return None
+
+
+def message_event(msg, **extra):
+    """
+    Journal fields for a SlaveMessage received from a slave. ts is the receive
+    time (msg.received_at on the wall clock), so events queued before being
+    journaled keep their arrival order; EventJournal.append never lets it go back.
+    """
+    ts = time.time() - (time.monotonic() - msg.received_at)
+    event = {"ts": ts, "type": "recv", "device": msg.device_id, "kind": msg.kind, "raw": msg.raw}
+    if msg.addr:
+        event["ip"], event["port"] = msg.addr[0], msg.addr[1]
+    for field in ("state", "lux", "pwm", "ldr", "uid"):
+        value = getattr(msg, field)
+        if value is not None:
+            event[field] = value
+    event.update(extra)
+    return event
+
+
+class JournalReader:
+    """
+    Read side of a journal directory; safe to use from another process while
+    the writer appends.
+
+    Segments are events-<start>-<pid>-<seq>.jsonl, <start> in UTC, and ts
+    never decreases within a segment. Each has a sparse index
+    (<segment>.idx, one "ts offset" line every index_every bytes) and, once
+    closed by rotation, a summary (time range, devices, latest event per
+    device) so closed segments are never rescanned.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, SEGMENT_GLOB)))
+
+    @staticmethod
+    def load_summary(segment):
+        try:
+            with open(_summary_path(segment), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def load_index(segment):
+        """[(ts, offset)] from the segment's sparse index."""
+        entries = []
+        try:
+            with open(_index_path(segment), "r", encoding="utf-8") as f:
+                for line in f:
+                    ts, _, offset = line.partition(" ")
+                    try:
+                        entries.append((float(ts), int(offset)))
+                    except ValueError:
+                        break  # partial last line
+        except OSError:
+            pass
+        return entries
+
+    @staticmethod
+    def _matches(event, type, device):
+        return (type is None or event.get("type") == type) and (device is None or event.get("device") == device)
+
+    @staticmethod
+    def _decode(line):
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None  # partial line being written, or damaged
+
+    def _read_backwards(self, segment, block_size=16384):
+        """Yield the segment's complete lines, last first, reading fixed-size blocks from the end."""
+        try:
+            f = open(segment, "rb")
+        except OSError:
+            return
+        with f:
+            end = f.seek(0, os.SEEK_END)
+            buffer = b""
+            while end > 0:
+                start = max(0, end - block_size)
+                f.seek(start)
+                buffer = f.read(end - start) + buffer
+                end = start
+                lines = buffer.split(b"\n")
+                buffer = lines.pop(0)  # may continue in the previous block
+                for line in reversed(lines):
+                    if line:
+                        yield line
+            if buffer:
+                yield buffer
+
+    def tail(self, n=50, type=None, device=None):
+        """Last n matching events, oldest first. Cost depends on n, not on the size of the journal."""
+        found = []
+        needles = _needles(type, device)
+        for segment in reversed(self.segments()):
+            if device is not None:
+                summary = self.load_summary(segment)
+                if summary is not None and device not in summary["devices"]:
+                    continue
+            for line in self._read_backwards(segment):
+                if not all(needle in line for needle in needles):
+                    continue
+                event = self._decode(line)
+                if event is not None and self._matches(event, type, device):
+                    found.append(event)
+                    if len(found) >= n:
+                        return found[::-1]
+        return found[::-1]
+
+    def read(self, since=None, until=None, type=None, device=None):
+        """Matching events with since <= ts < until (epoch seconds), in order; seeks with the sparse index."""
+        needles = _needles(type, device)
+        for segment in self.segments():
+            summary = self.load_summary(segment)
+            if summary is not None:
+                if since is not None and summary["last_ts"] < since:
+                    continue
+                if until is not None and summary["first_ts"] >= until:
+                    continue  # another writer's segments may start earlier, so do not stop here
+                if device is not None and device not in summary["devices"]:
+                    continue
+            offset = 0
+            if since is not None:
+                # Last index point strictly before since: every line before it is older than since
+                index = self.load_index(segment)
+                i = bisect.bisect_left(index, (since, float("-inf"))) - 1
+                if i >= 0:
+                    offset = index[i][1]
+            try:
+                f = open(segment, "rb")
+            except OSError:
+                continue
+            with f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # still being written
+                    ts = _line_ts(line)
+                    if ts is not None:
+                        if since is not None and ts < since:
+                            continue
+                        if until is not None and ts >= until:
+                            break  # ts is ordered within a segment
+                    if not all(needle in line for needle in needles):
+                        continue
+                    event = self._decode(line)
+                    if event is None:
+                        continue
+                    ts = event.get("ts", 0.0)
+                    if since is not None and ts < since:
+                        continue
+                    if until is not None and ts >= until:
+                        break
+                    if self._matches(event, type, device):
+                        yield event
+
+    def latest(self):
+        """{(type, device): event} over the whole journal: closed segments from their summaries, open ones scanned."""
+        latest = {}
+        for segment in self.segments():
+            summary = self.load_summary(segment)
+            if summary is not None:
+                for kind, device, event in summary["latest"]:
+                    latest[(kind, device)] = event
+                continue
+            for event in self.read_segment(segment):
+                for key in _latest_keys(event):
+                    latest[key] = event
+        return latest
+
+    def read_segment(self, segment):
+        try:
+            f = open(segment, "rb")
+        except OSError:
+            return
+        with f:
+            for line in f:
+                if line.endswith(b"\n"):
+                    event = self._decode(line)
+                    if event is not None:
+                        yield event
+
+
+class EventJournal(JournalReader):
+    """
+    Append-only writer for one journal directory.
+
+    Each event is stamped at append time and ts never goes backwards, even if
+    the wall clock does, so the sparse index can be used for seeking. Segments
+    still being written by another live process are left alone.
+
+    A segment is closed and a new one opened when it reaches max_segment_bytes
+    or is older than max_segment_age seconds; only the newest keep_segments
+    are kept. Writes are buffered and flushed every flush_interval seconds by
+    a daemon thread, so readers see events at most that late. The latest event
+    per (type, device) and the latest UID per lock are kept in memory.
+    """
+
+    def __init__(self, directory, max_segment_bytes=8 * 1024 * 1024, max_segment_age=86400.0,
+                 keep_segments=30, index_every=64 * 1024, flush_interval=0.5):
+        super().__init__(directory)
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age = max_segment_age
+        self.keep_segments = keep_segments
+        self.index_every = index_every
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._clock = 0.0  # last ts stamped
+        self._file = None
+        self._index = None
+        self._segment = None
+        self._segment_started = 0.0
+        self._size = 0
+        self._next_index_at = 0
+        self._first_ts = None
+        self._last_ts = None
+        self._count = 0
+        self._devices = set()
+        self._segment_latest = {}
+        self._dirty = False
+        self._flusher = None
+        self._stop_event = threading.Event()
+        self.appended = 0
+        self.rotations = 0
+        os.makedirs(directory, exist_ok=True)
+        self._summarize_unclosed()
+        self._latest = self.latest()  # recovered from the segment summaries
+
+    # --- Writing ---
+
+    def append(self, type, device=None, ts=None, **fields):
+        """Record one event, stamped now (or at ts, e.g. for imports) but never before the previous one; returns it."""
+        with self._lock:
+            self._clock = round(max(ts or time.time(), self._clock), 6)
+            event = {"ts": self._clock, "type": type, "device": device, **fields}
+            line = (json.dumps(event, separators=(",", ":"), default=str) + "\n").encode()
+            if self._file is None or self._size >= self.max_segment_bytes or \
+                    event["ts"] - self._segment_started >= self.max_segment_age:
+                self._rotate(event["ts"])
+            if self._size >= self._next_index_at:
+                self._index.write(f"{event['ts']} {self._size}\n")
+                self._next_index_at = self._size + self.index_every
+            self._file.write(line)
+            self._size += len(line)
+            if self._first_ts is None:
+                self._first_ts = event["ts"]
+            self._last_ts = event["ts"]
+            self._count += 1
+            self._devices.add(device)
+            for key in _latest_keys(event):
+                self._latest[key] = event
+                self._segment_latest[key] = event
+            self._dirty = True
+            self.appended += 1
+        self._start_flusher()
+        return event
+
+    def _rotate(self, ts):
+        self._close_segment()
+        self._seq += 1
+        name = time.strftime("%Y%m%d-%H%M%S", time.gmtime(ts))  # UTC: names sort the same across DST changes
+        self._segment = os.path.join(self.directory, f"events-{name}-{os.getpid()}-{self._seq:06d}.jsonl")
+        self._file = open(self._segment, "ab")
+        self._index = open(_index_path(self._segment), "a", encoding="utf-8")
+        self._segment_started = ts
+        self._size = self._file.tell()
+        self._next_index_at = self._size
+        self._first_ts = self._last_ts = None
+        self._count = 0
+        self._devices = set()
+        self._segment_latest = {}
+        self.rotations += 1
+        for old in self.segments()[:-self.keep_segments]:
+            for path in (old, _index_path(old), _summary_path(old)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _close_segment(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._index.close()
+        if self._count:
+            self._write_summary(self._segment, _summary(self._first_ts, self._last_ts, self._count,
+                                                        self._devices, self._segment_latest))
+        self._file = self._index = None
+
+    @staticmethod
+    def _write_summary(segment, summary):
+        with open(_summary_path(segment), "w", encoding="utf-8") as f:
+            json.dump(summary, f, default=str)
+
+    def _summarize_unclosed(self):
+        """Close out segments left open by a previous run (it stopped without rotating) with a summary."""
+        for segment in self.segments():
+            if os.path.exists(_summary_path(segment)):
+                continue
+            pid = _segment_pid(segment)
+            if pid is not None and pid != os.getpid() and _pid_alive(pid):
+                continue  # still being appended to by another writer; a summary now would go stale
+            first_ts = last_ts = None
+            count = 0
+            devices = set()
+            latest = {}
+            for event in self.read_segment(segment):
+                ts = event.get("ts")
+                first_ts = ts if first_ts is None else first_ts
+                last_ts = ts
+                count += 1
+                devices.add(event.get("device"))
+                for key in _latest_keys(event):
+                    latest[key] = event
+            if count:
+                self._write_summary(segment, _summary(first_ts, last_ts, count, devices, latest))
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None and self._dirty:
+                self._file.flush()
+                self._index.flush()
+                self._dirty = False
+
+    def close(self):
+        self._stop_event.set()
+        with self._lock:
+            self._close_segment()
+
+    def _start_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[JOURNAL] Flush failed: {e}")
+
+    # --- Reading (the writer's own view is always current) ---
+
+    def tail(self, n=50, type=None, device=None):
+        self.flush()
+        return super().tail(n, type, device)
+
+    def read(self, since=None, until=None, type=None, device=None):
+        self.flush()
+        return super().read(since, until, type, device)
+
+    def latest_event(self, type, device):
+        return self._latest.get((type, device))
+
+    def latest_uids(self):
+        """{lock_id: latest UID read by that lock}, from memory."""
+        return {device: event["uid"] for (kind, device), event in list(self._latest.items()) if kind == "uid"}
+
+    def stats(self):
+        return {
+            "segment": os.path.basename(self._segment) if self._segment else None,
+            "segment_bytes": self._size,
+            "segments": len(self.segments()),
+            "appended": self.appended,
+            "rotations": self.rotations,
+        }
+
+
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def get_journal(name="server"):
+    """Process-wide journal writer for JOURNAL_DIR/<name>."""
+    journal = _journals.get(name)
+    if journal is None:
+        with _journals_lock:
+            journal = _journals.get(name)
+            if journal is None:
+                journal = _journals[name] = EventJournal(os.path.join(JOURNAL_DIR, name))
+    return journal
+
+
+def get_reader(name="server"):
+    """Read-only view of another process's journal (e.g. the HMI reading the server's)."""
+    return JournalReader(os.path.join(JOURNAL_DIR, name))
@@ -5,8 +5,9 @@ def get_nim_for_reservations(reservations):
     """Given a list of reservation dicts (with user_id as RFID UID), fetches the NIM for each reservation from the users table."""
     if not reservations:
         return []
+    connection = get_connection()
+    cursor = None
     try:
-        connection = get_connection()
         cursor = connection.cursor(dictionary=True)
         # Build a map from user_id (rfid_UID) to NIM
         user_ids = tuple(set(r['user_id'] for r in reservations if r.get('user_id')))
@@ -22,5 +23,6 @@ def get_nim_for_reservations(reservations):
             r['nim'] = nim_map.get(r['user_id'])
         return reservations
     finally:
-        cursor.close()
+        if cursor is not None:
+            cursor.close()
         connection.close()
@@ -0,0 +1,130 @@
+"""Write-behind writer that batches log rows into multi-row INSERTs off the caller's thread."""
+import queue
+import threading
+import time
+
+LOG_COLUMNS = "(log_time, device, log_type, state, value1, value2, value3, raw_message)"
+
+_WAKE = object()  # queued by stop() so the writer does not sit out the rest of flush_interval
+
+
+class BatchedLogWriter:
+    """
+    Buffers parsed log rows in a bounded queue and flushes them with executemany
+    once batch_size rows are waiting or flush_interval seconds have passed.
+
+    submit() never blocks: when the queue is full the row is dropped and counted,
+    so a MySQL stall cannot freeze the caller (the Tk main thread).
+    """
+
+    def __init__(self, connection_factory, ensure_tables=None, is_ready=None, max_queue=10000, batch_size=200, flush_interval=1.0):
+        self.connection_factory = connection_factory
+        self.ensure_tables = ensure_tables
+        self.is_ready = is_ready  # optional function() -> bool; rows stay queued while it is False
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._tables_ready = False
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        # Counters
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0       # rejected because the queue was full
+        self.failed = 0        # lost because the flush to MySQL failed
+        self.flushes = 0
+
+    def submit(self, table, row):
+        """Queue one row for table; returns False if it was dropped."""
+        self.start()
+        try:
+            self._queue.put_nowait((table, row))
+            self.submitted += 1
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "submitted": self.submitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "flushes": self.flushes,
+        }
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=2.0):
+        """Stop the writer after flushing what is already queued."""
+        self._stop_event.set()
+        if self._thread is not None:
+            try:
+                self._queue.put_nowait(_WAKE)
+            except queue.Full:
+                pass  # a full queue wakes the writer anyway
+            self._thread.join(timeout=timeout)
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            stopping = self._stop_event.is_set()
+            if self.is_ready is not None and not stopping and not batch and not self.is_ready():
+                # Database not connected yet: leave rows in the bounded queue
+                self._stop_event.wait(self.flush_interval)
+                continue
+            try:
+                batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                # Drain whatever else is already waiting, up to the batch size
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if _WAKE in batch:
+                batch = [item for item in batch if item is not _WAKE]
+                stopping = True
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline or stopping):
+                self._flush(batch)
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+            if stopping and self._queue.empty() and not batch:
+                return
+
+    def _flush(self, batch):
+        by_table = {}
+        for table, row in batch:
+            by_table.setdefault(table, []).append(row)
+        try:
+            if not self._tables_ready and self.ensure_tables:
+                self.ensure_tables()
+                self._tables_ready = True
+            connection = self.connection_factory()
+            try:
+                cursor = connection.cursor()
+                try:
+                    for table, rows in by_table.items():
+                        cursor.executemany(
+                            f"INSERT INTO {table} {LOG_COLUMNS} VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                            rows
+                        )
+                    connection.commit()
+                finally:
+                    cursor.close()
+            finally:
+                connection.close()
+            self.written += len(batch)
+            self.flushes += 1
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"[LOG_WRITER] Failed to flush {len(batch)} log rows: {e}")
@@ -0,0 +1,102 @@
+"""Single-pass parser for slave datagrams."""
+import re
+import time
+
+KIND_LIGHT = "light"
+KIND_LOCK = "lock"
+KIND_HEARTBEAT = "heartbeat"
+KIND_UNKNOWN = "unknown"
+
+_LOCK_STATES = (b"LOCKED", b"UNLOCKED")
+
+# "From ('IP', PORT): CONTENT", as shown in the HMI's incoming log
+LOGGED_MESSAGE_RE = re.compile(r"From \('([\d.]+)', (\d+)\): (.*)$")
+
+
+class SlaveMessage:
+    """
+    One decoded slave datagram.
+
+    light_208:OFF:9.6:0:557         -> kind=light, state, lux, pwm, ldr
+    lock_207:04:47:43:12:7A:6A:80   -> kind=lock, uid
+    lock_207:UNLOCKED               -> kind=lock, state
+    light_207:HEARTBEAT             -> kind=heartbeat
+    """
+    __slots__ = ("device_id", "kind", "state", "lux", "pwm", "ldr", "uid", "raw", "addr", "received_at")
+
+    def __init__(self, device_id, kind, raw, addr=None, state=None, lux=None, pwm=None, ldr=None, uid=None):
+        self.device_id = device_id
+        self.kind = kind
+        self.state = state
+        self.lux = lux
+        self.pwm = pwm
+        self.ldr = ldr
+        self.uid = uid
+        self.raw = raw      # decoded, stripped payload text (for logs)
+        self.addr = addr    # (ip, port) of the sender, if known
+        self.received_at = time.monotonic()  # parse time, taken as the receive time for tap latency
+
+    @property
+    def ip(self):
+        return self.addr[0] if self.addr else None
+
+    @property
+    def is_uid(self):
+        return self.uid is not None
+
+    def __repr__(self):
+        return f"SlaveMessage({self.raw!r} from {self.addr})"
+
+
+def _num(field, cast):
+    try:
+        return cast(field)
+    except ValueError:
+        return None
+
+
+def parse_datagram(data, addr=None):
+    """
+    Parse a raw datagram (bytes, bytearray or memoryview) exactly once.
+
+    Returns a SlaveMessage, or None if there is no "device:payload" structure.
+    Numeric fields are converted straight from the bytes (int()/float() accept
+    ASCII bytes), so only the fields that are kept are ever decoded to str.
+    """
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    data = bytes(data).strip()
+    head, sep, rest = data.partition(b":")
+    if not sep or not head:
+        return None
+    device_id = head.decode("ascii", errors="replace")
+    raw = data.decode(errors="replace")
+    if rest == b"HEARTBEAT":
+        return SlaveMessage(device_id, KIND_HEARTBEAT, raw, addr, state="HEARTBEAT")
+    if head.startswith(b"light"):
+        fields = rest.split(b":")
+        msg = SlaveMessage(device_id, KIND_LIGHT, raw, addr, state=fields[0].decode(errors="replace"))
+        if len(fields) >= 3:
+            msg.lux = _num(fields[1], float)
+            msg.pwm = _num(fields[2], int)
+        if len(fields) >= 4:
+            msg.ldr = _num(fields[3], int)
+        return msg
+    if head.startswith(b"lock"):
+        if rest in _LOCK_STATES:
+            return SlaveMessage(device_id, KIND_LOCK, raw, addr, state=rest.decode())
+        return SlaveMessage(device_id, KIND_LOCK, raw, addr, uid=rest.strip().decode(errors="replace"))
+    return SlaveMessage(device_id, KIND_UNKNOWN, raw, addr, state=rest.decode(errors="replace"))
+
+
+def parse_text(message, addr=None):
+    """Parse an already-decoded message string."""
+    return parse_datagram(message.encode(errors="replace"), addr)
+
+
+def parse_logged_line(line):
+    """Parse a "From ('IP', PORT): CONTENT" log line, or a bare message without a source."""
+    m = LOGGED_MESSAGE_RE.search(line)
+    if m:
+        return parse_text(m.group(3), (m.group(1), int(m.group(2))))
+    return parse_text(line)
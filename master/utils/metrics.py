@@ -0,0 +1,331 @@
+"""Counters, histograms and spans for the master's hot paths, with a local Prometheus/JSON endpoint."""
+import bisect
+import collections
+import contextvars
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds; covers a cached lookup (sub-ms) up to a stalled DB or OPC write
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Innermost open span, per thread and per asyncio task
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# MASTER_METRICS_PORT enables metrics and serves them on 127.0.0.1:<port>
+METRICS_PORT_ENV = "MASTER_METRICS_PORT"
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in items) + "}"
+
+
+class Counter:
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.kind = "counter"
+        self._values = {}  # label key -> value
+
+    def inc(self, key, amount):
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        return [(self.name, key, value) for key, value in self._values.items()]
+
+    def to_dict(self):
+        return {_format_labels(key) or "": value for key, value in self._values.items()}
+
+
+class Histogram:
+    def __init__(self, name, help="", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.kind = "histogram"
+        self.buckets = tuple(buckets)
+        self._values = {}  # label key -> [bucket counts..., +Inf count, sum, max]
+
+    def observe(self, key, value):
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0.0]
+        entry[bisect.bisect_left(self.buckets, value)] += 1
+        entry[-2] += value
+        if value > entry[-1]:
+            entry[-1] = value
+
+    def samples(self):
+        out = []
+        n = len(self.buckets)
+        for key, entry in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                out.append((f"{self.name}_bucket", key + (("le", bound),), cumulative))
+            count = cumulative + entry[n]
+            out.append((f"{self.name}_bucket", key + (("le", "+Inf"),), count))
+            out.append((f"{self.name}_sum", key, entry[-2]))
+            out.append((f"{self.name}_count", key, count))
+        return out
+
+    def quantile(self, entry, q):
+        """Upper bucket bound below which a fraction q of the observations fall."""
+        total = sum(entry[:-2])
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        for bound, count in zip(self.buckets, entry):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, entry[-1])
+        return entry[-1]
+
+    def to_dict(self):
+        out = {}
+        for key, entry in self._values.items():
+            count = sum(entry[:-2])
+            out[_format_labels(key) or ""] = {
+                "count": count,
+                "sum": entry[-2],
+                "avg": entry[-2] / count if count else 0.0,
+                "max": entry[-1],
+                "p50": self.quantile(entry, 0.50),
+                "p95": self.quantile(entry, 0.95),
+                "p99": self.quantile(entry, 0.99),
+            }
+        return out
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """Times a block into the histogram <name>_seconds and records it in the recent-span trace."""
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.parent = None
+        self.start = 0.0
+        self._token = None
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.parent = parent.name if parent else None
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        _current_span.reset(self._token)
+        self.metrics.observe(f"{self.name}_seconds", duration, **self.labels)
+        if exc_type is not None:
+            self.metrics.inc(f"{self.name}_errors_total", **self.labels)
+        self.metrics._spans.append({
+            "name": self.name,
+            "labels": self.labels,
+            "parent": self.parent,
+            "at": time.time() - duration,
+            "ms": 1000 * duration,
+            "error": exc_type.__name__ if exc_type else None,
+        })
+        return False
+
+
+class MetricsRegistry:
+    """
+    Process-wide metrics. Disabled by default: inc/observe return at once and
+    span() hands out a shared no-op context manager, so instrumented code pays
+    one attribute check per call.
+
+    Metrics are created on first use and keyed by name plus keyword labels.
+    Collectors (functions returning a flat dict of numbers, e.g. the existing
+    stats() methods) are exported as gauges named <prefix>_<key>.
+    """
+
+    def __init__(self, enabled=False, span_history=1000):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._help = {}
+        self._collectors = {}
+        self._spans = collections.deque(maxlen=span_history)
+        self._server = None
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def describe(self, name, help):
+        self._help[name] = help
+
+    def _get(self, cls, name):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = self._metrics[name] = cls(name, self._help.get(name, ""))
+        return metric
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        metric = self._get(Counter, name)
+        with self._lock:
+            metric.inc(_label_key(labels), amount)
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        metric = self._get(Histogram, name)
+        with self._lock:
+            metric.observe(_label_key(labels), value)
+
+    def span(self, name, **labels):
+        """with metrics.span("db_query", query="access"): ...  (no-op while disabled)"""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, labels)
+
+    def timed(self, name, **labels):
+        """Decorator form of span()."""
+        def decorator(func):
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with Span(self, name, labels):
+                    return func(*args, **kwargs)
+            wrapper.__name__ = func.__name__
+            wrapper.__doc__ = func.__doc__
+            return wrapper
+        return decorator
+
+    def add_collector(self, prefix, func):
+        """Export func() -> {key: number} as gauges <prefix>_<key> (non-numeric values are skipped)."""
+        self._collectors[prefix] = func
+
+    def _collect(self):
+        gauges = {}
+        for prefix, func in list(self._collectors.items()):
+            try:
+                values = func()
+            except Exception as e:
+                print(f"[METRICS] Collector {prefix} failed: {e}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    gauges[f"{prefix}_{key}"] = value
+        return gauges
+
+    # --- Export ---
+
+    def to_dict(self):
+        with self._lock:
+            metrics = {name: {"type": m.kind, "values": m.to_dict()} for name, m in self._metrics.items()}
+        return {"enabled": self.enabled, "metrics": metrics, "gauges": self._collect()}
+
+    def recent_spans(self, limit=100):
+        spans = list(self._spans)
+        return spans[-limit:]
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+            samples = [(name, m.kind, m.help, m.samples()) for name, m in metrics]
+        for name, kind, help, metric_samples in samples:
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, key, value in metric_samples:
+                lines.append(f"{sample_name}{_format_labels(key)} {value}")
+        for name, value in sorted(self._collect().items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve /metrics (Prometheus text), /metrics.json and /spans on a daemon thread (idempotent)."""
+        if self._server is not None:
+            return self._server
+        self.enable()
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path == "/metrics":
+                    body, content_type = registry.to_prometheus(), "text/plain; version=0.0.4"
+                elif path == "/metrics.json":
+                    body, content_type = json.dumps(registry.to_dict(), default=str), "application/json"
+                elif path == "/spans":
+                    body, content_type = json.dumps(registry.recent_spans(), default=str), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass  # keep scrapes out of the console
+
+        try:
+            self._server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            print(f"[METRICS] Cannot serve metrics on {host}:{port}: {e}")
+            return None
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"[METRICS] Serving http://{host}:{port}/metrics")
+        return self._server
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Process-wide metrics registry; MASTER_METRICS_PORT enables it and starts the endpoint."""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = MetricsRegistry()
+                port = os.environ.get(METRICS_PORT_ENV)
+                if port:
+                    _metrics.serve(int(port))
+    return _metrics
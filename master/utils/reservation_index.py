@@ -0,0 +1,233 @@
+"""In-memory reservation index used for access decisions on the RFID hot path."""
+import bisect
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+
+def to_seconds(value):
+    """Convert a MySQL TIME value (timedelta or 'HH:MM:SS' string) to seconds since midnight."""
+    if isinstance(value, timedelta):
+        return int(value.total_seconds())
+    if hasattr(value, 'hour'):
+        return value.hour * 3600 + value.minute * 60 + value.second
+    h, m, s = (int(float(p)) for p in str(value).split(":"))
+    return h * 3600 + m * 60 + s
+
+
+def to_date_str(value):
+    """Convert a MySQL DATE value to the 'YYYY-MM-DD' key used by the index."""
+    if isinstance(value, (date, datetime)):
+        return value.strftime('%Y-%m-%d')
+    return str(value)
+
+
+class ReservationIndex:
+    """
+    Reservation index held in master memory.
+
+    Reservations are keyed by (room_id, user_id, date) with sorted (start, end)
+    intervals in seconds since midnight, next to an ip_address -> room_id map
+    built from the slave table. Only reservations from today onward are kept.
+
+    The index is refreshed incrementally: rows with a reservation_id above the
+    last seen watermark are merged in, and a full reload is done when the row
+    count shows deletions, at midnight, or every full_reload_interval seconds
+    (room_reservations has no update timestamp, so edits in place are only
+    picked up by the full reload or an explicit invalidate()).
+    """
+
+    def __init__(self, connection_factory, refresh_interval=5.0, full_reload_interval=300.0, max_staleness=30.0, on_change=None):
+        self.connection_factory = connection_factory
+        self.on_change = on_change  # optional function() called after reservations were (re)loaded
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+        self.max_staleness = max_staleness
+        self._lock = threading.Lock()
+        self._intervals = {}    # (room_id, user_id, date) -> sorted [(start, end), ...]
+        self._ip_to_room = {}   # ip_address -> room_id
+        self._user_ids = set()  # every user_id with at least one reservation
+        self._watermark = 0     # highest reservation_id merged so far
+        self._row_count = 0
+        self._loaded_date = None
+        self._last_full_reload = 0.0
+        self._last_refresh = 0.0
+        self._force_full = True
+        self.version = 0        # bumped whenever the loaded reservations change
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    # --- Lookups (no database access) ---
+
+    def is_fresh(self):
+        """True if the index has been refreshed recently enough to answer lookups."""
+        return (self._loaded_date is not None
+                and time.monotonic() - self._last_refresh <= self.max_staleness)
+
+    def get_room_id(self, ip_address):
+        """Return the room_id mapped to a slave IP, or None."""
+        return self._ip_to_room.get(ip_address)
+
+    def has_user(self, user_id):
+        """True if the user has any reservation in room_reservations."""
+        return user_id in self._user_ids
+
+    def is_access_allowed(self, user_id, ip_address, now=None):
+        """Check if a user has a reservation covering 'now' for the room behind ip_address."""
+        room_id = self._ip_to_room.get(ip_address)
+        if room_id is None:
+            return False
+        return self.is_reserved(room_id, user_id, now)
+
+    def is_reserved(self, room_id, user_id, now=None):
+        """Check if (room_id, user_id) holds a reservation covering 'now'."""
+        now = now or datetime.now()
+        intervals = self._intervals.get((room_id, user_id, now.strftime('%Y-%m-%d')))
+        if not intervals:
+            return False
+        t = now.hour * 3600 + now.minute * 60 + now.second
+        # Last interval starting at or before t; intervals are sorted by start
+        i = bisect.bisect_right(intervals, (t, float('inf'))) - 1
+        while i >= 0:
+            start, end = intervals[i]
+            if start <= t <= end:
+                return True
+            i -= 1
+        return False
+
+    def room_schedule(self, room_id, day):
+        """[(start_s, end_s, user_id), ...] reserved in room_id on 'YYYY-MM-DD', sorted by start."""
+        with self._lock:
+            intervals = self._intervals
+        return sorted(
+            (start, end, user_id)
+            for (room, user_id, d), spans in intervals.items() if room == room_id and d == day
+            for start, end in spans
+        )
+
+    def export(self, dates):
+        """(ip_to_room, user_ids, [(room_id, user_id, date, start_s, end_s), ...]) for the given 'YYYY-MM-DD' dates."""
+        with self._lock:
+            ip_to_room, user_ids, intervals = self._ip_to_room, self._user_ids, self._intervals
+        rows = [
+            (room_id, user_id, d, start, end)
+            for (room_id, user_id, d), spans in intervals.items() if d in dates
+            for start, end in spans
+        ]
+        return dict(ip_to_room), set(user_ids), rows
+
+    # --- Refresh ---
+
+    def invalidate(self):
+        """Force a full reload on the next refresh (call after editing reservations)."""
+        self._force_full = True
+
+    def refresh(self):
+        """Bring the index up to date with room_reservations and slave."""
+        today = date.today()
+        full = (self._force_full
+                or self._loaded_date != today
+                or time.monotonic() - self._last_full_reload >= self.full_reload_interval)
+        connection = self.connection_factory()
+        try:
+            cursor = connection.cursor()
+            try:
+                if full:
+                    self._full_reload(cursor, today)
+                else:
+                    self._incremental_refresh(cursor, today)
+            finally:
+                cursor.close()
+        finally:
+            connection.close()
+        self._last_refresh = time.monotonic()
+
+    def _full_reload(self, cursor, today):
+        cursor.execute("SELECT ip_address, room_id FROM slave")
+        ip_to_room = {ip: room_id for ip, room_id in cursor.fetchall()}
+        cursor.execute("SELECT DISTINCT user_id FROM room_reservations")
+        user_ids = {row[0] for row in cursor.fetchall()}
+        cursor.execute("SELECT COUNT(*), COALESCE(MAX(reservation_id), 0) FROM room_reservations")
+        row_count, watermark = cursor.fetchone()
+        cursor.execute(
+            "SELECT reservation_id, room_id, user_id, date, start_time, end_time "
+            "FROM room_reservations WHERE date >= %s AND reservation_id <= %s",
+            (today.strftime('%Y-%m-%d'), watermark)
+        )
+        intervals = {}
+        self._merge_rows(intervals, cursor.fetchall())
+        with self._lock:
+            self._ip_to_room = ip_to_room
+            self._user_ids = user_ids
+            self._intervals = intervals
+            self._watermark = watermark
+            self._row_count = row_count
+            self._loaded_date = today
+            self._last_full_reload = time.monotonic()
+            self._force_full = False
+            self.version += 1
+        self._notify_change()
+
+    def _incremental_refresh(self, cursor, today):
+        cursor.execute(
+            "SELECT reservation_id, room_id, user_id, date, start_time, end_time "
+            "FROM room_reservations WHERE reservation_id > %s ORDER BY reservation_id",
+            (self._watermark,)
+        )
+        rows = cursor.fetchall()
+        cursor.execute("SELECT COUNT(*) FROM room_reservations")
+        row_count = cursor.fetchone()[0]
+        if row_count != self._row_count + len(rows):
+            # Rows were deleted (or inserted below the watermark): start over
+            self._full_reload(cursor, today)
+            return
+        if not rows:
+            return
+        today_str = today.strftime('%Y-%m-%d')
+        with self._lock:
+            intervals = dict(self._intervals)
+            self._merge_rows(intervals, [r for r in rows if to_date_str(r[3]) >= today_str], copy=True)
+            self._user_ids = self._user_ids | {r[2] for r in rows}
+            self._intervals = intervals
+            self._watermark = max(self._watermark, rows[-1][0])
+            self._row_count = row_count
+            self.version += 1
+        self._notify_change()
+
+    def _notify_change(self):
+        if self.on_change:
+            try:
+                self.on_change()
+            except Exception as e:
+                print(f"[RESERVATION_INDEX] on_change callback failed: {e}")
+
+    @staticmethod
+    def _merge_rows(intervals, rows, copy=False):
+        touched = set()
+        for _, room_id, user_id, res_date, start_time, end_time in rows:
+            key = (room_id, user_id, to_date_str(res_date))
+            if copy and key not in touched:
+                intervals[key] = list(intervals.get(key, ()))
+                touched.add(key)
+            bisect.insort(intervals.setdefault(key, []), (to_seconds(start_time), to_seconds(end_time)))
+
+    # --- Background refresher ---
+
+    def start(self):
+        """Start the background refresher thread (idempotent)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[RESERVATION_INDEX] Refresh failed: {e}")
+            self._stop_event.wait(self.refresh_interval)
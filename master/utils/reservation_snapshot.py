@@ -0,0 +1,191 @@
+"""On-disk (SQLite) copy of the reservations needed to decide access while MySQL is unavailable."""
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+# MASTER_SNAPSHOT_PATH moves the snapshot file; it is read when the file is first opened
+SNAPSHOT_PATH_ENV = "MASTER_SNAPSHOT_PATH"
+DEFAULT_SNAPSHOT_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "data", "reservation_snapshot.db")
+
+AUDIT_COLUMNS = "(decided_at, user_id, ip_address, room_id, allowed, source)"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS slave (ip_address TEXT PRIMARY KEY, room_id TEXT);
+CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS reservations (
+    room_id TEXT, user_id TEXT, date TEXT, start_s INTEGER, end_s INTEGER
+);
+CREATE INDEX IF NOT EXISTS reservations_lookup ON reservations (room_id, user_id, date);
+CREATE TABLE IF NOT EXISTS pending_audit (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    decided_at TEXT, user_id TEXT, ip_address TEXT, room_id TEXT, allowed INTEGER, source TEXT
+);
+"""
+
+
+class ReservationSnapshot:
+    """
+    SQLite file holding the slave map, the known user IDs and the reservations
+    for today and tomorrow, rewritten whenever the reservation index changes.
+
+    Access decisions taken from the snapshot are queued in pending_audit and
+    pushed to the MySQL access_audit table by the sync thread once the
+    database answers again.
+
+    The file (and its directory) is only opened and created on first use, so
+    constructing a snapshot never touches the disk.
+    """
+
+    def __init__(self, path=None, connection_factory=None, ensure_table=None, sync_interval=30.0):
+        self.path = path  # None: MASTER_SNAPSHOT_PATH or DEFAULT_SNAPSHOT_PATH, resolved on first use
+        self.connection_factory = connection_factory  # MySQL connections for the audit sync
+        self.ensure_table = ensure_table
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._db = None
+        self._sync_thread = None
+        self._stop_event = threading.Event()
+        self.saved = 0
+        self.hits = 0
+        self.audit_queued = 0
+        self.audit_synced = 0
+
+    def _connection(self):
+        """The SQLite connection, opened on first use; call with self._lock held."""
+        if self._db is None:
+            if self.path is None:
+                self.path = os.environ.get(SNAPSHOT_PATH_ENV) or DEFAULT_SNAPSHOT_PATH
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.executescript(SCHEMA)
+            self._db = db
+        return self._db
+
+    def save(self, ip_to_room, user_ids, rows):
+        """Replace the snapshot; rows are (room_id, user_id, 'YYYY-MM-DD', start_s, end_s)."""
+        with self._lock, self._connection() as db:
+            db.execute("DELETE FROM slave")
+            db.execute("DELETE FROM users")
+            db.execute("DELETE FROM reservations")
+            db.executemany("INSERT INTO slave VALUES (?, ?)", [(ip, str(room)) for ip, room in ip_to_room.items()])
+            db.executemany("INSERT INTO users VALUES (?)", [(str(uid),) for uid in user_ids])
+            db.executemany("INSERT INTO reservations VALUES (?, ?, ?, ?, ?)",
+                           [(str(room), str(uid), d, start, end) for room, uid, d, start, end in rows])
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('saved_at', ?)", (datetime.now().isoformat(timespec='seconds'),))
+        self.saved += 1
+
+    def saved_at(self):
+        with self._lock:
+            row = self._connection().execute("SELECT value FROM meta WHERE key = 'saved_at'").fetchone()
+        return row[0] if row else None
+
+    def has_user(self, user_id):
+        with self._lock:
+            row = self._connection().execute("SELECT 1 FROM users WHERE user_id = ?", (str(user_id),)).fetchone()
+        self.hits += 1
+        return row is not None
+
+    def room_for_ip(self, ip_address):
+        with self._lock:
+            row = self._connection().execute("SELECT room_id FROM slave WHERE ip_address = ?", (ip_address,)).fetchone()
+        return row[0] if row else None
+
+    def is_access_allowed(self, user_id, ip_address, now=None, room_id=None):
+        """Same rule as sql.is_access_allowed, answered from the snapshot."""
+        now = now or datetime.now()
+        t = now.hour * 3600 + now.minute * 60 + now.second
+        with self._lock:
+            db = self._connection()
+            if room_id is None:
+                row = db.execute("SELECT room_id FROM slave WHERE ip_address = ?", (ip_address,)).fetchone()
+                if not row:
+                    return False
+                room_id = row[0]
+            row = db.execute(
+                "SELECT 1 FROM reservations WHERE room_id = ? AND user_id = ? AND date = ? AND start_s <= ? AND end_s >= ? LIMIT 1",
+                (str(room_id), str(user_id), now.strftime('%Y-%m-%d'), t, t)
+            ).fetchone()
+        self.hits += 1
+        return row is not None
+
+    # --- Offline audit ---
+
+    def record_audit(self, user_id, ip_address, room_id, allowed, source="snapshot"):
+        """Queue an access decision taken without MySQL for the sync thread."""
+        with self._lock, self._connection() as db:
+            db.execute(
+                f"INSERT INTO pending_audit {AUDIT_COLUMNS} VALUES (?, ?, ?, ?, ?, ?)",
+                (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), str(user_id), ip_address,
+                 None if room_id is None else str(room_id), int(bool(allowed)), source)
+            )
+        self.audit_queued += 1
+        self.start_sync()
+
+    def pending_audit_count(self):
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM pending_audit").fetchone()[0]
+
+    def sync_audit(self, batch_size=500):
+        """Push queued audit rows to MySQL access_audit; returns the number synced."""
+        with self._lock:
+            rows = self._connection().execute(
+                f"SELECT id, decided_at, user_id, ip_address, room_id, allowed, source FROM pending_audit ORDER BY id LIMIT {int(batch_size)}"
+            ).fetchall()
+        if not rows:
+            return 0
+        if self.ensure_table:
+            self.ensure_table()
+        connection = self.connection_factory()
+        cursor = None
+        try:
+            cursor = connection.cursor()
+            cursor.executemany(
+                f"INSERT INTO access_audit {AUDIT_COLUMNS} VALUES (%s, %s, %s, %s, %s, %s)",
+                [r[1:] for r in rows]
+            )
+            connection.commit()
+        finally:
+            if cursor is not None:
+                cursor.close()
+            connection.close()
+        with self._lock, self._connection() as db:
+            db.execute("DELETE FROM pending_audit WHERE id <= ?", (rows[-1][0],))
+        self.audit_synced += len(rows)
+        return len(rows)
+
+    def start_sync(self):
+        """Start the audit sync thread if a connection factory is configured (idempotent)."""
+        if self.connection_factory is None:
+            return
+        if self._sync_thread and self._sync_thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._sync_thread = threading.Thread(target=self._sync_loop, daemon=True)
+        self._sync_thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _sync_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                while self.sync_audit():
+                    pass
+            except Exception as e:
+                print(f"[SNAPSHOT] Audit sync failed, retrying in {self.sync_interval:.0f}s: {e}")
+            self._stop_event.wait(self.sync_interval)
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "saved_at": self.saved_at(),
+            "saves": self.saved,
+            "hits": self.hits,
+            "audit_queued": self.audit_queued,
+            "audit_synced": self.audit_synced,
+            "audit_pending": self.pending_audit_count(),
+        }
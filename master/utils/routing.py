@@ -0,0 +1,179 @@
+"""Shared routing tables: ip -> device, device -> room, lock -> light."""
+import json
+import os
+import threading
+import time
+
+# MASTER_CONFIG points the master at another device table (e.g. one written by simulator.py)
+CONFIG_PATH_ENV = "MASTER_CONFIG"
+DEFAULT_CONFIG_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "config.json"))
+
+DEFAULT_DEVICES = {
+    'lock_207': {'ip': '192.168.137.250', 'port': 4210, 'type': 'lock'},
+    'lock_208': {'ip': '192.168.137.249', 'port': 4210, 'type': 'lock'},
+    'light_207': {'ip': '192.168.137.248', 'port': 4210, 'type': 'light'},
+    'light_208': {'ip': '192.168.137.247', 'port': 4210, 'type': 'light'},
+}
+
+
+def resolve_config_path():
+    """Absolute path of the config file: MASTER_CONFIG (relative to the current directory) or DEFAULT_CONFIG_PATH."""
+    path = os.environ.get(CONFIG_PATH_ENV)
+    return os.path.abspath(path) if path else DEFAULT_CONFIG_PATH
+
+
+def load_config(config_path=None):
+    """The config file as a dict, with DEFAULT_DEVICES if it is missing, unreadable or lists no devices."""
+    config_path = config_path or resolve_config_path()
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    except Exception as e:
+        print(f"[CONFIG] Failed to load {config_path}: {e}. Using default devices.")
+        config = {}
+    if not config.get("devices"):
+        config["devices"] = DEFAULT_DEVICES
+    return config
+
+
+def _room_suffix(device_name):
+    """'lock_207' -> '207'."""
+    return device_name.split("_", 1)[1] if "_" in device_name else device_name
+
+
+class RoutingRegistry:
+    """
+    O(1) routing lookups built from config.json and the slave table.
+
+    The config file is re-checked at most every check_interval seconds (one
+    os.stat) and the tables are rebuilt when its mtime changes; the slave
+    table is re-read with it and every room_refresh_interval seconds. Each
+    rebuild swaps in new dicts, so readers never see a half-built table.
+    """
+
+    def __init__(self, config_path=None, room_loader=None, check_interval=2.0, room_retry_interval=30.0, room_refresh_interval=300.0):
+        self.config_path = config_path or resolve_config_path()
+        self.room_loader = room_loader  # function() -> {ip_address: room_id} from the slave table
+        self.check_interval = check_interval
+        self.room_retry_interval = room_retry_interval
+        self.room_refresh_interval = room_refresh_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._next_check = 0.0
+        self._rooms_loaded_at = None
+        self._room_retry_at = 0.0
+        self.devices = {}
+        self._ip_to_device = {}     # ip -> device name
+        self._ip_type_to_device = {}  # (ip, type) -> device name
+        self._allowed_ips = frozenset()
+        self._lock_to_light = {}
+        self._ip_to_room = {}       # ip -> room_id from the slave table
+
+    # --- Loading ---
+
+    def _maybe_reload(self, rooms=True):
+        """Re-check the config file; with rooms, also refresh the slave table (which may query the DB)."""
+        now = time.monotonic()
+        if now >= self._next_check:
+            with self._lock:
+                if now >= self._next_check:
+                    self._next_check = now + self.check_interval
+                    try:
+                        mtime = os.stat(self.config_path).st_mtime
+                    except OSError:
+                        mtime = None
+                    if mtime != self._mtime or not self.devices:
+                        self._load_devices()
+                        self._mtime = mtime
+                        self._rooms_loaded_at = None  # slave table may describe new devices too
+        if rooms and self.room_loader and self._rooms_stale(now) and now >= self._room_retry_at:
+            with self._lock:
+                if self._rooms_stale(now) and now >= self._room_retry_at:
+                    self._load_rooms(now)
+
+    def _rooms_stale(self, now):
+        return self._rooms_loaded_at is None or now - self._rooms_loaded_at >= self.room_refresh_interval
+
+    def _load_devices(self):
+        devices = load_config(self.config_path)["devices"]
+        ip_to_device = {}
+        ip_type_to_device = {}
+        for name, info in devices.items():
+            ip_to_device.setdefault(info['ip'], name)
+            ip_type_to_device[(info['ip'], info['type'])] = name
+        lights_by_room = {_room_suffix(n): n for n, i in devices.items() if i['type'] == 'light'}
+        lock_to_light = {
+            n: lights_by_room[_room_suffix(n)]
+            for n, i in devices.items()
+            if i['type'] == 'lock' and _room_suffix(n) in lights_by_room
+        }
+        self.devices = devices
+        self._ip_to_device = ip_to_device
+        self._ip_type_to_device = ip_type_to_device
+        self._allowed_ips = frozenset(ip_to_device)
+        self._lock_to_light = lock_to_light
+
+    def _load_rooms(self, now):
+        try:
+            self._ip_to_room = dict(self.room_loader())
+            self._rooms_loaded_at = now
+        except Exception as e:
+            print(f"[ROUTING] Failed to load slave rooms: {e}")
+            self._room_retry_at = now + self.room_retry_interval
+
+    def reload(self):
+        """Force the config and slave table to be re-read on the next lookup."""
+        self._next_check = 0.0
+        self._mtime = None
+
+    # --- Lookups ---
+
+    def is_allowed_ip(self, ip):
+        """Whether ip belongs to a configured slave; never touches the DB, so it is safe on the event loop."""
+        self._maybe_reload(rooms=False)
+        return ip in self._allowed_ips
+
+    def device_for_ip(self, ip, device_type=None):
+        """Device name configured for an IP (optionally of a given type), or None."""
+        self._maybe_reload()
+        if device_type is None:
+            return self._ip_to_device.get(ip)
+        return self._ip_type_to_device.get((ip, device_type))
+
+    def device_info(self, name):
+        self._maybe_reload()
+        return self.devices.get(name)
+
+    def room_for_ip(self, ip):
+        """room_id of the slave at ip according to the slave table, or None if unknown."""
+        self._maybe_reload()
+        return self._ip_to_room.get(ip)
+
+    def room_for_device(self, name):
+        info = self.device_info(name)
+        return self.room_for_ip(info['ip']) if info else None
+
+    def light_for_lock(self, lock_name):
+        self._maybe_reload()
+        return self._lock_to_light.get(lock_name)
+
+    def lock_to_light(self):
+        self._maybe_reload()
+        return dict(self._lock_to_light)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Process-wide registry, using the config file from resolve_config_path() and the slave table."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                def load_rooms():
+                    from . import sql
+                    return sql.get_slave_rooms()
+                _registry = RoutingRegistry(room_loader=load_rooms)
+    return _registry
@@ -0,0 +1,106 @@
+"""Single-thread scheduler for delayed, keyed actions (e.g. auto-relock after an unlock)."""
+import heapq
+import itertools
+import threading
+import time
+
+
+class ActionScheduler:
+    """
+    Runs delayed actions on one worker thread.
+
+    Actions are keyed: scheduling a key that already has a pending action
+    replaces it, so repeated unlocks of the same lock leave exactly one
+    pending relock. Cancelled or replaced entries stay in the heap and are
+    skipped when they come due.
+    """
+
+    def __init__(self):
+        self._heap = []          # (due, seq, key)
+        self._pending = {}       # key -> (due, seq, func, args, kwargs)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self.executed = 0
+        self.replaced = 0
+        self.failed = 0
+
+    def schedule(self, key, delay, func, *args, **kwargs):
+        """Run func(*args, **kwargs) after delay seconds, replacing any pending action for key."""
+        self.start()
+        due = time.monotonic() + delay
+        with self._cond:
+            seq = next(self._seq)
+            if key in self._pending:
+                self.replaced += 1
+            self._pending[key] = (due, seq, func, args, kwargs)
+            heapq.heappush(self._heap, (due, seq, key))
+            self._cond.notify()
+
+    def cancel(self, key):
+        """Cancel the pending action for key. Returns True if one was pending."""
+        with self._cond:
+            return self._pending.pop(key, None) is not None
+
+    def pending(self):
+        """List of (key, seconds until due, function name) for every pending action, soonest first."""
+        now = time.monotonic()
+        with self._cond:
+            items = sorted(self._pending.items(), key=lambda kv: kv[1][0])
+        return [(key, max(0.0, due - now), getattr(func, '__name__', repr(func))) for key, (due, _, func, _, _) in items]
+
+    def start(self):
+        if self._running:
+            return
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    if self._heap:
+                        wait = self._heap[0][0] - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                if not self._running:
+                    return
+                _, seq, key = heapq.heappop(self._heap)
+                entry = self._pending.get(key)
+                if entry is None or entry[1] != seq:
+                    continue  # cancelled or replaced
+                del self._pending[key]
+            _, _, func, args, kwargs = entry
+            try:
+                func(*args, **kwargs)
+                self.executed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"[SCHEDULER] Action {key!r} failed: {e}")
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Process-wide action scheduler."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = ActionScheduler()
+    return _scheduler
@@ -1,6 +1,16 @@
+import re
+import threading
+import concurrent.futures
 import mysql.connector
 from mysql.connector import pooling
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from .db_pool import DatabaseEngine
+from .log_writer import BatchedLogWriter
+from .metrics import get_metrics
+from .reservation_index import ReservationIndex
+from .reservation_snapshot import ReservationSnapshot
+from .routing import get_registry
+from .ttl_cache import TTLCache
 
 # Database configuration
 DB_CONFIG = {
@@ -10,54 +20,199 @@ DB_CONFIG = {
     "database": "mtu_smart_classroom"
 }
 
-# Create a connection pool
-connection_pool = mysql.connector.pooling.MySQLConnectionPool(
-    pool_name="mypool",
-    pool_size=5,
-    **DB_CONFIG
-)
+# Pool sizing: the reservation index, routing table, log writer and the
+# access fallback queries can all hold a connection at the same time
+POOL_CONFIG = {
+    "pool_size": 8,
+    "acquire_timeout": 2.0,   # seconds to wait for a free connection before PoolError
+    "ping_interval": 30.0,    # ping (and reconnect) connections idle longer than this
+}
+
+# The pool is opened lazily: importing this module never connects. Entry
+# points call warm_up() to connect in the background at startup.
+engine = DatabaseEngine(DB_CONFIG, POOL_CONFIG, pool_name="mypool")
+metrics = get_metrics()
 
 def get_connection():
-    return connection_pool.get_connection()
+    return engine.get_connection()
 
-def is_user_id_valid(user_id):
-    """Quick check if a user ID exists in any reservation."""
+def warm_up():
+    """Start connecting to MySQL in the background; the reservation index is loaded once it is up."""
+    engine.warm_up()
+
+def pool_stats():
+    """Connection pool metrics: in-use, wait times, timeouts, errors, reconnects."""
+    return engine.stats()
+
+# Short-lived caches for repeated taps: UID validity and recent access decisions
+uid_cache = TTLCache(maxsize=1024, ttl=60.0)
+access_cache = TTLCache(maxsize=1024, ttl=5.0)
+
+def invalidate_access_caches():
+    """Drop cached UID validity and access decisions (called when reservations change)."""
+    uid_cache.clear()
+    access_cache.clear()
+
+def cache_stats():
+    return {"uid": uid_cache.stats(), "access": access_cache.stats()}
+
+# Access lookups that miss the index wait at most this long for MySQL before
+# falling back to the on-disk snapshot, so door latency does not depend on the DB.
+# While ACCESS_DB_MAX_IN_FLIGHT lookups are still outstanding (DB hung), new
+# ones go straight to the snapshot instead of queueing behind them.
+ACCESS_DB_BUDGET = 0.3
+ACCESS_DB_MAX_IN_FLIGHT = 2
+_db_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="access-db")
+_db_in_flight = 0
+_db_in_flight_lock = threading.Lock()
+
+def ensure_audit_table_exists():
+    """Create the access_audit table (access decisions taken while MySQL was unavailable)."""
+    connection = get_connection()
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS access_audit (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                decided_at DATETIME,
+                user_id VARCHAR(64),
+                ip_address VARCHAR(64),
+                room_id VARCHAR(32),
+                allowed TINYINT(1),
+                source VARCHAR(16)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """)
+        connection.commit()
+    finally:
+        if cursor is not None:
+            cursor.close()
+        connection.close()
+
+# Local copy of today's and tomorrow's reservations plus the slave map, rewritten
+# whenever the index changes; queued offline decisions are synced to access_audit
+snapshot = ReservationSnapshot(connection_factory=get_connection, ensure_table=ensure_audit_table_exists)
+
+def _on_reservations_changed():
+    invalidate_access_caches()
+    today = date.today()
+    try:
+        snapshot.save(*reservation_index.export({
+            today.strftime('%Y-%m-%d'), (today + timedelta(days=1)).strftime('%Y-%m-%d')
+        }))
+    except Exception as e:
+        print(f"[SNAPSHOT] Failed to save reservation snapshot: {e}")
+
+# In-memory reservation index for the access hot path (refreshed in the background)
+reservation_index = ReservationIndex(get_connection, on_change=_on_reservations_changed)
+engine.add_ready_callback(reservation_index.start)
+engine.add_ready_callback(snapshot.start_sync)
+
+def get_slave_rooms():
+    """Return {ip_address: room_id} from the slave table."""
+    connection = get_connection()
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT ip_address, room_id FROM slave")
+        return {ip: room_id for ip, room_id in cursor.fetchall()}
+    finally:
+        if cursor is not None:
+            cursor.close()
+        connection.close()
+
+@metrics.timed("db_query", query="user_id_valid")
+def _query_user_id_valid(user_id):
+    connection = get_connection()
+    cursor = None
     try:
-        connection = get_connection()
         cursor = connection.cursor(buffered=True)
         query = "SELECT 1 FROM room_reservations WHERE user_id = %s"
         cursor.execute(query, (user_id,))
-        result = cursor.fetchone()
-        return result is not None
+        return cursor.fetchone() is not None
     finally:
-        cursor.close()
+        if cursor is not None:
+            cursor.close()
         connection.close()
 
+def _lookup_done(future):
+    global _db_in_flight
+    with _db_in_flight_lock:
+        _db_in_flight -= 1
+
+def _within_budget(func, *args):
+    """
+    Run a DB lookup, raising TimeoutError if it takes longer than ACCESS_DB_BUDGET
+    or if ACCESS_DB_MAX_IN_FLIGHT earlier lookups have not finished yet.
+    """
+    global _db_in_flight
+    with _db_in_flight_lock:
+        if _db_in_flight >= ACCESS_DB_MAX_IN_FLIGHT:
+            metrics.inc("access_db_skipped_total")
+            raise TimeoutError(f"{_db_in_flight} DB lookups still outstanding")
+        _db_in_flight += 1
+    future = _db_executor.submit(func, *args)
+    future.add_done_callback(_lookup_done)
+    try:
+        return future.result(timeout=ACCESS_DB_BUDGET)
+    except concurrent.futures.TimeoutError:
+        future.cancel()  # drops it if it is still queued; a running query finishes on its own
+        raise TimeoutError(f"no answer within {ACCESS_DB_BUDGET * 1000:.0f} ms") from None
+
+def is_user_id_valid(user_id):
+    """Quick check if a user ID exists in any reservation."""
+    cached = uid_cache.get(user_id)
+    if cached is not None:
+        metrics.inc("access_decisions_total", check="user_id", source="cache")
+        return cached
+    reservation_index.start()
+    if reservation_index.is_fresh():
+        valid = reservation_index.has_user(user_id)
+        uid_cache.put(user_id, valid)
+        metrics.inc("access_decisions_total", check="user_id", source="index")
+        return valid
+    try:
+        valid = _within_budget(_query_user_id_valid, user_id)
+        metrics.inc("access_decisions_total", check="user_id", source="db")
+    except Exception as e:
+        # Not cached: the next tap asks MySQL again instead of reusing a degraded answer
+        valid = snapshot.has_user(user_id)
+        metrics.inc("access_decisions_total", check="user_id", source="snapshot")
+        print(f"[ACCESS] DB unavailable ({e}); UID {user_id} checked against snapshot from {snapshot.saved_at()}: {valid}")
+        return valid
+    uid_cache.put(user_id, valid)
+    return valid
+
 def get_all_user_ids():
     """Get all unique user IDs from reservations."""
+    connection = get_connection()
+    cursor = None
     try:
-        connection = get_connection()
         cursor = connection.cursor()
         query = "SELECT DISTINCT user_id FROM room_reservations"
         cursor.execute(query)
         user_ids = [row[0] for row in cursor.fetchall()]
         return user_ids
     finally:
-        cursor.close()
+        if cursor is not None:
+            cursor.close()
         connection.close()
 
-def is_access_allowed(user_id, ip_address):
-    """Check if a user has access to a room at the current time."""
+@metrics.timed("db_query", query="access_allowed")
+def _query_access_allowed(user_id, ip_address):
+    connection = get_connection()
+    cursor = None
     try:
-        connection = get_connection()
         cursor = connection.cursor(buffered=True)
         
-        # 1. Get room_id from slave table using ip_address
-        cursor.execute("SELECT room_id FROM slave WHERE ip_address = %s", (ip_address,))
-        row = cursor.fetchone()
-        if not row:
-            return False
-        room_id = row[0]
+        # 1. Get room_id for the slave (routing table, slave table as fallback)
+        room_id = get_registry().room_for_ip(ip_address)
+        if room_id is None:
+            cursor.execute("SELECT room_id FROM slave WHERE ip_address = %s", (ip_address,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            room_id = row[0]
         
         # 2. Check for valid reservation
         now = datetime.now()
@@ -69,29 +224,59 @@ def is_access_allowed(user_id, ip_address):
             "AND date = %s AND start_time <= %s AND end_time >= %s"
         )
         cursor.execute(query, (user_id, room_id, today, current_time, current_time))
-        result = cursor.fetchone()
-        return result is not None
+        return cursor.fetchone() is not None
     finally:
-        cursor.close()
+        if cursor is not None:
+            cursor.close()
         connection.close()
 
+def is_access_allowed(user_id, ip_address):
+    """Check if a user has access to a room at the current time."""
+    cached = access_cache.get((user_id, ip_address))
+    if cached is not None:
+        metrics.inc("access_decisions_total", check="access", source="cache")
+        return cached
+    reservation_index.start()
+    if reservation_index.is_fresh():
+        allowed = reservation_index.is_access_allowed(user_id, ip_address)
+        access_cache.put((user_id, ip_address), allowed)
+        metrics.inc("access_decisions_total", check="access", source="index")
+        return allowed
+    try:
+        allowed = _within_budget(_query_access_allowed, user_id, ip_address)
+        metrics.inc("access_decisions_total", check="access", source="db")
+        if allowed is None:  # IP not in the slave table
+            return False
+    except Exception as e:
+        # MySQL slow or down: decide from the local snapshot and queue the decision for audit
+        allowed = snapshot.is_access_allowed(user_id, ip_address)
+        metrics.inc("access_decisions_total", check="access", source="snapshot")
+        print(f"[ACCESS] DB unavailable ({e}); {user_id} at {ip_address} decided from snapshot from {snapshot.saved_at()}: {allowed}")
+        snapshot.record_audit(user_id, ip_address, snapshot.room_for_ip(ip_address), allowed)
+        return allowed  # not cached, like is_user_id_valid
+    access_cache.put((user_id, ip_address), allowed)
+    return allowed
+
 def get_all_room_reservations():
     """Retrieve all room reservations."""
+    connection = get_connection()
+    cursor = None
     try:
-        connection = get_connection()
         cursor = connection.cursor(dictionary=True)
         query = "SELECT * FROM room_reservations"
         cursor.execute(query)
         reservations = cursor.fetchall()
         return reservations
     finally:
-        cursor.close()
+        if cursor is not None:
+            cursor.close()
         connection.close()
 
 def get_next_3_reservations():
     """Retrieve the next 3 upcoming room reservations ordered by date and start_time."""
+    connection = get_connection()
+    cursor = None
     try:
-        connection = get_connection()
         cursor = connection.cursor(dictionary=True)
         now = datetime.now()
         today = now.strftime('%Y-%m-%d')
@@ -106,13 +291,15 @@ def get_next_3_reservations():
         reservations = cursor.fetchall()
         return reservations
     finally:
-        cursor.close()
+        if cursor is not None:
+            cursor.close()
         connection.close()
 
 def ensure_log_tables_exist():
     """Create incoming_log and outgoing_log tables if they do not exist."""
+    connection = get_connection()
+    cursor = None
     try:
-        connection = get_connection()
         cursor = connection.cursor()
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS incoming_log (
@@ -142,16 +329,32 @@ def ensure_log_tables_exist():
         """)
         connection.commit()
     finally:
-        cursor.close()
+        if cursor is not None:
+            cursor.close()
         connection.close()
 
+# Precompiled log patterns: extract timestamp, device, state, value1, value2, value3
+INCOMING_LOG_RE = re.compile(
+    r"^(?P<ts>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),\d+ \[RECV\] From \('(?P<ip>[\d.]+)', \d+\): (?P<device>[^:]+):(?P<state>[^:]+):?(?P<value1>[^:]*):?(?P<value2>[^:]*):?(?P<value3>[^:]*).*"
+)
+OUTGOING_LOG_RE = re.compile(
+    r"^\[(?P<ts>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] Sent (?P<state>[^:]+):?(?P<value1>[^ ]*) to (?P<device>[^ ]+) at (?P<value2>[^ ]+)(?::(?P<value3>\d+))?"
+)
+
+# Background batched writer for incoming_log / outgoing_log (tables are checked once)
+log_writer = BatchedLogWriter(get_connection, ensure_tables=ensure_log_tables_exist, is_ready=engine.is_ready)
+
+# Existing stats() exported as gauges on the metrics endpoint
+metrics.add_collector("db_pool", pool_stats)
+metrics.add_collector("uid_cache", uid_cache.stats)
+metrics.add_collector("access_cache", access_cache.stats)
+metrics.add_collector("log_writer", log_writer.stats)
+metrics.add_collector("snapshot", snapshot.stats)
+
 def parse_incoming_log(raw_message):
     """Parse the incoming log message into structured fields."""
     # Example: 2025-06-05 14:50:30,359 [RECV] From ('192.168.137.247', 4210): light_208:OFF:0.5:0:162
-    import re
-    # Extract timestamp, device, type, state, value1, value2, value3
-    pattern = r"^(?P<ts>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),\d+ \[RECV\] From \('(?P<ip>[\d.]+)', \d+\): (?P<device>[^:]+):(?P<state>[^:]+):?(?P<value1>[^:]*):?(?P<value2>[^:]*):?(?P<value3>[^:]*).*"
-    m = re.match(pattern, raw_message)
+    m = INCOMING_LOG_RE.match(raw_message)
     if m:
         ts = m.group('ts')
         device = m.group('device')
@@ -165,30 +368,27 @@ def parse_incoming_log(raw_message):
         return None, None, None, None, None, None, None, raw_message
 
 def insert_incoming_log(raw_message):
-    ensure_log_tables_exist()
-    ts, device, log_type, state, value1, value2, value3, raw_message = parse_incoming_log(raw_message)
-    try:
-        connection = get_connection()
-        cursor = connection.cursor()
-        cursor.execute(
-            """
-            INSERT INTO incoming_log (log_time, device, log_type, state, value1, value2, value3, raw_message)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """,
-            (ts, device, log_type, state, value1, value2, value3, raw_message)
-        )
-        connection.commit()
-    finally:
-        cursor.close()
-        connection.close()
+    """Queue an incoming log row for a text line (messages that did not parse); see insert_incoming_event."""
+    log_writer.submit("incoming_log", parse_incoming_log(raw_message))
+
+def incoming_log_row(event):
+    """incoming_log row built from a journal 'recv' event (see event_journal.message_event), without text parsing."""
+    ts = datetime.fromtimestamp(event["ts"]).strftime('%Y-%m-%d %H:%M:%S')
+    if event.get("uid"):
+        state, values = "UID", (event["uid"], None, None)
+    else:
+        state, values = event.get("state"), (event.get("lux"), event.get("pwm"), event.get("ldr"))
+    value1, value2, value3 = (None if v is None else str(v) for v in values)
+    return ts, event.get("device"), 'RECV', state, value1, value2, value3, event.get("raw")
+
+def insert_incoming_event(event):
+    """Queue an incoming log row for a journal event; it is written in a batch by log_writer."""
+    log_writer.submit("incoming_log", incoming_log_row(event))
 
 def parse_outgoing_log(raw_message):
     """Parse the outgoing log message into structured fields."""
     # Example: [2025-06-13 09:40:46] Sent PWM:128 to light_208 at 192.168.137.247:4210
-    import re
-    # Extract timestamp, log_type, state, value1, device, value2, value3
-    pattern = r"^\[(?P<ts>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] Sent (?P<state>[^:]+):?(?P<value1>[^ ]*) to (?P<device>[^ ]+) at (?P<value2>[^ ]+)(?::(?P<value3>\d+))?"
-    m = re.match(pattern, raw_message)
+    m = OUTGOING_LOG_RE.match(raw_message)
     if m:
         ts = m.group('ts')
         device = m.group('device')
@@ -202,22 +402,8 @@ def parse_outgoing_log(raw_message):
         return None, None, None, None, None, None, None, raw_message
 
 def insert_outgoing_log(raw_message):
-    ensure_log_tables_exist()
-    ts, device, log_type, state, value1, value2, value3, raw_message = parse_outgoing_log(raw_message)
-    try:
-        connection = get_connection()
-        cursor = connection.cursor()
-        cursor.execute(
-            """
-            INSERT INTO outgoing_log (log_time, device, log_type, state, value1, value2, value3, raw_message)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """,
-            (ts, device, log_type, state, value1, value2, value3, raw_message)
-        )
-        connection.commit()
-    finally:
-        cursor.close()
-        connection.close()
+    """Queue an outgoing log row; it is written in a batch by log_writer."""
+    log_writer.submit("outgoing_log", parse_outgoing_log(raw_message))
 
 if __name__ == "__main__":
     print("All valid user IDs in the database:")
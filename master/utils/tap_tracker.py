@@ -0,0 +1,197 @@
+"""Per-tap correlation IDs and rolling unlock latency per lock."""
+import collections
+import itertools
+import math
+import threading
+import time
+from datetime import datetime
+
+from .metrics import get_metrics
+
+STAGES = ("received", "validated", "decided", "sent", "confirmed")
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list (None if empty)."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Tap:
+    """One access attempt: a UID read by a lock, followed through to the reply and the lock's status echo."""
+    __slots__ = ("tap_id", "lock", "uid", "allowed", "stages", "wall_time", "outcome")
+
+    def __init__(self, tap_id, lock, uid, received_at):
+        self.tap_id = tap_id
+        self.lock = lock
+        self.uid = uid
+        self.allowed = None
+        self.stages = {"received": received_at}  # stage -> time.monotonic()
+        self.wall_time = time.time() - (time.monotonic() - received_at)
+        self.outcome = None  # 'denied', 'confirmed', 'unconfirmed' once closed
+
+    def elapsed_ms(self, stage):
+        at = self.stages.get(stage)
+        return None if at is None else 1000 * (at - self.stages["received"])
+
+    def to_dict(self):
+        return {
+            "tap_id": self.tap_id,
+            "lock": self.lock,
+            "uid": self.uid,
+            "time": datetime.fromtimestamp(self.wall_time).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+            "allowed": self.allowed,
+            "outcome": self.outcome,
+            **{f"{stage}_ms": self.elapsed_ms(stage) for stage in STAGES[1:]},
+        }
+
+
+class TapTracker:
+    """
+    Gives every UID datagram from a lock a tap ID and timestamps its stages:
+    received, validated (UID known), decided (access rule), sent (reply or
+    mesh UNLOCK on the wire) and confirmed (the lock's lock_X:UNLOCKED echo).
+
+    A granted tap stays pending until the lock echoes UNLOCKED (matched to the
+    oldest pending tap of that lock) or confirm_timeout passes. Reply and
+    confirmation latencies of the last `window` taps per lock are kept for
+    rolling p50/p95/p99.
+    """
+
+    def __init__(self, window=500, confirm_timeout=5.0, history=200):
+        self.window = window
+        self.confirm_timeout = confirm_timeout
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self._pending = collections.defaultdict(collections.deque)  # lock -> granted taps awaiting the echo
+        self._reply = collections.defaultdict(lambda: collections.deque(maxlen=self.window))    # lock -> ms
+        self._confirm = collections.defaultdict(lambda: collections.deque(maxlen=self.window))  # lock -> ms
+        self._counts = collections.defaultdict(collections.Counter)  # lock -> outcome counts
+        self._recent = collections.deque(maxlen=history)
+        self.metrics = get_metrics()
+
+    def begin(self, lock, uid, received_at=None):
+        """Open a tap for a UID read by lock; received_at is the datagram's time.monotonic()."""
+        tap = Tap(f"{lock}#{next(self._seq)}", lock, uid, received_at or time.monotonic())
+        with self._lock:
+            self._counts[lock]["taps"] += 1
+        return tap
+
+    def mark(self, tap, stage, at=None):
+        if tap is not None:
+            tap.stages[stage] = at or time.monotonic()
+
+    def decided(self, tap, allowed):
+        if tap is None:
+            return
+        tap.allowed = bool(allowed)
+        self.mark(tap, "decided")
+
+    def sent(self, tap, at=None):
+        """The reply (or the mesh UNLOCK datagram to the lock itself) went out."""
+        if tap is None or "sent" in tap.stages:
+            return
+        self.mark(tap, "sent", at)
+        reply_ms = tap.elapsed_ms("sent")
+        self.metrics.observe("tap_reply_seconds", reply_ms / 1000, lock=tap.lock)
+        with self._lock:
+            self._reply[tap.lock].append(reply_ms)
+            if tap.allowed:
+                self._expire(tap.stages["sent"], tap.lock)  # locks that never echo must not pile up taps
+                self._pending[tap.lock].append(tap)
+            else:
+                self._close(tap, "denied")
+
+    def finish(self, tap):
+        """Close a tap that will not be sent (denied without a reply)."""
+        if tap is None or tap.outcome is not None:
+            return
+        with self._lock:
+            self._close(tap, "denied" if not tap.allowed else "unsent")
+
+    def confirm(self, lock, state, at=None):
+        """A lock reported its state; UNLOCKED confirms the oldest pending granted tap. Returns the tap or None."""
+        if state != "UNLOCKED":
+            return None
+        now = at or time.monotonic()
+        with self._lock:
+            self._expire(now)
+            pending = self._pending.get(lock)
+            if not pending:
+                self._counts[lock]["unmatched_echoes"] += 1
+                return None
+            tap = pending.popleft()
+            tap.stages["confirmed"] = now
+            confirm_ms = tap.elapsed_ms("confirmed")
+            self._confirm[lock].append(confirm_ms)
+            self._close(tap, "confirmed")
+        self.metrics.observe("tap_confirm_seconds", confirm_ms / 1000, lock=lock)
+        return tap
+
+    def _close(self, tap, outcome):
+        tap.outcome = outcome
+        self._counts[tap.lock][outcome] += 1
+        self._recent.append(tap)
+
+    def _expire(self, now, lock=None):
+        for pending in (self._pending.values() if lock is None else (self._pending[lock],)):
+            while pending and now - pending[0].stages["received"] > self.confirm_timeout:
+                self._close(pending.popleft(), "unconfirmed")
+
+    # --- Queries ---
+
+    def stats(self):
+        """{lock: {counts..., reply_ms: {p50, p95, p99, max}, confirm_ms: {...}}} over the rolling window."""
+        with self._lock:
+            self._expire(time.monotonic())
+            locks = sorted(set(self._counts) | set(self._reply))
+            out = {}
+            for lock in locks:
+                entry = dict(self._counts[lock])
+                entry["pending"] = len(self._pending.get(lock, ()))
+                for name, samples in (("reply_ms", self._reply.get(lock)), ("confirm_ms", self._confirm.get(lock))):
+                    values = sorted(samples or ())
+                    entry[name] = {
+                        "n": len(values),
+                        "p50": percentile(values, 0.50),
+                        "p95": percentile(values, 0.95),
+                        "p99": percentile(values, 0.99),
+                        "max": values[-1] if values else None,
+                    }
+                out[lock] = entry
+        return out
+
+    def recent(self, limit=20):
+        with self._lock:
+            taps = list(self._recent)[-limit:]
+        return [tap.to_dict() for tap in taps]
+
+    def summary_lines(self):
+        """One line per lock, for text displays."""
+        ms = lambda v: "-" if v is None else f"{v:.1f}"
+        lines = []
+        for lock, s in self.stats().items():
+            reply, confirm = s["reply_ms"], s["confirm_ms"]
+            lines.append(
+                f"{lock}: {s.get('taps', 0)} taps, {s.get('confirmed', 0)} confirmed, "
+                f"{s.get('denied', 0)} denied, {s.get('unconfirmed', 0)} unconfirmed | "
+                f"reply p50/p95/p99 {ms(reply['p50'])}/{ms(reply['p95'])}/{ms(reply['p99'])} ms | "
+                f"door p50/p95/p99 {ms(confirm['p50'])}/{ms(confirm['p95'])}/{ms(confirm['p99'])} ms"
+            )
+        return lines
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_tap_tracker():
+    """Process-wide tap tracker."""
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = TapTracker()
+    return _tracker
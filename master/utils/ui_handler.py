@@ -1,4 +1,5 @@
 """UI handler for displaying device status and handling user input."""
+import time
 
 class UIHandler:
     @staticmethod
@@ -38,25 +39,72 @@ class UIHandler:
         print(table_str)
         return
 
+    @staticmethod
+    def print_metrics(snapshot):
+        """Display counters and latency histograms from MetricsRegistry.to_dict()."""
+        from tabulate import tabulate
+        if not snapshot["enabled"]:
+            print("Metrics are disabled. Use 'metrics on' (or set MASTER_METRICS_PORT) to start collecting.")
+            return
+        ms = lambda v: None if v is None else 1000 * v
+        counters, timings = [], []
+        for name, metric in sorted(snapshot["metrics"].items()):
+            for labels, value in sorted(metric["values"].items()):
+                if metric["type"] == "counter":
+                    counters.append([name + labels, value])
+                else:
+                    timings.append([name + labels, value["count"], ms(value["avg"]), ms(value["p50"]),
+                                    ms(value["p95"]), ms(value["p99"]), ms(value["max"])])
+        if timings:
+            print(tabulate(timings, headers=["Timing", "Count", "Avg ms", "p50", "p95", "p99", "Max ms"],
+                           tablefmt="fancy_grid", floatfmt=".2f"))
+        if counters:
+            print(tabulate(counters, headers=["Counter", "Value"], tablefmt="fancy_grid"))
+        if not timings and not counters:
+            print("No metrics recorded yet.")
+
+    @staticmethod
+    def print_tap_stats(stats, recent=None):
+        """Display per-lock unlock latency (TapTracker.stats()) and, optionally, recent taps."""
+        from tabulate import tabulate
+        if not stats:
+            print("No taps recorded yet.")
+            return
+        rows = []
+        for lock, s in stats.items():
+            reply, confirm = s["reply_ms"], s["confirm_ms"]
+            rows.append([lock, s.get("taps", 0), s.get("confirmed", 0), s.get("denied", 0), s.get("unconfirmed", 0),
+                         reply["p50"], reply["p95"], reply["p99"], confirm["p50"], confirm["p95"], confirm["p99"]])
+        headers = ["Lock", "Taps", "Confirmed", "Denied", "Unconfirmed",
+                   "Reply p50", "p95", "p99", "Door p50", "p95", "p99"]
+        print(tabulate(rows, headers=headers, tablefmt="fancy_grid", floatfmt=".1f", missingval="-"))
+        if recent:
+            rows = [[t["tap_id"], t["time"], t["uid"], t["outcome"] or "pending", t["validated_ms"],
+                     t["decided_ms"], t["sent_ms"], t["confirmed_ms"]] for t in recent]
+            headers = ["Tap", "Time", "UID", "Outcome", "Validated ms", "Decided ms", "Sent ms", "Confirmed ms"]
+            print(tabulate(rows, headers=headers, tablefmt="fancy_grid", floatfmt=".1f", missingval="-"))
+
+    @staticmethod
+    def print_events(events):
+        """Display journal events (EventJournal.tail()), oldest first."""
+        if not events:
+            print("No events recorded yet.")
+            return
+        for event in events:
+            ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(event["ts"]))
+            if event["type"] == "send":
+                tap = f" (tap {event['tap_id']})" if event.get("tap_id") else ""
+                print(f"{ts} [SEND] To {event['device']} at {event.get('ip')}:{event.get('port')}: {event['command']}{tap}")
+            else:
+                print(f"{ts} [RECV] From {event.get('ip')}:{event.get('port')}: {event.get('raw')}")
+
     @staticmethod
     def print_help():
         """Display available commands."""
         print("\nCommands:")
         print("- 'status': Show all device statuses")
+        print("- 'taps [recent]': Show per-lock unlock latency (p50/p95/p99), optionally with the last taps")
+        print("- 'events [n] [device_id]': Show the last n received/sent events from the journal")
+        print("- 'metrics [on/off]': Show latency and counter metrics, or turn collection on/off")
         print("- 'light <device_id> <ON/OFF>': Control light")
         print("- 'E': Exit server")
-
-def get_latest_lock_uids_from_log(log_path):
-    """Parse the log file and return a dict of lock_id -> latest UID."""
-    import re
-    latest_uid = {}
-    # Regex to match lock messages: lock_<id>:<UID>
-    lock_re = re.compile(r"lock_(\d+):([0-9A-Fa-f:]+)")
-    with open(log_path, "r", encoding="utf-8") as f:
-        for line in f:
-            match = lock_re.search(line)
-            if match:
-                lock_id = f"lock_{match.group(1)}"
-                uid = match.group(2)
-                latest_uid[lock_id] = uid
-    return latest_uid
@@ -0,0 +1,5 @@
+"""Make the master's modules importable the way the HMI scripts import them (utils.*, without MySQL)."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "master"))
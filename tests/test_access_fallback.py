@@ -0,0 +1,48 @@
+import threading
+
+import pytest
+
+pytest.importorskip("mysql.connector")
+
+from utils import sql  # noqa: E402
+from utils.reservation_snapshot import ReservationSnapshot  # noqa: E402
+
+
+@pytest.fixture
+def db_down(tmp_path, monkeypatch):
+    """Index not loaded, MySQL hanging, snapshot knows u1 for 10.0.0.1 all day."""
+    hung = threading.Event()
+    calls = []
+
+    def hanging_query(*args):
+        calls.append(args)
+        hung.wait(5)
+        return True
+    snapshot = ReservationSnapshot(str(tmp_path / "snapshot.db"))
+    snapshot.save({"10.0.0.1": 207}, {"u1"}, [])
+    monkeypatch.setattr(sql, "snapshot", snapshot)
+    monkeypatch.setattr(sql.reservation_index, "start", lambda: None)
+    monkeypatch.setattr(sql.reservation_index, "is_fresh", lambda: False)
+    monkeypatch.setattr(sql, "_query_user_id_valid", hanging_query)
+    monkeypatch.setattr(sql, "_query_access_allowed", hanging_query)
+    monkeypatch.setattr(sql, "ACCESS_DB_BUDGET", 0.02)
+    sql.invalidate_access_caches()
+    yield calls
+    hung.set()
+    sql._db_executor.submit(lambda: None).result()  # let the hung lookups drain
+    sql.invalidate_access_caches()
+
+
+def test_snapshot_answers_are_not_cached(db_down):
+    assert sql.is_user_id_valid("u1")
+    assert sql.uid_cache.get("u1") is None
+    assert not sql.is_access_allowed("u1", "10.0.0.1")
+    assert sql.access_cache.get(("u1", "10.0.0.1")) is None
+    assert sql.snapshot.pending_audit_count() == 1
+
+
+def test_outstanding_lookups_send_new_ones_straight_to_the_snapshot(db_down):
+    for i in range(10):
+        sql.is_user_id_valid(f"u{i}")
+    assert len(db_down) == sql.ACCESS_DB_MAX_IN_FLIGHT
+    assert sql._db_in_flight == sql.ACCESS_DB_MAX_IN_FLIGHT
@@ -0,0 +1,64 @@
+import importlib
+import json
+import sys
+
+import pytest
+
+from utils import routing
+
+SIM_DEVICES = {
+    "light_1": {"ip": "127.0.0.11", "port": 5001, "type": "light"},
+    "lock_1": {"ip": "127.0.0.12", "port": 5002, "type": "lock"},
+}
+
+
+@pytest.fixture
+def sim_config(tmp_path, monkeypatch):
+    """MASTER_CONFIG=sim_config.json, given relative to the directory the master is started from."""
+    with open(tmp_path / "sim_config.json", "w", encoding="utf-8") as f:
+        json.dump({"devices": SIM_DEVICES}, f)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv(routing.CONFIG_PATH_ENV, "sim_config.json")
+    return str(tmp_path / "sim_config.json")
+
+
+def test_relative_path_is_resolved_against_the_current_directory(sim_config):
+    assert routing.resolve_config_path() == sim_config
+    assert routing.load_config()["devices"] == SIM_DEVICES
+
+
+def test_default_is_the_repository_config(monkeypatch):
+    monkeypatch.delenv(routing.CONFIG_PATH_ENV, raising=False)
+    assert routing.resolve_config_path() == routing.DEFAULT_CONFIG_PATH
+    assert routing.DEFAULT_CONFIG_PATH.endswith("config.json")
+
+
+def test_registry_reads_the_same_file(sim_config, monkeypatch, tmp_path):
+    registry = routing.RoutingRegistry()
+    monkeypatch.chdir(tmp_path.parent)  # a later chdir does not move the registry
+    assert registry.config_path == sim_config
+    assert registry.device_for_ip("127.0.0.12") == "lock_1"
+
+
+def test_missing_devices_fall_back_to_defaults(tmp_path):
+    path = tmp_path / "empty.json"
+    path.write_text('{"opcua_endpoint": "opc.tcp://elsewhere:4840"}')
+    config = routing.load_config(str(path))
+    assert config["devices"] == routing.DEFAULT_DEVICES
+    assert config["opcua_endpoint"] == "opc.tcp://elsewhere:4840"
+
+
+@pytest.mark.parametrize("module", ["master_hmi", "master_hmi_no_opc"])
+def test_hmis_use_the_registry_device_table(module, sim_config, monkeypatch, tmp_path):
+    pytest.importorskip("mysql.connector")
+    if module == "master_hmi":
+        pytest.importorskip("opcua")
+    monkeypatch.setenv("MASTER_JOURNAL_DIR", str(tmp_path / "journal"))
+    monkeypatch.delitem(sys.modules, module, raising=False)
+    hmi = importlib.import_module(module)
+    registry = routing.RoutingRegistry()
+    registry.lock_to_light()  # loads the table
+    try:
+        assert hmi.DEVICES == registry.devices == SIM_DEVICES
+    finally:
+        sys.modules.pop(module, None)
@@ -0,0 +1,110 @@
+import threading
+
+import pytest
+
+pytest.importorskip("mysql.connector")
+
+from mysql.connector.errors import PoolError  # noqa: E402
+
+from utils import db_pool  # noqa: E402
+
+
+class FakeRawConnection:
+    def __init__(self):
+        self.connected = True
+        self.pings = 0
+
+    def is_connected(self):
+        return self.connected
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        self.pings += 1
+        self.connected = True
+
+    def close(self):
+        pass
+
+
+class FakeMySQLPool:
+    """Stands in for MySQLConnectionPool, handing out pre-made connections."""
+    instances = []
+
+    def __init__(self, pool_name, pool_size, **config):
+        if config.get("host") == "down":
+            raise ConnectionError("cannot connect")
+        self.connections = [FakeRawConnection() for _ in range(pool_size)]
+        self.next = 0
+        FakeMySQLPool.instances.append(self)
+
+    def get_connection(self):
+        cnx = self.connections[self.next % len(self.connections)]
+        self.next += 1
+        return cnx
+
+
+@pytest.fixture(autouse=True)
+def fake_mysql(monkeypatch):
+    FakeMySQLPool.instances = []
+    monkeypatch.setattr(db_pool.mysql.connector.pooling, "MySQLConnectionPool", FakeMySQLPool)
+
+
+def test_acquire_waits_for_a_slot_and_times_out():
+    pool = db_pool.InstrumentedPool(pool_size=1, acquire_timeout=0.05)
+    first = pool.get_connection()
+    with pytest.raises(PoolError):
+        pool.get_connection()
+    assert pool.stats()["timeouts"] == 1
+    released = threading.Timer(0.02, first.close)
+    released.start()
+    second = pool.get_connection(timeout=1.0)
+    second.close()
+    stats = pool.stats()
+    assert stats["in_use"] == 0
+    assert stats["max_in_use"] == 1
+    assert stats["acquired"] == 2
+
+
+def test_close_gives_the_slot_back_once():
+    pool = db_pool.InstrumentedPool(pool_size=1, acquire_timeout=0.05)
+    with pool.get_connection() as cnx:
+        cnx.close()
+    assert pool.stats()["in_use"] == 0
+    pool.get_connection().close()
+
+
+def test_idle_connections_are_pinged_with_reconnect():
+    pool = db_pool.InstrumentedPool(pool_size=1, ping_interval=3600)
+    raw = FakeMySQLPool.instances[0].connections[0]
+    pool.get_connection().close()
+    assert raw.pings == 1  # first use
+    pool.get_connection().close()
+    assert raw.pings == 1  # used recently
+    pool.ping_interval = 0
+    raw.connected = False
+    pool.get_connection().close()
+    assert raw.pings == 2
+    assert pool.stats()["reconnects"] == 1
+
+
+def test_engine_connects_lazily_and_fails_fast_while_down():
+    engine = db_pool.DatabaseEngine({"host": "down"}, retry_interval=60)
+    assert not engine.is_ready()
+    with pytest.raises(PoolError):
+        engine.get_connection()
+    with pytest.raises(PoolError):
+        engine.get_connection()  # within the retry backoff: no new connect attempt
+    assert engine.stats()["ready"] is False
+
+
+def test_engine_runs_ready_callbacks_once():
+    ready = []
+    engine = db_pool.DatabaseEngine({"host": "up"}, pool_config={"pool_size": 2})
+    engine.add_ready_callback(lambda: ready.append(1))
+    assert FakeMySQLPool.instances == []
+    engine.warm_up()
+    assert engine.wait_ready(2)
+    engine.get_connection().close()
+    engine.add_ready_callback(lambda: ready.append(2))
+    assert ready == [1, 2]
+    assert engine.stats()["pool_size"] == 2
+    engine.stop()
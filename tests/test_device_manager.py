@@ -0,0 +1,102 @@
+import asyncio
+import os
+import sys
+import types
+
+import pytest
+
+pytest.importorskip("mysql.connector")  # the master package imports UDPHandler, which needs utils.sql
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from master.handlers import device_manager as dm_module  # noqa: E402
+from master.handlers import udp_server  # noqa: E402
+from master.handlers.device_manager import DeviceManager  # noqa: E402
+from master.config.settings import DEVICE_TYPE_LIGHT  # noqa: E402
+
+
+class FakeJournal:
+    def latest_uids(self):
+        return {}
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setattr(dm_module, "get_journal", FakeJournal)
+    return DeviceManager()
+
+
+def light(manager, lux=1.0):
+    device = manager.register_or_update_device("light_207", DEVICE_TYPE_LIGHT, ("10.0.0.7", 4210))
+    device.update_state("ON")
+    device.update_light_data(lux, 50, 500)
+    return device
+
+
+def test_generation_moves_only_on_change(manager):
+    device = light(manager)
+    assert manager.commit(device)
+    assert manager.generation == 1
+    device.update_light_data(1.0, 50, 500)  # same sample again
+    assert not manager.commit(device)
+    assert manager.generation == 1
+    device.update_light_data(2.0, 50, 500)
+    assert manager.commit(device)
+    assert manager.generation == 2
+
+
+def test_subscribers_get_each_generation_until_unsubscribed(manager):
+    seen = []
+    unsubscribe = manager.subscribe(seen.append)
+    device = light(manager)
+    manager.commit(device)
+    manager.commit(device)  # unchanged: no call
+    unsubscribe()
+    device.update_light_data(3.0, 50, 500)
+    manager.commit(device)
+    assert seen == [1]
+
+
+def test_failing_subscriber_does_not_block_others(manager):
+    seen = []
+    manager.subscribe(lambda generation: 1 / 0)
+    manager.subscribe(seen.append)
+    assert manager.commit(light(manager))
+    assert seen == [1]
+
+
+def test_status_is_rebuilt_only_when_generation_moves(manager):
+    device = light(manager)
+    manager.commit(device)
+    first = manager.get_device_status()
+    assert manager.get_device_status() is first
+    device.update_light_data(5.0, 50, 500)
+    manager.commit(device)
+    second = manager.get_device_status()
+    assert second is not first
+    assert second["lights"][0][2] == "5.0"
+
+
+def test_status_task_redraws_once_per_burst_of_changes(manager):
+    handler = types.SimpleNamespace(device_manager=manager, running=True,
+                                    get_device_status=manager.get_device_status)
+    redraws = []
+
+    async def run():
+        task = asyncio.ensure_future(udp_server._status_task(handler, redraws.append, interval=0))
+        await asyncio.sleep(0)
+        device = light(manager)
+        for lux in (1.0, 2.0, 3.0):  # a burst of changes before the status task runs again
+            device.update_light_data(lux, 50, 500)
+            manager.commit(device)
+        for _ in range(5):
+            await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return manager._subscribers
+
+    subscribers = asyncio.run(run())
+    assert len(redraws) == 2  # the initial draw, then one for the whole burst
+    assert redraws[-1]["lights"][0][2] == "3.0"
+    assert subscribers == []
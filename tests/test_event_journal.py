@@ -0,0 +1,141 @@
+import json
+import os
+import random
+import time
+
+import pytest
+
+from utils.event_journal import EventJournal, JournalReader, message_event, _segment_pid
+from utils.message import parse_text
+
+T0 = 1750000000.0
+
+
+def line(event):
+    """A record line as the writer emits it (compact JSON, ts first)."""
+    return json.dumps(event, separators=(",", ":")) + "\n"
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = EventJournal(str(tmp_path), index_every=256, flush_interval=60)
+    yield journal
+    journal.close()
+
+
+def fill(journal, n, step=1.0):
+    devices = ["light_1", "light_2", "lock_1"]
+    for i in range(n):
+        device = devices[i % len(devices)]
+        type = "send" if i % 4 == 0 else "recv"
+        journal.append(type, device, ts=T0 + i * step, seq=i)
+
+
+def test_tail_returns_the_last_matching_events_oldest_first(journal):
+    fill(journal, 30)
+    assert [e["seq"] for e in journal.tail(3)] == [27, 28, 29]
+    assert [e["seq"] for e in journal.tail(2, device="lock_1")] == [26, 29]
+    assert all(e["type"] == "send" for e in journal.tail(5, type="send"))
+    assert journal.tail(5, device="nobody") == []
+
+
+def test_read_matches_a_full_scan_across_rotated_segments(tmp_path):
+    journal = EventJournal(str(tmp_path), max_segment_bytes=2048, index_every=200, flush_interval=60)
+    fill(journal, 400, step=0.5)
+    events = list(journal.read())
+    assert [e["seq"] for e in events] == list(range(400))
+    assert len(journal.segments()) > 3
+    rng = random.Random(1)
+    for _ in range(50):
+        since = T0 + rng.uniform(-10, 210)
+        until = since + rng.uniform(0, 60)
+        device = rng.choice([None, "light_2", "lock_1"])
+        expected = [e for e in events if since <= e["ts"] < until and device in (None, e["device"])]
+        assert list(journal.read(since, until, device=device)) == expected
+    # Boundaries: since is inclusive, until exclusive
+    assert [e["seq"] for e in journal.read(T0 + 10, T0 + 11)] == [20, 21]
+    journal.close()
+
+
+def test_rotation_writes_summaries_and_prunes_old_segments(tmp_path):
+    journal = EventJournal(str(tmp_path), max_segment_bytes=1024, keep_segments=3, flush_interval=60)
+    fill(journal, 200)
+    journal.close()
+    segments = journal.segments()
+    assert len(segments) == 3
+    for segment in segments[:-1]:
+        summary = JournalReader.load_summary(segment)
+        assert summary["count"] > 0
+        assert summary["first_ts"] <= summary["last_ts"]
+    assert set(os.listdir(tmp_path)) == {
+        os.path.basename(p) for s in segments for p in (s, s[:-6] + ".idx", s[:-6] + ".summary.json")
+    }
+
+
+def test_ts_never_goes_backwards(journal):
+    first = journal.append("recv", "light_1", ts=T0 + 5)
+    second = journal.append("recv", "light_1", ts=T0)
+    assert second["ts"] == first["ts"]
+    assert journal.append("recv", "light_1")["ts"] > first["ts"]
+
+
+def test_latest_uids_survive_a_crash(tmp_path):
+    journal = EventJournal(str(tmp_path), flush_interval=60)
+    journal.append("recv", "lock_1", uid="AAAA", ts=T0)
+    journal.append("recv", "lock_1", uid="BBBB", ts=T0 + 1)
+    journal.append("recv", "lock_2", uid="CCCC", ts=T0 + 2)
+    journal.append("recv", "lock_2", state="LOCKED", ts=T0 + 3)
+    journal.flush()  # no close(): the segment has no summary
+    recovered = EventJournal(str(tmp_path), flush_interval=60)
+    assert recovered.latest_uids() == {"lock_1": "BBBB", "lock_2": "CCCC"}
+    assert recovered.latest_event("recv", "lock_2")["state"] == "LOCKED"
+    assert JournalReader.load_summary(journal.segments()[0])["count"] == 4
+    recovered.close()
+
+
+def test_live_segment_of_another_writer_is_not_summarized(tmp_path):
+    other = tmp_path / f"events-20250615-000000-{os.getppid()}-000001.jsonl"
+    assert _segment_pid(str(other)) == os.getppid()
+    with open(other, "w", encoding="utf-8") as f:
+        f.write(line({"ts": T0, "type": "recv", "device": "lock_1", "uid": "AAAA"}))
+    journal = EventJournal(str(tmp_path), flush_interval=60)
+    assert JournalReader.load_summary(str(other)) is None
+    assert journal.latest_uids() == {"lock_1": "AAAA"}
+    with open(other, "a", encoding="utf-8") as f:  # the other writer carries on
+        f.write(line({"ts": T0 + 1, "type": "recv", "device": "lock_1", "uid": "BBBB"}))
+    reader = JournalReader(str(tmp_path))
+    assert [e["uid"] for e in reader.read(since=T0, device="lock_1")] == ["AAAA", "BBBB"]
+    assert reader.tail(1, device="lock_1")[0]["uid"] == "BBBB"
+    journal.close()
+
+
+def test_partial_last_line_is_skipped(tmp_path):
+    segment = tmp_path / "events-20250615-000000-1-000001.jsonl"
+    with open(segment, "w", encoding="utf-8") as f:
+        f.write(line({"ts": T0, "type": "recv", "device": "light_1"}))
+        f.write('{"ts":1750000001.0,"type":"re')
+    reader = JournalReader(str(tmp_path))
+    assert len(list(reader.read())) == 1
+    assert len(reader.tail(5)) == 1
+
+
+def test_message_event_fields():
+    msg = parse_text("lock_1:UID:ABCD", ("192.168.137.250", 4210))
+    event = message_event(msg, tap="lock_1#1")
+    ts = event.pop("ts")
+    assert event == {
+        "type": "recv", "device": "lock_1", "kind": "lock", "raw": "lock_1:UID:ABCD",
+        "ip": "192.168.137.250", "port": 4210, "uid": "UID:ABCD", "tap": "lock_1#1",
+    }
+    assert abs(ts - time.time()) < 1
+
+
+def test_queued_messages_are_journaled_at_their_receive_time(journal):
+    first = parse_text("light_1:ON:1.0:2:3")
+    first.received_at -= 2.0  # received two seconds before it is journaled
+    second = parse_text("light_1:OFF:1.0:2:3")
+    before = time.time()
+    a = journal.append(**message_event(first))
+    b = journal.append(**message_event(second))
+    assert a["ts"] < before - 1.5
+    assert a["ts"] < b["ts"]
@@ -0,0 +1,133 @@
+from gui_dispatcher import GuiDispatcher, LogView
+
+
+class FakeRoot:
+    """Collects after() callbacks instead of running a Tk main loop."""
+
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, ms, func):
+        self.scheduled.append((ms, func))
+
+    def run_next(self):
+        _, func = self.scheduled.pop(0)
+        func()
+
+
+class FakeText:
+    """The parts of a ScrolledText that LogView uses."""
+
+    def __init__(self):
+        self.text = ""
+
+    def config(self, **kwargs):
+        pass
+
+    def insert(self, index, text):
+        self.text += text
+
+    def delete(self, start, end):
+        if end == 'end':
+            self.text = ""
+        else:
+            keep_from = int(end.split('.')[0]) - 1
+            self.text = "".join(self.text.splitlines(keepends=True)[keep_from:])
+
+    def see(self, index):
+        pass
+
+
+def dispatcher(**kwargs):
+    root = FakeRoot()
+    gui = GuiDispatcher(root, **kwargs)
+    gui.start()
+    return root, gui
+
+
+def test_posts_run_in_order_on_the_next_tick():
+    root, gui = dispatcher()
+    ran = []
+    gui.post(ran.append, 1)
+    gui.post(ran.append, 2)
+    assert ran == []
+    root.run_next()
+    assert ran == [1, 2]
+    assert gui.stats()["processed"] == 2
+
+
+def test_keyed_posts_coalesce_in_place():
+    root, gui = dispatcher()
+    ran = []
+    gui.post(ran.append, "telemetry 1", key=("telemetry", "light_207"))
+    gui.post(ran.append, "tap", key=None)
+    gui.post(ran.append, "telemetry 2", key=("telemetry", "light_207"))
+    assert gui.depth() == 2
+    root.run_next()
+    assert ran == ["telemetry 2", "tap"]  # the latest value, at the first post's place
+    assert gui.coalesced == 1
+
+
+def test_state_changes_are_never_dropped():
+    root, gui = dispatcher(max_pending=3)
+    ran = []
+    for i in range(10):
+        assert gui.post(ran.append, i)
+    assert not gui.post(ran.append, "display only", droppable=True)
+    assert gui.dropped == 1
+    while gui.depth():
+        root.run_next()
+    assert ran == list(range(10))
+
+
+def test_droppable_posts_are_accepted_below_the_limit():
+    root, gui = dispatcher(max_pending=3)
+    ran = []
+    assert gui.post(ran.append, "a", droppable=True)
+    root.run_next()
+    assert ran == ["a"]
+
+
+def test_work_over_budget_continues_on_the_next_tick():
+    root, gui = dispatcher(budget_ms=0, interval_ms=50)
+    ran = []
+    gui.post(ran.append, 1)
+    gui.post(ran.append, 2)
+    root.run_next()
+    assert ran == []
+    assert root.scheduled[-1][0] == 1  # rescheduled at once, not after interval_ms
+
+
+def test_pumps_and_end_hooks():
+    root, gui = dispatcher()
+    pulled = []
+    ended = []
+    gui.add_pump(lambda deadline: pulled.append(deadline) or False)
+    gui.add_end_hook(lambda: ended.append(True))
+    root.run_next()
+    assert len(pulled) == 1 and ended == [True]
+    assert root.scheduled[-1][0] == gui.interval_ms
+
+
+def test_failing_callback_is_counted():
+    root, gui = dispatcher()
+    ran = []
+    gui.post(lambda: 1 / 0)
+    gui.post(ran.append, "next")
+    root.run_next()
+    assert ran == ["next"]
+    assert gui.failed == 1
+
+
+def test_log_view_keeps_the_last_lines():
+    widget = FakeText()
+    view = LogView(widget, max_lines=3)
+    for i in range(5):
+        view.append(f"line {i}")
+    view.flush()
+    assert widget.text == "line 2\nline 3\nline 4\n"
+    view.append("line 5")
+    view.flush()
+    assert widget.text == "line 3\nline 4\nline 5\n"
+    view.clear()
+    assert widget.text == "" and view.lines == 0
@@ -0,0 +1,94 @@
+import heapq
+import socket
+import threading
+import time
+
+import pytest
+
+from heartbeat import HeartbeatListener
+
+
+class Alarms:
+    def __init__(self):
+        self.calls = []
+        self.changed = threading.Event()
+
+    def __call__(self, device, alarm_on):
+        self.calls.append((device, alarm_on))
+        self.changed.set()
+
+
+@pytest.fixture
+def alarms():
+    return Alarms()
+
+
+@pytest.fixture
+def listener(alarms):
+    listener = HeartbeatListener(["light_207", "lock_207"], alarms, port=0, timeout=0.2)
+    yield listener
+    listener.stop()
+
+
+def test_alarm_is_raised_once_when_beats_stop_and_cleared_once_they_return(listener, alarms):
+    listener._on_heartbeat("light_207")
+    listener.last_heartbeat["lock_207"] -= 1.0
+    heapq.heappush(listener._deadlines, (0.0, "lock_207"))
+    listener._expire_deadlines()
+    listener._expire_deadlines()
+    assert alarms.calls == [("lock_207", True)]
+    listener._on_heartbeat("lock_207")
+    listener._on_heartbeat("lock_207")
+    assert alarms.calls == [("lock_207", True), ("lock_207", False)]
+
+
+def test_unknown_devices_are_ignored(listener, alarms):
+    listener._on_heartbeat("fan_1")
+    assert "fan_1" not in listener.get_stats()
+    assert alarms.calls == []
+
+
+def test_interval_and_jitter_statistics(listener):
+    start = time.monotonic()
+    for i, gap in enumerate([0.0, 1.0, 1.0, 1.2]):
+        listener.last_heartbeat["light_207"] -= gap  # as if the previous beat came gap seconds earlier
+        listener._on_heartbeat("light_207")
+    st = listener.get_stats()["light_207"]
+    assert st["count"] == 4
+    assert 0.9 < st["interval"] < 1.1
+    assert 0.0 < st["jitter"] < 0.2
+    assert st["alive"]
+    assert st["age"] < time.monotonic() - start + 0.01
+
+
+def test_flat_stats_for_metrics(listener):
+    listener._on_heartbeat("light_207")
+    listener.last_heartbeat["light_207"] -= 0.5
+    listener._on_heartbeat("light_207")
+    flat = listener.flat_stats()
+    assert flat["light_207_count"] == 2
+    assert flat["light_207_alive"] is True
+    assert abs(flat["light_207_interval_seconds"] - 0.5) < 0.05
+    assert flat["light_207_jitter_seconds"] == 0.0
+    assert "lock_207_interval_seconds" not in flat  # no interval before the second beat
+    assert all(isinstance(v, (int, float)) for v in flat.values())
+    assert listener.summary_lines()[1].startswith("lock_207: alive, last beat")
+
+
+def test_listens_on_udp(listener, alarms):
+    listener.start()
+    port = listener.sock.getsockname()[1]
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        deadline = time.monotonic() + 2
+        while listener.get_stats()["light_207"]["count"] == 0 and time.monotonic() < deadline:
+            sender.sendto(b"light_207:HEARTBEAT", ("127.0.0.1", port))
+            time.sleep(0.02)
+    finally:
+        sender.close()
+    assert listener.get_stats()["light_207"]["count"] > 0
+    deadline = time.monotonic() + 2
+    while ("lock_207", True) not in alarms.calls and time.monotonic() < deadline:
+        alarms.changed.wait(0.05)
+    assert ("lock_207", True) in alarms.calls  # lock_207 never beat
+    assert alarms.calls[:2] == [("light_207", False), ("lock_207", False)]
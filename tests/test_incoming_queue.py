@@ -0,0 +1,55 @@
+import queue
+import threading
+
+import pytest
+
+pytest.importorskip("mysql.connector")
+
+import network  # noqa: E402
+from utils.message import parse_datagram  # noqa: E402
+
+
+def handler(maxsize):
+    """A MasterNetworkHandler with only the incoming queue set up (no sockets or threads)."""
+    net = network.MasterNetworkHandler.__new__(network.MasterNetworkHandler)
+    net.incoming_queue = queue.Queue()
+    net.incoming_maxsize = maxsize
+    net.incoming_dropped = 0
+    net._sheddable_queued = 0
+    net._incoming_lock = threading.Lock()
+    return net
+
+
+def drain(net):
+    items = []
+    while (item := net.get_incoming()) is not None:
+        items.append(item)
+    return items
+
+
+def test_telemetry_is_shed_past_the_limit():
+    net = handler(maxsize=2)
+    for i in range(5):
+        net._put_incoming(parse_datagram(f"light_207:ON:{i}.0:50:500".encode()))
+    assert net.incoming_dropped == 3
+    assert [m.lux for m in drain(net)] == [0.0, 1.0]
+
+
+def test_lock_events_are_never_dropped():
+    net = handler(maxsize=1)
+    net._put_incoming("From ('10.0.0.5', 1): noise")
+    net._put_incoming(parse_datagram(b"light_207:ON:1.0:50:500"))
+    net._put_incoming(parse_datagram(b"lock_207:04:47:43:12:7A:6A:80"))
+    net._put_incoming(parse_datagram(b"lock_207:UNLOCKED"))
+    items = drain(net)
+    assert net.incoming_dropped == 1
+    assert [getattr(m, "kind", "text") for m in items] == ["text", "lock", "lock"]
+
+
+def test_draining_makes_room_again():
+    net = handler(maxsize=1)
+    net._put_incoming("first")
+    assert drain(net) == ["first"]
+    net._put_incoming("second")
+    assert drain(net) == ["second"]
+    assert net.incoming_dropped == 0
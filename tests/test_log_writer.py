@@ -0,0 +1,70 @@
+import threading
+
+from utils.log_writer import BatchedLogWriter
+
+
+class RecordingConnection:
+    def __init__(self, sink, fail=False):
+        self.sink = sink
+        self.fail = fail
+
+    def cursor(self):
+        return self
+
+    def executemany(self, query, rows):
+        if self.fail:
+            raise ConnectionError("db down")
+        self.sink.append((query.split()[2], list(rows)))
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def row(i):
+    return ("2025-06-15 12:00:00", "light_207", "status", "ON", i, None, None, f"raw {i}")
+
+
+def test_rows_are_batched_per_table_and_flushed_on_stop():
+    inserts = []
+    writer = BatchedLogWriter(lambda: RecordingConnection(inserts), batch_size=50, flush_interval=60)
+    for i in range(120):
+        writer.submit("incoming_logs" if i % 3 else "outgoing_logs", row(i))
+    writer.stop()
+    assert sum(len(rows) for _, rows in inserts) == 120
+    assert {table for table, _ in inserts} == {"incoming_logs", "outgoing_logs"}
+    assert all(len(rows) <= 50 for _, rows in inserts)
+    assert writer.stats()["written"] == 120
+    assert writer.stats()["queued"] == 0
+
+
+def test_submit_drops_rows_when_the_queue_is_full():
+    gate = threading.Event()
+    writer = BatchedLogWriter(lambda: RecordingConnection([]), is_ready=gate.is_set, max_queue=5, flush_interval=0.01)
+    results = [writer.submit("incoming_logs", row(i)) for i in range(8)]
+    assert results.count(False) == 3
+    assert writer.dropped == 3
+    gate.set()
+    writer.stop()
+    assert writer.written == 5
+
+
+def test_failed_flush_is_counted_not_raised():
+    writer = BatchedLogWriter(lambda: RecordingConnection([], fail=True), flush_interval=60)
+    writer.submit("incoming_logs", row(1))
+    writer.stop()
+    assert writer.failed == 1
+    assert writer.written == 0
+
+
+def test_tables_are_ensured_once():
+    ensured = []
+    writer = BatchedLogWriter(lambda: RecordingConnection([]), ensure_tables=lambda: ensured.append(1),
+                              batch_size=1, flush_interval=0.01)
+    for i in range(3):
+        writer.submit("incoming_logs", row(i))
+    writer.stop()
+    assert writer.written == 3
+    assert ensured == [1]
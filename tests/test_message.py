@@ -0,0 +1,76 @@
+import pytest
+
+from utils.message import (
+    KIND_HEARTBEAT, KIND_LIGHT, KIND_LOCK, KIND_UNKNOWN,
+    parse_datagram, parse_logged_line, parse_text,
+)
+
+ADDR = ("192.168.137.248", 4210)
+
+
+def test_light_status_with_all_fields():
+    msg = parse_datagram(b"light_208:OFF:9.6:0:557\n", ADDR)
+    assert (msg.device_id, msg.kind, msg.state) == ("light_208", KIND_LIGHT, "OFF")
+    assert (msg.lux, msg.pwm, msg.ldr) == (9.6, 0, 557)
+    assert msg.raw == "light_208:OFF:9.6:0:557"
+    assert msg.ip == ADDR[0]
+    assert not msg.is_uid
+
+
+def test_light_status_without_ldr_or_telemetry():
+    msg = parse_text("light_207:ON:120.5:255")
+    assert (msg.lux, msg.pwm, msg.ldr) == (120.5, 255, None)
+    bare = parse_text("light_207:ON")
+    assert (bare.state, bare.lux, bare.pwm) == ("ON", None, None)
+
+
+def test_light_with_malformed_numbers_keeps_the_rest():
+    msg = parse_text("light_207:ON:abc:12:x")
+    assert (msg.state, msg.lux, msg.pwm, msg.ldr) == ("ON", None, 12, None)
+
+
+@pytest.mark.parametrize("state", ["LOCKED", "UNLOCKED"])
+def test_lock_state(state):
+    msg = parse_text(f"lock_207:{state}")
+    assert (msg.kind, msg.state, msg.uid) == (KIND_LOCK, state, None)
+
+
+def test_lock_uid_keeps_its_colons():
+    msg = parse_datagram(bytearray(b"lock_207:04:47:43:12:7A:6A:80"), ADDR)
+    assert (msg.kind, msg.state, msg.uid) == (KIND_LOCK, None, "04:47:43:12:7A:6A:80")
+    assert msg.is_uid
+
+
+def test_heartbeat_and_unknown_devices():
+    assert parse_text("light_207:HEARTBEAT").kind == KIND_HEARTBEAT
+    assert parse_text("lock_208:HEARTBEAT").state == "HEARTBEAT"
+    other = parse_text("fan_1:SPIN:3")
+    assert (other.kind, other.state) == (KIND_UNKNOWN, "SPIN:3")
+
+
+def test_memoryview_input():
+    msg = parse_datagram(memoryview(b"  lock_207:UNLOCKED  "))
+    assert msg.state == "UNLOCKED"
+
+
+@pytest.mark.parametrize("data", [b"", b"no separator", b":ON", b"   "])
+def test_datagrams_without_a_device_are_rejected(data):
+    assert parse_datagram(data) is None
+
+
+def test_undecodable_bytes_do_not_raise():
+    msg = parse_datagram(b"light_1:\xff\xfe:1.0:2")
+    assert msg.kind == KIND_LIGHT
+    assert msg.lux == 1.0
+
+
+def test_logged_line_with_source():
+    msg = parse_logged_line("[12:00:01] From ('192.168.137.250', 4210): lock_207:UNLOCKED")
+    assert msg.addr == ("192.168.137.250", 4210)
+    assert (msg.device_id, msg.state) == ("lock_207", "UNLOCKED")
+
+
+def test_logged_line_without_source():
+    msg = parse_logged_line("light_208:ON:1.0:2:3")
+    assert msg.addr is None
+    assert msg.pwm == 2
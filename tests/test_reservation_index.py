@@ -0,0 +1,203 @@
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from utils.reservation_index import ReservationIndex, to_seconds, to_date_str
+
+TODAY = date.today().strftime('%Y-%m-%d')
+YESTERDAY = (date.today() - timedelta(days=1)).strftime('%Y-%m-%d')
+LOCK_IP = '192.168.137.250'
+
+
+class FakeCursor:
+    """Enough of a mysql-connector cursor over SQLite (%s placeholders)."""
+
+    def __init__(self, db):
+        self._cursor = db.cursor()
+
+    def execute(self, query, params=()):
+        self._cursor.execute(query.replace('%s', '?'), params)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def close(self):
+        self._cursor.close()
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self._db = db
+
+    def cursor(self):
+        return FakeCursor(self._db)
+
+    def close(self):
+        pass
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.db = sqlite3.connect(":memory:")
+        self.db.executescript("""
+            CREATE TABLE slave (ip_address TEXT, room_id INTEGER);
+            CREATE TABLE room_reservations (
+                reservation_id INTEGER PRIMARY KEY, room_id INTEGER, user_id TEXT,
+                date TEXT, start_time TEXT, end_time TEXT
+            );
+        """)
+        self.db.execute("INSERT INTO slave VALUES (?, ?)", (LOCK_IP, 207))
+        self.queries = 0
+
+    def connect(self):
+        self.queries += 1
+        return FakeConnection(self.db)
+
+    def reserve(self, user_id, start, end, day=TODAY, room_id=207, reservation_id=None):
+        self.db.execute(
+            "INSERT INTO room_reservations VALUES (?, ?, ?, ?, ?, ?)",
+            (reservation_id, room_id, user_id, day, start, end)
+        )
+
+    def delete(self, user_id):
+        self.db.execute("DELETE FROM room_reservations WHERE user_id = ?", (user_id,))
+
+
+def at(hhmmss):
+    return datetime.combine(date.today(), datetime.strptime(hhmmss, '%H:%M:%S').time())
+
+
+@pytest.fixture
+def database():
+    return FakeDatabase()
+
+
+@pytest.fixture
+def index(database):
+    return ReservationIndex(database.connect, full_reload_interval=3600.0)
+
+
+def test_time_and_date_conversions():
+    assert to_seconds(timedelta(hours=1, minutes=2, seconds=3)) == 3723
+    assert to_seconds("08:30:00") == 30600
+    assert to_seconds(at("08:30:05").time()) == 30605
+    assert to_date_str(date(2025, 6, 5)) == "2025-06-05"
+    assert to_date_str("2025-06-05") == "2025-06-05"
+
+
+def test_not_fresh_until_loaded(index):
+    assert not index.is_fresh()
+    index.refresh()
+    assert index.is_fresh()
+
+
+def test_access_follows_reservation_interval(database, index):
+    database.reserve("u1", "08:00:00", "10:00:00")
+    index.refresh()
+    assert index.get_room_id(LOCK_IP) == 207
+    assert index.has_user("u1")
+    assert index.is_access_allowed("u1", LOCK_IP, now=at("08:00:00"))
+    assert index.is_access_allowed("u1", LOCK_IP, now=at("10:00:00"))
+    assert not index.is_access_allowed("u1", LOCK_IP, now=at("10:00:01"))
+    assert not index.is_access_allowed("u2", LOCK_IP, now=at("09:00:00"))
+    assert not index.is_access_allowed("u1", "10.0.0.1", now=at("09:00:00"))
+
+
+def test_several_intervals_per_user(database, index):
+    database.reserve("u1", "13:00:00", "14:00:00")
+    database.reserve("u1", "08:00:00", "09:00:00")
+    database.reserve("u1", "08:30:00", "12:00:00")  # overlaps the first one
+    index.refresh()
+    assert index.is_access_allowed("u1", LOCK_IP, now=at("11:00:00"))
+    assert index.is_access_allowed("u1", LOCK_IP, now=at("13:30:00"))
+    assert not index.is_access_allowed("u1", LOCK_IP, now=at("12:30:00"))
+
+
+def test_past_days_are_not_indexed_but_their_users_are_known(database, index):
+    database.reserve("old", "08:00:00", "10:00:00", day=YESTERDAY)
+    index.refresh()
+    assert index.has_user("old")
+    assert index.export({YESTERDAY})[2] == []
+
+
+def test_incremental_refresh_merges_rows_above_the_watermark(database, index):
+    database.reserve("u1", "08:00:00", "09:00:00")
+    index.refresh()
+    full_reload_at = index._last_full_reload
+    version = index.version
+    database.reserve("u2", "09:00:00", "10:00:00")
+    index.refresh()
+    assert index._last_full_reload == full_reload_at  # merged, not reloaded
+    assert index.version == version + 1
+    assert index.is_access_allowed("u2", LOCK_IP, now=at("09:30:00"))
+    assert index.has_user("u2")
+    assert index._watermark == 2
+
+
+def test_refresh_without_changes_keeps_the_version(database, index):
+    database.reserve("u1", "08:00:00", "09:00:00")
+    index.refresh()
+    version = index.version
+    index.refresh()
+    assert index.version == version
+
+
+def test_deleted_reservation_triggers_full_reload(database, index):
+    database.reserve("u1", "08:00:00", "09:00:00")
+    database.reserve("u2", "08:00:00", "09:00:00")
+    index.refresh()
+    database.delete("u1")
+    index.refresh()
+    assert not index.is_access_allowed("u1", LOCK_IP, now=at("08:30:00"))
+    assert index.is_access_allowed("u2", LOCK_IP, now=at("08:30:00"))
+    assert not index.has_user("u1")
+
+
+def test_row_inserted_below_the_watermark_is_found_by_the_drift_check(database, index):
+    database.reserve("u1", "08:00:00", "09:00:00", reservation_id=5)
+    index.refresh()
+    database.reserve("late", "08:00:00", "09:00:00", reservation_id=3)
+    index.refresh()
+    assert index.is_access_allowed("late", LOCK_IP, now=at("08:30:00"))
+
+
+def test_in_place_edits_need_invalidate(database, index):
+    database.reserve("u1", "08:00:00", "09:00:00")
+    index.refresh()
+    database.db.execute("UPDATE room_reservations SET end_time = '11:00:00'")
+    index.refresh()
+    assert not index.is_access_allowed("u1", LOCK_IP, now=at("10:00:00"))
+    index.invalidate()
+    index.refresh()
+    assert index.is_access_allowed("u1", LOCK_IP, now=at("10:00:00"))
+
+
+def test_on_change_is_called_after_loads(database):
+    changes = []
+    index = ReservationIndex(database.connect, full_reload_interval=3600.0, on_change=lambda: changes.append(1))
+    index.refresh()
+    database.reserve("u1", "08:00:00", "09:00:00")
+    index.refresh()
+    index.refresh()
+    assert len(changes) == 2
+
+
+def test_room_schedule_and_export(database, index):
+    database.reserve("u2", "10:00:00", "11:00:00")
+    database.reserve("u1", "08:00:00", "09:00:00")
+    database.reserve("u3", "08:00:00", "09:00:00", room_id=208)
+    index.refresh()
+    assert index.room_schedule(207, TODAY) == [(28800, 32400, "u1"), (36000, 39600, "u2")]
+    assert index.room_schedule(209, TODAY) == []
+    ip_to_room, user_ids, rows = index.export({TODAY})
+    assert ip_to_room == {LOCK_IP: 207}
+    assert user_ids == {"u1", "u2", "u3"}
+    assert sorted(rows) == [
+        (207, "u1", TODAY, 28800, 32400),
+        (207, "u2", TODAY, 36000, 39600),
+        (208, "u3", TODAY, 28800, 32400),
+    ]
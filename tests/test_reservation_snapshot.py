@@ -0,0 +1,87 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from utils.reservation_snapshot import SNAPSHOT_PATH_ENV, ReservationSnapshot
+
+NOW = datetime(2025, 6, 15, 9, 30, 0)
+DAY = "2025-06-15"
+
+
+class RecordingConnection:
+    def __init__(self, sink, fail=False):
+        self.sink = sink
+        self.fail = fail
+
+    def cursor(self):
+        return self
+
+    def executemany(self, query, rows):
+        if self.fail:
+            raise ConnectionError("db down")
+        self.sink.extend(rows)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    snapshot = ReservationSnapshot(str(tmp_path / "snap" / "reservations.db"))
+    snapshot.save({"10.0.0.1": 207}, {"u1", "u2"}, [(207, "u1", DAY, 8 * 3600, 10 * 3600)])
+    return snapshot
+
+
+def test_nothing_is_created_until_first_use(tmp_path, monkeypatch):
+    path = tmp_path / "env" / "snapshot.db"
+    monkeypatch.setenv(SNAPSHOT_PATH_ENV, str(path))
+    snapshot = ReservationSnapshot()
+    assert not os.path.exists(path.parent)
+    assert snapshot.saved_at() is None
+    assert snapshot.path == str(path)
+    assert os.path.exists(path)
+
+
+def test_answers_like_the_database(snapshot):
+    assert snapshot.has_user("u2")
+    assert not snapshot.has_user("u3")
+    assert snapshot.room_for_ip("10.0.0.1") == "207"
+    assert snapshot.is_access_allowed("u1", "10.0.0.1", now=NOW)
+    assert snapshot.is_access_allowed("u1", None, now=NOW, room_id=207)
+    assert not snapshot.is_access_allowed("u1", "10.0.0.1", now=NOW.replace(hour=11))
+    assert not snapshot.is_access_allowed("u1", "10.0.0.1", now=NOW.replace(day=16))
+    assert not snapshot.is_access_allowed("u2", "10.0.0.1", now=NOW)
+    assert not snapshot.is_access_allowed("u1", "10.0.0.9", now=NOW)
+
+
+def test_save_replaces_the_previous_snapshot(snapshot):
+    snapshot.save({}, {"u3"}, [])
+    assert not snapshot.has_user("u1")
+    assert snapshot.room_for_ip("10.0.0.1") is None
+    assert snapshot.saved_at() is not None
+    assert snapshot.saved == 2
+
+
+def test_offline_decisions_are_synced_in_order(snapshot):
+    synced = []
+    snapshot.record_audit("u1", "10.0.0.1", 207, True)
+    snapshot.record_audit("u2", "10.0.0.1", 207, False)
+    assert snapshot.pending_audit_count() == 2
+    snapshot.connection_factory = lambda: RecordingConnection(synced)
+    assert snapshot.sync_audit(batch_size=1) == 1
+    assert snapshot.sync_audit() == 1
+    assert snapshot.sync_audit() == 0
+    assert [(row[1], row[4]) for row in synced] == [("u1", 1), ("u2", 0)]
+    assert snapshot.pending_audit_count() == 0
+
+
+def test_failed_sync_keeps_the_audit_rows(snapshot):
+    snapshot.record_audit("u1", "10.0.0.1", 207, True)
+    snapshot.connection_factory = lambda: RecordingConnection([], fail=True)
+    with pytest.raises(ConnectionError):
+        snapshot.sync_audit()
+    assert snapshot.pending_audit_count() == 1
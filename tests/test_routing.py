@@ -0,0 +1,88 @@
+import json
+import os
+
+import pytest
+
+from utils.routing import DEFAULT_DEVICES, RoutingRegistry
+
+DEVICES = {
+    "lock_301": {"ip": "10.0.0.1", "port": 4210, "type": "lock"},
+    "light_301": {"ip": "10.0.0.2", "port": 4210, "type": "light"},
+    "lock_302": {"ip": "10.0.0.3", "port": 4210, "type": "lock"},
+    "combo_303": {"ip": "10.0.0.4", "port": 4210, "type": "lock"},
+    "light_303": {"ip": "10.0.0.4", "port": 4211, "type": "light"},
+}
+
+
+def write_config(path, devices):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"devices": devices}, f)
+
+
+@pytest.fixture
+def config(tmp_path):
+    path = tmp_path / "config.json"
+    write_config(path, DEVICES)
+    return str(path)
+
+
+def test_lookups(config):
+    registry = RoutingRegistry(config)
+    assert registry.is_allowed_ip("10.0.0.1")
+    assert not registry.is_allowed_ip("10.0.0.99")
+    assert registry.device_for_ip("10.0.0.2") == "light_301"
+    assert registry.device_for_ip("10.0.0.99") is None
+    assert registry.device_info("lock_302")["ip"] == "10.0.0.3"
+
+
+def test_one_ip_with_several_device_types(config):
+    registry = RoutingRegistry(config)
+    assert registry.device_for_ip("10.0.0.4") == "combo_303"  # first configured wins
+    assert registry.device_for_ip("10.0.0.4", "light") == "light_303"
+    assert registry.device_for_ip("10.0.0.4", "lock") == "combo_303"
+
+
+def test_locks_pair_with_the_light_of_their_room(config):
+    registry = RoutingRegistry(config)
+    assert registry.lock_to_light() == {"lock_301": "light_301", "combo_303": "light_303"}
+    assert registry.light_for_lock("lock_302") is None
+
+
+def test_rooms_come_from_the_slave_table(config):
+    calls = []
+
+    def load_rooms():
+        calls.append(1)
+        return {"10.0.0.1": 301}
+    registry = RoutingRegistry(config, room_loader=load_rooms)
+    assert registry.is_allowed_ip("10.0.0.1")
+    assert calls == []  # the allowlist never queries the DB
+    assert registry.room_for_ip("10.0.0.1") == 301
+    assert registry.room_for_device("lock_301") == 301
+    assert registry.room_for_device("nobody") is None
+    assert len(calls) == 1  # cached until room_refresh_interval
+
+
+def test_failed_room_load_is_retried_later(config):
+    def load_rooms():
+        raise ConnectionError("db down")
+    registry = RoutingRegistry(config, room_loader=load_rooms, room_retry_interval=60)
+    assert registry.room_for_ip("10.0.0.1") is None
+    assert registry.device_for_ip("10.0.0.1") == "lock_301"
+
+
+def test_config_changes_are_picked_up(config):
+    registry = RoutingRegistry(config, check_interval=0)
+    assert not registry.is_allowed_ip("10.0.0.50")
+    write_config(config, {"lock_401": {"ip": "10.0.0.50", "port": 4210, "type": "lock"}})
+    os.utime(config, (0, 12345))  # mtime change even within the filesystem's timestamp resolution
+    assert registry.is_allowed_ip("10.0.0.50")
+    assert not registry.is_allowed_ip("10.0.0.1")
+
+
+def test_missing_or_broken_config_falls_back_to_defaults(tmp_path):
+    missing = RoutingRegistry(str(tmp_path / "missing.json"))
+    assert missing.device_info("lock_207") == DEFAULT_DEVICES["lock_207"]
+    broken = tmp_path / "broken.json"
+    broken.write_text("{not json")
+    assert RoutingRegistry(str(broken)).is_allowed_ip(DEFAULT_DEVICES["lock_207"]["ip"])
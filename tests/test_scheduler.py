@@ -0,0 +1,71 @@
+import threading
+import time
+
+import pytest
+
+from utils.scheduler import ActionScheduler
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = ActionScheduler()
+    yield scheduler
+    scheduler.stop()
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return predicate()
+
+
+def test_actions_run_in_due_order(scheduler):
+    ran = []
+    scheduler.schedule("b", 0.06, ran.append, "b")
+    scheduler.schedule("a", 0.02, ran.append, "a")
+    assert wait_for(lambda: len(ran) == 2)
+    assert ran == ["a", "b"]
+    assert scheduler.executed == 2
+
+
+def test_rescheduling_a_key_replaces_the_pending_action(scheduler):
+    ran = []
+    scheduler.schedule("lock_207", 0.02, ran.append, 1)
+    scheduler.schedule("lock_207", 0.05, ran.append, 2)
+    assert wait_for(lambda: ran)
+    time.sleep(0.05)
+    assert ran == [2]
+    assert scheduler.replaced == 1
+
+
+def test_cancel(scheduler):
+    ran = []
+    scheduler.schedule("lock_207", 0.03, ran.append, 1)
+    assert scheduler.cancel("lock_207")
+    assert not scheduler.cancel("lock_207")
+    time.sleep(0.08)
+    assert ran == []
+    assert scheduler.pending() == []
+
+
+def test_pending_lists_soonest_first(scheduler):
+    def relock():
+        pass
+    scheduler.schedule("late", 10, relock)
+    scheduler.schedule("soon", 5, relock)
+    pending = scheduler.pending()
+    assert [key for key, _, _ in pending] == ["soon", "late"]
+    assert 4 < pending[0][1] <= 5
+    assert pending[0][2] == "relock"
+
+
+def test_a_failing_action_does_not_stop_the_worker(scheduler):
+    done = threading.Event()
+
+    def boom():
+        raise RuntimeError("relock failed")
+    scheduler.schedule("x", 0, boom)
+    scheduler.schedule("y", 0.01, done.set)
+    assert done.wait(2)
+    assert scheduler.failed == 1
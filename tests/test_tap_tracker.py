@@ -0,0 +1,106 @@
+import time
+
+from utils.tap_tracker import TapTracker, percentile
+
+
+def granted_tap(tracker, lock, received_at, sent_after=0.01, uid="u1"):
+    tap = tracker.begin(lock, uid, received_at=received_at)
+    tracker.mark(tap, "validated", received_at + sent_after / 2)
+    tracker.decided(tap, True)
+    tracker.sent(tap, at=received_at + sent_after)
+    return tap
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile([], 0.5) is None
+    assert percentile(values, 0.50) == 50
+    assert percentile(values, 0.95) == 95
+    assert percentile(values, 0.99) == 99
+    assert percentile([7], 0.99) == 7
+
+
+def test_echo_confirms_the_oldest_pending_tap():
+    tracker = TapTracker()
+    now = time.monotonic()
+    first = granted_tap(tracker, "lock_1", now - 1.0)
+    second = granted_tap(tracker, "lock_1", now - 0.5)
+    assert tracker.confirm("lock_1", "UNLOCKED", at=now) is first
+    assert first.outcome == "confirmed"
+    assert abs(first.elapsed_ms("confirmed") - 1000) < 1e-6
+    assert second.outcome is None
+    assert tracker.stats()["lock_1"]["pending"] == 1
+
+
+def test_locked_state_does_not_confirm():
+    tracker = TapTracker()
+    granted_tap(tracker, "lock_1", time.monotonic())
+    assert tracker.confirm("lock_1", "LOCKED") is None
+    assert tracker.stats()["lock_1"]["pending"] == 1
+
+
+def test_denied_taps_are_closed_when_sent():
+    tracker = TapTracker()
+    tap = tracker.begin("lock_1", "u9", received_at=time.monotonic())
+    tracker.decided(tap, False)
+    tracker.sent(tap)
+    assert tap.outcome == "denied"
+    stats = tracker.stats()["lock_1"]
+    assert stats["denied"] == 1
+    assert stats["pending"] == 0
+    assert stats["reply_ms"]["n"] == 1
+
+
+def test_finish_closes_unsent_taps_once():
+    tracker = TapTracker()
+    tap = tracker.begin("lock_1", "u9")
+    tracker.decided(tap, False)
+    tracker.finish(tap)
+    tracker.finish(tap)
+    assert tracker.stats()["lock_1"]["denied"] == 1
+
+
+def test_echo_without_a_pending_tap_is_counted():
+    tracker = TapTracker()
+    assert tracker.confirm("lock_2", "UNLOCKED") is None
+    assert tracker.stats()["lock_2"]["unmatched_echoes"] == 1
+
+
+def test_taps_expire_unconfirmed():
+    tracker = TapTracker(confirm_timeout=5.0)
+    now = time.monotonic()
+    stale = granted_tap(tracker, "lock_1", now - 10.0)
+    fresh = granted_tap(tracker, "lock_1", now - 1.0)
+    assert stale.outcome == "unconfirmed"  # expired when the next tap was queued
+    assert tracker.confirm("lock_1", "UNLOCKED", at=now) is fresh
+    stats = tracker.stats()["lock_1"]
+    assert stats["unconfirmed"] == 1
+    assert stats["confirmed"] == 1
+
+
+def test_stats_report_rolling_latency_percentiles():
+    tracker = TapTracker(window=100)
+    now = time.monotonic()
+    for ms in range(1, 151):  # only the last 100 replies stay in the window
+        tap = tracker.begin("lock_1", "u1", received_at=now - 1.0)
+        tracker.decided(tap, False)
+        tracker.sent(tap, at=now - 1.0 + ms / 1000)
+    reply = tracker.stats()["lock_1"]["reply_ms"]
+    assert reply["n"] == 100
+    assert round(reply["p50"]) == 100
+    assert round(reply["p99"]) == 149
+    assert round(reply["max"]) == 150
+    assert tracker.stats()["lock_1"]["taps"] == 150
+
+
+def test_recent_and_summary_lines():
+    tracker = TapTracker()
+    now = time.monotonic()
+    granted_tap(tracker, "lock_1", now - 0.2, uid="abc")
+    tracker.confirm("lock_1", "UNLOCKED", at=now)
+    recent = tracker.recent()
+    assert len(recent) == 1
+    assert recent[0]["uid"] == "abc"
+    assert recent[0]["outcome"] == "confirmed"
+    assert round(recent[0]["sent_ms"]) == 10
+    assert tracker.summary_lines()[0].startswith("lock_1: 1 taps, 1 confirmed")
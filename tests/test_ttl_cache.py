@@ -0,0 +1,80 @@
+from utils import ttl_cache
+from utils.ttl_cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_cache(monkeypatch, **kwargs):
+    clock = FakeClock()
+    monkeypatch.setattr(ttl_cache.time, "monotonic", clock)
+    return TTLCache(**kwargs), clock
+
+
+def test_get_returns_stored_value_and_counts_hits(monkeypatch):
+    cache, _ = make_cache(monkeypatch)
+    cache.put("uid", True)
+    assert cache.get("uid") is True
+    assert cache.get("other", "default") == "default"
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1, "evictions": 0}
+
+
+def test_falsy_values_are_cached(monkeypatch):
+    cache, _ = make_cache(monkeypatch)
+    cache.put("denied", False)
+    assert cache.get("denied") is False
+    assert cache.hits == 1
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    cache, clock = make_cache(monkeypatch, ttl=5.0)
+    cache.put("a", 1)
+    clock.now += 4.9
+    assert cache.get("a") == 1
+    clock.now += 0.1
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0  # the expired entry is dropped on lookup
+
+
+def test_per_entry_ttl_overrides_default(monkeypatch):
+    cache, clock = make_cache(monkeypatch, ttl=60.0)
+    cache.put("short", 1, ttl=1.0)
+    cache.put("long", 2)
+    clock.now += 2.0
+    assert cache.get("short") is None
+    assert cache.get("long") == 2
+
+
+def test_put_refreshes_expiry(monkeypatch):
+    cache, clock = make_cache(monkeypatch, ttl=5.0)
+    cache.put("a", 1)
+    clock.now += 4.0
+    cache.put("a", 2)
+    clock.now += 4.0
+    assert cache.get("a") == 2
+
+
+def test_least_recently_used_entry_is_evicted(monkeypatch):
+    cache, _ = make_cache(monkeypatch, maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")  # b is now the least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_clear_drops_everything(monkeypatch):
+    cache, _ = make_cache(monkeypatch)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.clear()
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0